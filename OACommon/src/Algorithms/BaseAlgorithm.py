@@ -23,6 +23,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from ..BaseObject import BaseObject
+from ..Expression import evaluate
 
 
 class BaseAlgorithm(BaseObject):
@@ -65,7 +66,7 @@ class BaseAlgorithm(BaseObject):
             if params[p]['type'] == 'var':
                 # Store input variables
                 try:
-                    t = eval(params[p]['value'], {"__builtins__": None}, {})
+                    t = evaluate(params[p]['value'])
                     if type(t) in (str, unicode):
                         # Single string
                         self.invars[p] = t
@@ -94,7 +95,7 @@ class BaseAlgorithm(BaseObject):
             elif params[p]['type'] == 'outvar':
                 # Store output variables
                 try:
-                    t = eval(params[p]['value'], {"__builtins__": None}, {})
+                    t = evaluate(params[p]['value'])
                     if type(t) in (str, unicode):
                         # Single string
                         self.outvars[p] = t
@@ -123,7 +124,7 @@ class BaseAlgorithm(BaseObject):
             elif params[p]['type'] == 'restype':
                 # Manage result type
                 try:
-                    val = eval(params[p]['value'], {"__builtins__": None}, {})
+                    val = evaluate(params[p]['value'])
                     if val == 0:
                         self.resclass = "Raw"
                     elif val == 1:
@@ -188,6 +189,34 @@ class BaseAlgorithm(BaseObject):
         except Exception, e:
             self.logger.error("[%s]: Exception (%s)", self.name(), e, exc_info=True)
 
+    def input_names(self):
+        """ Return the list of the names of all the input variables. """
+        names = []
+        for v in self.invars:
+            if type(self.invars[v]) is list:
+                names += self.invars[v]
+            else:
+                names.append(self.invars[v])
+        return names
+
+    def output_names(self):
+        """ Return the list of the names of all the variables written by the
+        algorithm. An algorithm without output variables is assumed to modify
+        in place its target variable.
+        """
+        names = []
+        for v in self.outvars:
+            if type(self.outvars[v]) is list:
+                names += self.outvars[v]
+            else:
+                names.append(self.outvars[v])
+        if len(names) == 0 and 'target' in self.invars:
+            if type(self.invars['target']) is list:
+                names += self.invars['target']
+            else:
+                names.append(self.invars['target'])
+        return names
+
     def process(self):
         """ Processing function
 
@@ -197,6 +226,12 @@ class BaseAlgorithm(BaseObject):
         """
         pass
 
+    def close(self):
+        """ Release the resources kept between calls, like buffers. In the
+        base implementation it does nothing.
+        """
+        pass
+
     @staticmethod
     def default_configure():
         """ Base configuration function.
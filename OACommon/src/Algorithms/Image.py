@@ -23,6 +23,9 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from BaseAlgorithm import BaseAlgorithm
+from ..Expression import evaluate
+from ..Buffers import BufferPool
+from ..DataObj import Scalar
 from ..DataObj import Image
 from ..DataObj import Array
 import numpy as np
@@ -52,7 +55,7 @@ class ImageFilter(BaseAlgorithm):
         # Check parameters
         if 'baseline' in self.params:
             try:
-                self.params['baseline'] = eval(self.params['baseline'], {"__builtins__": None}, {})
+                self.params['baseline'] = evaluate(self.params['baseline'])
                 if not isinstance(self.params['baseline'], (int, long, float)):
                     raise Exception("wrong type [%s]" % type(self.params['baseline']))
 
@@ -62,7 +65,7 @@ class ImageFilter(BaseAlgorithm):
 
         if 'threshold' in self.params:
             try:
-                self.params['threshold'] = eval(self.params['threshold'], {"__builtins__": None}, {})
+                self.params['threshold'] = evaluate(self.params['threshold'])
                 if not isinstance(self.params['threshold'], (int, long, float)):
                     raise Exception("wrong type [%s]" % type(self.params['threshold']))
 
@@ -70,28 +73,63 @@ class ImageFilter(BaseAlgorithm):
                 self.logger.error("[%s] threshold parameter cannot be evaluated (Error: %s)", self.name(), e)
                 del self.params['threshold']
 
+        # Pool of output buffers
+        self._pool = BufferPool()
+
+        # Size in bytes of the blocks of shots processed at once
+        self._block_size = 4 * 1024 * 1024
+
+    def close(self):
+        """ Release the pooled buffers. """
+        self._pool.clear()
+
     def process(self, target, **kwargs):
         """ Filter the image.
 
-        First the image is copied (with copy.deepcopy), then the baseline is
-        subtracted (maintaining the numeric type of the image). All pixels
-        with a value below the threshold are set to zero.
+        The baseline is subtracted (maintaining the numeric type of the
+        image) clipping negative values to zero, and all pixels with a value
+        below the threshold are set to zero. As a pixel is kept only if it's
+        above baseline + threshold, the mask is computed once on the input.
+        The stack is processed in blocks of shots small enough to stay in
+        cache, writing into a buffer taken from a pool owned by the
+        algorithm, so that no memory is allocated in steady state.
 
         """
         out = Image()
-        out.value = np.copy(target.value)
-
-        # Subtract baseline
-        if 'baseline' in self.params:
-            # Assure that we do not get negative numbers
-            out.value[out.value < self.params['baseline']] = self.params['baseline']
-            # Actually subtract baseline
-            out.value[:] = out.value[:] - self.params['baseline']
-
-        # Apply threshold
-        if 'threshold' in self.params:
-            out.value[out.value < self.params['threshold']] = 0
+        v = target.value
+        b = self.params.get('baseline', None)
+        t = self.params.get('threshold', None)
+
+        # Output buffer
+        buf = self._pool.get(v.shape, v.dtype)
+
+        if b is None and t is None:
+            buf[:] = v
+            out.value = buf
+            return {'output': out}
+
+        # Pixels below the cutoff are set to zero
+        if b is None:
+            cutoff = t
+        elif t is None or t < 0:
+            cutoff = b
+        else:
+            cutoff = b + t
+
+        # Process by blocks of shots
+        step = max(1, self._block_size / max(1, v[0].nbytes))
+        mask = self._pool.get((min(step, v.shape[0]), ) + v.shape[1:], np.bool)
+        for i in range(0, v.shape[0], step):
+            j = min(i + step, v.shape[0])
+            m = mask[0:j - i]
+            np.less(v[i:j], cutoff, out=m)
+            if b is not None:
+                np.subtract(v[i:j], b, out=buf[i:j], casting='unsafe')
+            else:
+                buf[i:j] = v[i:j]
+            buf[i:j][m] = 0
 
+        out.value = buf
         return {'output': out}
 
     @staticmethod
@@ -124,25 +162,154 @@ class ImageFilter(BaseAlgorithm):
 
 class ImageBin(BaseAlgorithm):
 
-    """ A 2x2 binning algorithm. Does not accept any parameter. """
+    """ Image binning.
+
+    Bin the target image summing or averaging blocks of pixels.
+
+    Parameters:
+    - bin: size of the bins as a list [horizontal, vertical] or a single
+      number for square bins. Default is [2, 2].
+    - mode: 'sum' or 'mean'. Default is 'sum'.
+    - roi: optional region [x0, x1, y0, y1] to crop before binning.
+
+    Pixels that do not fill a whole bin are discarded. Sums use an integer
+    type large enough to avoid overflows, while averages are float32 (or
+    float64 for float64 images).
+
+    """
 
     def __init__(self, params):
-        """ Constructor. """
+        """ Constructor. Evaluate the bin size and the ROI. """
         super(ImageBin, self).__init__(params)
         self.name("ImageBin")
         self.version("1.0")
 
+        # Bin size
+        self._bin = [2, 2]
+        if 'bin' in self.params:
+            try:
+                b = evaluate(self.params['bin'])
+                if type(b) in (int, long):
+                    b = [b, b]
+                assert(type(b) is list)
+                assert(len(b) == 2)
+                assert(type(b[0]) in (int, long) and b[0] > 0)
+                assert(type(b[1]) in (int, long) and b[1] > 0)
+                self._bin = b
+            except Exception, e:
+                self.logger.error("[%s] Cannot evaluate 'bin' definition. Using 2x2 binning (Error: %s)", self.name(), e)
+
+        # Mode
+        self._mode = self.params.get('mode', 'sum')
+        if self._mode not in ('sum', 'mean'):
+            self.logger.error("[%s] Unknown mode '%s'. Using 'sum'.", self.name(), self._mode)
+            self._mode = 'sum'
+
+        # ROI
+        self._roi = None
+        if 'roi' in self.params:
+            try:
+                self._roi = evaluate(self.params['roi'])
+                assert(type(self._roi) is list)
+                assert(len(self._roi) == 4)
+            except Exception, e:
+                self.logger.error("[%s] Cannot evaluate 'roi' definition. Ignoring (Error: %s)", self.name(), e)
+                self._roi = None
+
+    @staticmethod
+    def _accumulator(dtype, count):
+        """ Return a type that can hold the sum of count values of type
+        dtype without overflowing.
+        """
+        dtype = np.dtype(dtype)
+        if dtype.kind == 'b':
+            dtype = np.dtype(np.uint8)
+        if dtype.kind not in ('u', 'i'):
+            return dtype
+        bits = dtype.itemsize * 8 + int(np.ceil(np.log2(count)))
+        for t in ((np.uint32, np.uint64) if dtype.kind == 'u' else (np.int32, np.int64)):
+            if np.dtype(t).itemsize * 8 >= bits:
+                return np.dtype(t)
+        return np.dtype(np.float64)
+
     def process(self, target, **kwargs):
-        """ Bin the target image 2x2. """
+        """ Bin the target image. """
         # Check that target is an image
         if target.name() != 'Image':
             self.logger.error("[%s] Input variable is not an image. Skipping.", self.name())
             return {'output': None}
 
+        v = target.value
+        if self._roi is not None:
+            v = v[:, self._roi[2]:self._roi[3], self._roi[0]:self._roi[1]]
+
+        # Crop to a whole number of bins
+        (bx, by) = self._bin
+        (n, h, w) = v.shape
+        h = (h / by) * by
+        w = (w / bx) * bx
+        if h == 0 or w == 0:
+            self.logger.error("[%s] Image of shape %s is smaller than a bin. Skipping.", self.name(), v.shape)
+            return {'output': None}
+
+        # Sum blocks through a reshape
+        acc = self._accumulator(v.dtype, bx * by)
+        v = v[:, 0:h, 0:w].reshape(n, h / by, by, w / bx, bx)
+        val = v.sum(axis=4, dtype=acc).sum(axis=2, dtype=acc)
+
+        if self._mode == 'mean':
+            val = np.divide(val, bx * by, dtype=np.float64 if v.dtype == np.float64 else np.float32)
+
         out = Image()
-        out.value = target.value[:, 0::2, 0::2] + target.value[:, 1::2, 0::2] + target.value[:, 1::2, 0::2] + target.value[:, 1::2, 0::2]
+        out.value = val
         return {'output': out}
 
+    @staticmethod
+    def configure():
+        """ Return parameters configuration. """
+        delegates = {}
+
+        # Bin size
+        delegates['bin'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'list>int',
+            'default': [2, 2],
+            'label': 'Bin size',
+            'delegate': {
+                'type': 'RangeInputDelegate',
+                'm': 1,
+                'class': 'point'
+            }
+        }
+
+        # Output mode
+        delegates['mode'] = {
+            'mandatory': False,
+            'type': 'list',
+            'dtype': 'str',
+            'default': 'sum',
+            'label': 'Mode',
+            'delegate': {
+                'type': 'ComboboxDelegate',
+                'values': ['sum', 'mean'],
+                'labels': ['Sum', 'Mean']
+            }
+        }
+
+        # Region to crop
+        delegates['roi'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'list>int',
+            'label': 'Region of Interest',
+            'delegate': {
+                'type': 'AOIDelegate',
+            }
+        }
+
+        return delegates
+
 
 class ImageProfile(BaseAlgorithm):
 
@@ -151,6 +318,14 @@ class ImageProfile(BaseAlgorithm):
     Compute a vertical and horizontal profile of the target image. An
     optional Area-Of-Interest (AOI) may be defined by the 'aoi' parameter.
 
+    Several AOIs can be processed at once with the 'aois' parameter, a list
+    of [x0, x1, y0, y1] regions. In this case the outputs 'out_hor',
+    'out_vert' and 'out_total' must be lists of variable names, one for each
+    AOI. The image stack is reduced in blocks of rows small enough to stay
+    in cache, and all the profiles of the AOIs crossing a block are computed
+    before moving to the next one, so that each pixel is read from memory
+    only once even when the AOIs overlap.
+
     """
 
     def __init__(self, params):
@@ -163,28 +338,109 @@ class ImageProfile(BaseAlgorithm):
         self.aoi = None
         if 'aoi' in self.params:
             try:
-                self.aoi = eval(self.params['aoi'], {"__builtins__": None}, {})
+                self.aoi = evaluate(self.params['aoi'])
                 assert(type(self.aoi) is list)
                 assert(len(self.aoi) == 4)
             except Exception, e:
                 self.logger.error("[%s] Cannot evaluate 'aoi' definition. Ignoring (Error: %s)", self.name(), e)
                 self.aoi = None
 
+        # Get AOI list
+        self.aois = None
+        if 'aois' in self.params:
+            try:
+                self.aois = evaluate(self.params['aois'])
+                assert(type(self.aois) is list)
+                assert(len(self.aois) > 0)
+                for a in self.aois:
+                    assert(type(a) is list)
+                    assert(len(a) == 4)
+                    assert(a[0] < a[1] and a[2] < a[3])
+            except Exception, e:
+                self.logger.error("[%s] Cannot evaluate 'aois' definition. Ignoring (Error: %s)", self.name(), e)
+                self.aois = None
+
+        # Check that the outputs match the AOIs
+        if self.aois is not None:
+            for o in self.outvars:
+                if type(self.outvars[o]) is not list or len(self.outvars[o]) != len(self.aois):
+                    self.logger.error("[%s] Output '%s' should be a list of %d variables.", self.name(), o, len(self.aois))
+
+        # Size in bytes of the blocks of the image stack reduced at once
+        self._block_size = 256 * 1024
+
+    def _profiles(self, v):
+        """ Compute the horizontal and vertical profiles of all the AOIs.
+        Return a list of (horizontal, vertical) tuples. Profiles are of
+        type float64 (complex128) for floating point (complex) images and
+        int64 otherwise.
+        """
+        (n, h, w) = v.shape
+        aois = [[max(0, min(a[0], w)), max(0, min(a[1], w)), max(0, min(a[2], h)), max(0, min(a[3], h))] for a in self.aois]
+        acc = {'f': np.float64, 'c': np.complex128}.get(v.dtype.kind, np.int64)
+        out = [(np.zeros((n, a[1] - a[0]), acc), np.zeros((n, a[3] - a[2]), acc)) for a in aois]
+
+        # Region covering all the AOIs
+        x0 = min([a[0] for a in aois])
+        x1 = max([a[1] for a in aois])
+        y0 = min([a[2] for a in aois])
+        y1 = max([a[3] for a in aois])
+
+        # Blocks of rows and shots
+        row = max(1, (x1 - x0) * v.itemsize)
+        rows = max(1, min(y1 - y0, self._block_size / row))
+        shots = max(1, min(n, self._block_size / (rows * row)))
+
+        for s0 in range(0, n, shots):
+            s1 = min(n, s0 + shots)
+            for r0 in range(y0, y1, rows):
+                r1 = min(y1, r0 + rows)
+                for (a, (outh, outv)) in zip(aois, out):
+                    (b0, b1) = (max(r0, a[2]), min(r1, a[3]))
+                    if b0 >= b1:
+                        continue
+                    blk = v[s0:s1, b0:b1, a[0]:a[1]]
+                    np.sum(blk, 2, dtype=acc, out=outv[s0:s1, b0 - a[2]:b1 - a[2]])
+                    outh[s0:s1] += np.sum(blk, 1, dtype=acc)
+        return out
+
     def process(self, target, **kwargs):
         """ Compute the vertical and horizonal profiles. """
-        # Get view
-        if self.aoi:
-            view = target.value[:, self.aoi[2]:self.aoi[3], self.aoi[0]:self.aoi[1]]
-        else:
-            view = target.value
-
-        # Integrate output
-        outh = Array()
-        outh.value = np.sum(view, 1)
-        outv = Array()
-        outv.value = np.sum(view, 2)
-
-        return {'out_hor': outh, 'out_vert': outv}
+        if self.aois is None:
+            # Get view
+            if self.aoi:
+                view = target.value[:, self.aoi[2]:self.aoi[3], self.aoi[0]:self.aoi[1]]
+            else:
+                view = target.value
+
+            # Integrate output
+            outh = Array()
+            outh.value = np.sum(view, 1)
+            outv = Array()
+            outv.value = np.sum(view, 2)
+            out = {'out_hor': outh, 'out_vert': outv}
+            if 'out_total' in self.outvars:
+                out['out_total'] = Scalar()
+                out['out_total'].value = np.sum(outh.value, 1)
+
+            return out
+
+        # Multiple AOIs
+        out = {}
+        prof = self._profiles(target.value)
+        for i in range(len(prof)):
+            for (o, val) in (('out_hor', prof[i][0]), ('out_vert', prof[i][1]), ('out_total', None)):
+                if o not in self.outvars or type(self.outvars[o]) is not list or i >= len(self.outvars[o]):
+                    continue
+                if o == 'out_total':
+                    d = Scalar()
+                    d.value = np.sum(prof[i][0], 1)
+                else:
+                    d = Array()
+                    d.value = val
+                out[self.outvars[o][i]] = d
+
+        return out
 
     @staticmethod
     def configure():
@@ -202,6 +458,15 @@ class ImageProfile(BaseAlgorithm):
             }
         }
 
+        # Optional list of areas of interest
+        delegates['aois'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'list>list>int',
+            'label': 'Areas of Interest',
+            'delegate': None
+        }
+
         # Remove output delegate
         delegates['output'] = None
 
@@ -223,6 +488,15 @@ class ImageProfile(BaseAlgorithm):
             'delegate': None
         }
 
+        # Total output
+        delegates['out_total'] = {
+            'mandatory': False,
+            'type': 'outvar',
+            'dtype': 'str',
+            'label': 'Total',
+            'delegate': None
+        }
+
         return delegates
 
 
@@ -233,6 +507,16 @@ class ImageAnnularFilter(BaseAlgorithm):
     Select an annulus of a VMI image, setting at zero all the pixel outside
     the defined region
 
+    Parameters:
+    - center: center of the annulus. Default is the center of the image.
+    - inner, outer: inner and outer diameters. A single value defines a
+      circle, two values an ellipse.
+    - mode: 'mask' (default) returns a new image with the pixels outside the
+      annulus set to zero. 'inplace' does the same modifying the target
+      image. 'sparse' returns an Array with only the values of the pixels
+      inside the annulus for each shot; their flat indexes and the image
+      shape are stored in the 'indexes' and 'shape' attributes.
+
     """
 
     def __init__(self, params):
@@ -244,7 +528,7 @@ class ImageAnnularFilter(BaseAlgorithm):
         # Parse image center parameter
         try:
             assert('center' in self.params)
-            c = eval(self.params['center'], {"__builtins__": None}, {})
+            c = evaluate(self.params['center'])
             assert(type(c) is list)
             assert(len(c) == 2)
             assert(type(c[0]) is int)
@@ -256,7 +540,7 @@ class ImageAnnularFilter(BaseAlgorithm):
         # Parse inner diameter
         try:
             assert('inner' in self.params)
-            c = eval(self.params['inner'], {"__builtins__": None}, {})
+            c = evaluate(self.params['inner'])
             assert(type(c) is list)
             assert(len(c) > 0)
             assert(type(c[0]) in (int, float))
@@ -272,7 +556,7 @@ class ImageAnnularFilter(BaseAlgorithm):
         # Parse inner diameter
         try:
             assert('outer' in self.params)
-            c = eval(self.params['outer'], {"__builtins__": None}, {})
+            c = evaluate(self.params['outer'])
             assert(type(c) is list)
             assert(len(c) > 0)
             assert(type(c[0]) in (int, float))
@@ -285,12 +569,26 @@ class ImageAnnularFilter(BaseAlgorithm):
             self.logger.error("[%s] Missing outer diameter parameter (Error: %s)", self.name(), e)
             self._outer = None
 
-        # Mask
+        # Output mode
+        self._mode = self.params.get('mode', 'mask')
+        if self._mode not in ('mask', 'inplace', 'sparse'):
+            self.logger.error("[%s] Unknown mode '%s'. Using 'mask'.", self.name(), self._mode)
+            self._mode = 'mask'
+
+        # Mask and flat indexes of the pixels inside the annulus
         self._mask = None
+        self._index = None
 
         # Detected image size
         self._size = None
 
+    def output_names(self):
+        """ In 'inplace' mode the target is modified too. """
+        names = super(ImageAnnularFilter, self).output_names()
+        if self._mode == 'inplace' and 'target' in self.invars and self.invars['target'] not in names:
+            names.append(self.invars['target'])
+        return names
+
     def process(self, target, **kwargs):
         """ Filter the image leaving only the required annulus. """
         # Check target type
@@ -305,21 +603,38 @@ class ImageAnnularFilter(BaseAlgorithm):
         # If size has changed or mask is not defined, we prepare it
         if self._mask is None or target.value.shape[1:] != self._size:
             self._size = target.value.shape[1:]
-            if self._center is None:
-                self._center = [int(target.value.shape[2] / 2), int(target.value.shape[1] / 2)]
+            center = self._center
+            if center is None:
+                center = [int(target.value.shape[2] / 2), int(target.value.shape[1] / 2)]
 
             # Build the mask
             y, x = np.ogrid[0:self._size[0], 0:self._size[1]]
-            x -= self._center[0]
-            y -= self._center[1]
-            r_in = x ** 2 / self._inner[0] + y ** 2 / self._inner[1]
-            r_out = x ** 2 / self._outer[0] + y ** 2 / self._outer[1]
-            self._mask = np.int8(r_in > 1) * np.int8(r_out < 1)
+            x = np.float64(x - center[0]) ** 2
+            y = np.float64(y - center[1]) ** 2
+            r_in = x / self._inner[0] + y / self._inner[1]
+            r_out = x / self._outer[0] + y / self._outer[1]
+            self._mask = np.logical_and(r_in > 1, r_out < 1)
+            self._index = np.flatnonzero(self._mask)
 
         # Filter the image using the defined mask
         self.logger.debug("[%s] Image shape %s, Mask shape %s.", self.name(), target.value.shape, self._mask.shape)
-        out = Image()
-        out.value = np.copy(target.value) * np.tile(self._mask, (target.value.shape[0], 1, 1))
+        v = target.value
+        if self._mode == 'sparse':
+            # Gather the pixels of the annulus
+            out = Array()
+            out.value = v.reshape(v.shape[0], -1)[:, self._index]
+            out.attrs = {'indexes': self._index, 'shape': self._size}
+
+        elif self._mode == 'inplace':
+            np.multiply(v, self._mask, out=v)
+            target.invalidate()
+            out = Image()
+            out.value = v
+
+        else:
+            out = Image()
+            out.value = v * self._mask
+
         return {'output': out}
 
     @staticmethod
@@ -353,7 +668,7 @@ class ImageAnnularFilter(BaseAlgorithm):
             }
         }
 
-        # Annulus inner diameter
+        # Annulus outer diameter
         delegates['outer'] = {
             'mandatory': True,
             'type': 'expr',
@@ -366,4 +681,290 @@ class ImageAnnularFilter(BaseAlgorithm):
             }
         }
 
-        return delegates
\ No newline at end of file
+        # Output mode
+        delegates['mode'] = {
+            'mandatory': False,
+            'type': 'list',
+            'dtype': 'str',
+            'default': 'mask',
+            'label': 'Mode',
+            'delegate': {
+                'type': 'ComboboxDelegate',
+                'values': ['mask', 'inplace', 'sparse'],
+                'labels': ['Mask', 'In place', 'Sparse']
+            }
+        }
+
+        return delegates
+
+
+class ImageRadialProfile(BaseAlgorithm):
+
+    """ Radial and angular distributions of a VMI image
+
+    Reproject each image in polar coordinates around a center and compute
+    the radial distribution and/or the angular distribution of the signal.
+    Each pixel is assigned to the bin of its center. The bin of every pixel
+    is stored in a lookup table, that is computed again only when the image
+    shape changes. The distributions are accumulated with np.bincount on
+    blocks of shots, so that the temporary arrays stay small.
+
+    Parameters:
+    - center: center of the image [x, y]. Default is the center of the image.
+    - rbins: number of radial bins. Default is 100.
+    - rmax: maximum radius. Default is the distance from the center to the
+      farthest corner of the image.
+    - abins: number of angular bins between -pi and pi. Default is 90.
+    - arange: radial range [rmin, rmax] of the pixels used for the angular
+      distribution. Default is the whole radial range.
+    - mode: 'sum' (default) or 'mean'. In 'mean' mode each bin is divided by
+      the number of pixels it contains.
+
+    Only the configured outputs ('out_rad' and 'out_ang') are computed.
+
+    """
+
+    def __init__(self, params):
+        """ Constructor. Evaluate the geometry parameters. """
+        super(ImageRadialProfile, self).__init__(params)
+        self.name("ImageRadialProfile")
+        self.version("1.0")
+
+        # Image center
+        self._center = None
+        if 'center' in self.params:
+            try:
+                c = evaluate(self.params['center'])
+                assert(type(c) is list)
+                assert(len(c) == 2)
+                assert(type(c[0]) in (int, long, float))
+                assert(type(c[1]) in (int, long, float))
+                self._center = c
+            except Exception, e:
+                self.logger.error("[%s] Cannot evaluate 'center' definition. Using the center of the image (Error: %s)", self.name(), e)
+
+        # Number of bins
+        self._rbins = self._int_param('rbins', 100)
+        self._abins = self._int_param('abins', 90)
+
+        # Maximum radius
+        self._rmax = None
+        if 'rmax' in self.params:
+            try:
+                self._rmax = evaluate(self.params['rmax'])
+                assert(type(self._rmax) in (int, long, float) and self._rmax > 0)
+            except Exception, e:
+                self.logger.error("[%s] Cannot evaluate 'rmax' definition. Ignoring (Error: %s)", self.name(), e)
+                self._rmax = None
+
+        # Radial range of the angular distribution
+        self._arange = None
+        if 'arange' in self.params:
+            try:
+                self._arange = evaluate(self.params['arange'])
+                assert(type(self._arange) is list)
+                assert(len(self._arange) == 2)
+                assert(self._arange[0] < self._arange[1])
+            except Exception, e:
+                self.logger.error("[%s] Cannot evaluate 'arange' definition. Ignoring (Error: %s)", self.name(), e)
+                self._arange = None
+
+        # Mode
+        self._mode = self.params.get('mode', 'sum')
+        if self._mode not in ('sum', 'mean'):
+            self.logger.error("[%s] Unknown mode '%s'. Using 'sum'.", self.name(), self._mode)
+            self._mode = 'sum'
+
+        # Lookup tables and detected image size
+        self._lut = {}
+        self._size = None
+
+        # Size in bytes of the pixels of the blocks of shots binned at once
+        self._block_size = 4 * 1024 * 1024
+
+    def _int_param(self, name, default):
+        """ Evaluate a positive integer parameter. """
+        if name not in self.params:
+            return default
+        try:
+            val = evaluate(self.params[name])
+            assert(type(val) in (int, long) and val > 0)
+            return val
+        except Exception, e:
+            self.logger.error("[%s] Cannot evaluate '%s' definition. Using %d (Error: %s)", self.name(), name, default, e)
+            return default
+
+    def _build_lut(self, shape):
+        """ Build the lookup tables for the given image shape. For each
+        output store the flat indexes of the pixels used, their bin and the
+        number of pixels in each bin.
+        """
+        (h, w) = shape
+        if self._center is not None:
+            (cx, cy) = self._center
+        else:
+            (cx, cy) = (w / 2, h / 2)
+
+        y, x = np.ogrid[0:h, 0:w]
+        x = np.float64(x - cx)
+        y = np.float64(y - cy)
+        r = np.sqrt(x ** 2 + y ** 2).ravel()
+
+        rmax = self._rmax
+        if rmax is None:
+            rmax = np.sqrt(max(cx, w - cx) ** 2 + max(cy, h - cy) ** 2)
+
+        self._lut = {}
+
+        # Radial distribution
+        idx = np.flatnonzero(r <= rmax)
+        rbin = np.intp(r[idx] * (self._rbins / float(rmax)))
+        np.minimum(rbin, self._rbins - 1, out=rbin)
+        self._lut['out_rad'] = (idx, rbin, self._rbins, np.bincount(rbin, minlength=self._rbins))
+
+        # Angular distribution
+        (r0, r1) = self._arange if self._arange is not None else (0, rmax)
+        idx = np.flatnonzero(np.logical_and(r >= r0, r <= r1))
+        a = np.arctan2(y, x).ravel()[idx]
+        abin = np.intp((a + np.pi) * (self._abins / (2 * np.pi)))
+        np.minimum(abin, self._abins - 1, out=abin)
+        self._lut['out_ang'] = (idx, abin, self._abins, np.bincount(abin, minlength=self._abins))
+
+        self._size = shape
+
+    def process(self, target, **kwargs):
+        """ Compute the configured distributions. """
+        # Check that target is an image
+        if target.name() != 'Image':
+            self.logger.error("[%s] Input variable is not an image. Skipping.", self.name())
+            return {}
+
+        v = target.value
+        if self._size != v.shape[1:]:
+            self._build_lut(v.shape[1:])
+
+        n = v.shape[0]
+        flat = v.reshape(n, -1)
+
+        out = {}
+        for name in ('out_rad', 'out_ang'):
+            if name not in self.outvars:
+                continue
+            (idx, bins, nb, count) = self._lut[name]
+
+            # Offset the bins of each shot so that a single bincount
+            # accumulates a whole block of shots
+            step = max(1, self._block_size / max(1, idx.shape[0] * 8))
+            index = (bins + (np.arange(min(step, n)) * nb)[:, np.newaxis]).ravel()
+            val = np.empty((n, nb), dtype=np.float64)
+            for i in range(0, n, step):
+                j = min(i + step, n)
+                k = (j - i) * idx.shape[0]
+                val[i:j] = np.bincount(index[0:k], weights=flat[i:j, idx].ravel(), minlength=(j - i) * nb).reshape(j - i, nb)
+
+            if self._mode == 'mean':
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    val /= count
+                val[:, count == 0] = 0
+
+            out[name] = Array()
+            out[name].value = val
+
+        return out
+
+    @staticmethod
+    def configure():
+        """ Return parameters configuration. """
+        delegates = {}
+
+        # Center of the image
+        delegates['center'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'list>num',
+            'label': 'Center',
+            'delegate': {
+                'type': 'RangeInputDelegate',
+                'm': 1,
+                'class': 'point'
+            }
+        }
+
+        # Number of radial bins
+        delegates['rbins'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'int',
+            'default': 100,
+            'label': 'Radial bins',
+            'delegate': None
+        }
+
+        # Maximum radius
+        delegates['rmax'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'num',
+            'label': 'Maximum radius',
+            'delegate': None
+        }
+
+        # Number of angular bins
+        delegates['abins'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'int',
+            'default': 90,
+            'label': 'Angular bins',
+            'delegate': None
+        }
+
+        # Radial range of the angular distribution
+        delegates['arange'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'list>num',
+            'label': 'Angular dist. radial range',
+            'delegate': {
+                'type': 'RangeInputDelegate',
+                'm': 1,
+                'class': 'incomplete'
+            }
+        }
+
+        # Mode
+        delegates['mode'] = {
+            'mandatory': False,
+            'type': 'list',
+            'dtype': 'str',
+            'default': 'sum',
+            'label': 'Mode',
+            'delegate': {
+                'type': 'ComboboxDelegate',
+                'values': ['sum', 'mean'],
+                'labels': ['Sum', 'Mean']
+            }
+        }
+
+        # Remove output delegate
+        delegates['output'] = None
+
+        # Radial distribution output
+        delegates['out_rad'] = {
+            'mandatory': False,
+            'type': 'outvar',
+            'dtype': 'str',
+            'label': 'Radial distribution',
+            'delegate': None
+        }
+
+        # Angular distribution output
+        delegates['out_ang'] = {
+            'mandatory': False,
+            'type': 'outvar',
+            'dtype': 'str',
+            'label': 'Angular distribution',
+            'delegate': None
+        }
+
+        return delegates
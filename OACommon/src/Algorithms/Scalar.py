@@ -23,6 +23,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from BaseAlgorithm import BaseAlgorithm
+from ..Expression import compile_expr
 from ..DataObj import Scalar
 from ..DataObj import Metadata
 import numpy as np
@@ -45,6 +46,12 @@ class ComputeScalarExpr(BaseAlgorithm):
         self.name("ComputeScalarExpr")
         self.version("1.0")
 
+        # Names of the target variables, in the order of the lambda arguments
+        self._targets = []
+
+        # Set to False when the expression cannot be evaluated on whole arrays
+        self._vectorize = False
+
         try:
             # Get target variables
             if 'target' in self.invars:
@@ -52,12 +59,17 @@ class ComputeScalarExpr(BaseAlgorithm):
                     t = [self.invars['target']]
                 else:
                     t = self.invars['target']
+                self._targets = t
+
+                # Compile 'expression' as a function of the 'target' variables
+                self.function = compile_expr(self.params['expression'], t)
 
-                # Build a lambda function from 'target' variables and 'expression'
-                self.function = eval("lambda %s: %s" % (', '.join(t), self.params['expression']), {"__builtins__": None, "np": np}, {})
+                # Build wrapper function
+                self.wrapper = lambda args: self.function(*args)
 
-                # Build wrapper lambda function
-                self.wrapper = eval("lambda args: function(%s)" % (', '.join(["args[%d]" % i for i in range(len(t))])), {"__builtins__": None, "function": self.function}, {})
+                # Expressions that are not element-wise (e.g. reductions
+                # like np.mean(x)) must be evaluated shot by shot
+                self._vectorize = self.function.elementwise
 
             else:
                 self.wrapper = lambda args: np.float64(0)
@@ -67,58 +79,61 @@ class ComputeScalarExpr(BaseAlgorithm):
             self.wrapper = lambda args: np.float64(0)
 
     def process(self, target, **kwargs):
-        """ Assemble parameters and evaluate the lambda function. """
-        # Find out output type
-        if type(target) is dict:
-            # Find output dimension
-            n = 0
-            for k in target:
-                if type(target[k]) is Metadata:
-                    continue
-                elif n == 0:
-                    n = target[k].value.shape[0]
-                elif target[k].value.shape[0] != n:
-                    self.logger.error("[%s] target variables have different dimension (%d != %d).", self.name(), target[k].value.shape[0], n)
-                    return
-
-            if n > 0:
-                # Standard expression
-                # Preallocation
-                out = Scalar()
-                out.value = np.zeros(shape=(n, ), dtype=np.float64)
-                # Cycle over shots
-                for i in range(n):
-                    args = []
-                    for k in target:
-                        if type(target) is not Metadata:
-                            args.append(np.float64(target[k].value[i]))
-                        else:
-                            args.append(np.float64(target[k].value))
-                    out.value[i] = self.wrapper(args)
+        """ Assemble parameters and evaluate the lambda function.
 
-            else:
-                # Metadata expression
-                args = []
-                for k in target:
-                    args.append(np.float64(target[k].value))
-                out = Metadata()
-                out.value = np.float64(self.warpper(args))
+        Element-wise expressions are evaluated once over the arrays of all
+        the shots, with metadata broadcasted as scalars. Other expressions,
+        or expressions that fail on arrays, are evaluated shot by shot.
 
+        """
+        # Order target variables as the lambda arguments
+        if type(target) is dict:
+            target = [target[k] for k in self._targets]
         else:
-            # Single target variable
-            if type(target) is not Metadata:
-                # Normal expression
-                n = target.value.shape[0]
-                out = Scalar()
-                out.value = np.zeros(shape=(n, ), dtype=np.float64)
-                # Cycle over all shots
-                for i in range(n):
-                    out.value[i] = self.wrapper([np.float64(target.value[i]), ])
+            target = [target, ]
+
+        # Find output dimension
+        n = 0
+        for t in target:
+            if type(t) is Metadata:
+                continue
+            elif n == 0:
+                n = t.value.shape[0]
+            elif t.value.shape[0] != n:
+                self.logger.error("[%s] target variables have different dimension (%d != %d).", self.name(), t.value.shape[0], n)
+                return
+
+        if n == 0:
+            # Metadata expression
+            out = Metadata()
+            out.value = np.float64(self.wrapper([np.float64(t.value) for t in target]))
+            return {'output': out}
+
+        # Standard expression
+        out = Scalar()
+        args = [np.float64(t.value) if type(t) is Metadata else np.asarray(t.value, dtype=np.float64) for t in target]
+
+        if self._vectorize:
+            try:
+                with np.errstate(all='ignore'):
+                    val = np.asarray(self.wrapper(args), dtype=np.float64)
+                if val.shape == (n, ):
+                    out.value = val
+                elif val.shape == () and not any([type(t) is not Metadata and k in self.function.used for (k, t) in zip(self._targets, target)]):
+                    # The expression does not depend on per-shot values
+                    out.value = np.repeat(val, n)
+                else:
+                    raise ValueError("expression returned shape %s instead of (%d, )" % (val.shape, n))
+                return {'output': out}
 
-            else:
-                # Metadata expression
-                out = Metadata()
-                out.value = self.wrapper([np.float64(target.value), ])
+            except Exception, e:
+                self.logger.warning("[%s] Expression cannot be evaluated on arrays. Switching to per-shot evaluation (Error: %s)", self.name(), e)
+                self._vectorize = False
+
+        # Cycle over shots
+        out.value = np.zeros(shape=(n, ), dtype=np.float64)
+        for i in range(n):
+            out.value[i] = self.wrapper([a if a.shape == () else a[i] for a in args])
 
         return {'output': out}
 
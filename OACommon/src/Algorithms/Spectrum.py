@@ -23,6 +23,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from BaseAlgorithm import BaseAlgorithm
+from ..Expression import evaluate
 from ..DataObj import Scalar
 from ..DataObj import Array
 import numpy as np
@@ -60,7 +61,7 @@ class IntegratePeaks(BaseAlgorithm):
 
         try:
             # Eval slices
-            slices = eval(self.params['ranges'], {"__builtins__": None}, {})
+            slices = evaluate(self.params['ranges'])
 
             if type(slices) is not list:
                 self.logger.error("[%s] Error while evaluating slice limits. (Error: var evaluated to wrong type '%s')", self.name(), type(slices))
@@ -94,7 +95,7 @@ class IntegratePeaks(BaseAlgorithm):
                         self.params['ranges'].pop()
 
             # Eval baseline flag
-            if 'baseline' in self.params and eval(self.params['baseline'], {"__builtins__": None}, {}) == 1:
+            if 'baseline' in self.params and evaluate(self.params['baseline']) == 1:
                 self.params['baseline'] = True
             else:
                 self.params['baseline'] = False
@@ -104,63 +105,75 @@ class IntegratePeaks(BaseAlgorithm):
             self.params['ranges'] = []
 
     def process(self, target, **kwargs):
-        """ Integrate slices. """
+        """ Integrate slices.
+
+        All the integrals are computed at once from the cumulative sum of
+        the target along the sample axis, that is cached by the target and
+        shared with other algorithms integrating the same array. With baseline subtraction, the
+        integral of the linear baseline is computed in closed form from the
+        mean values at the two ends of the slice.
+
+        """
         if type(target) is Array:
             # Output first dimension
             n = target.value.shape[0]
-
-            # Compute slices integrals
-            peaks = []
-            for s in self.params['ranges']:
+            w = target.value.shape[1]
+
+            # Collect valid slices. Indexes of the slices to compute are
+            # stored in idx, while the others are left to zero.
+            peaks = np.zeros((len(self.params['ranges']), n), dtype=np.float64)
+            idx = []
+            lim = []
+            blim = []
+            for i in range(len(self.params['ranges'])):
+                s = self.params['ranges'][i]
                 if len(s) == 0:
-                    peaks.append(np.zeros((n, )))
                     continue
 
                 # Extend end of slice by one as numpy indexing does not include
                 # the last element. [a:b] => [a, b)
-                s[1] += 1
+                s = [s[0], s[1] + 1]
 
-                if s[0] < 0 or s[0] >= target.value.shape[1]:
+                if s[0] < 0 or s[0] >= w:
                     self.logger.warning("[%s] Bad range lower limit '%d'. Target shape was: %s.", self.name(), s[0], target.value.shape)
                     continue
 
-                if s[1] < 0 or s[1] >= target.value.shape[1]:
+                if s[1] < 0 or s[1] >= w:
                     self.logger.warning("[%s] Bad range upper limit '%d'. Target shape was: %s.", self.name(), s[1], target.value.shape)
                     continue
 
-                # Compute baseline
+                # Compute baseline limits
                 if self.params['baseline']:
                     # Base endpoints calculation
                     # Limits
                     delta = 10
-                    br = [s[0] - delta / 2, s[0] + delta / 2]
-                    er = [s[1] - delta / 2, s[1] + delta / 2]
-                    # Check limits
-                    if br[0] < 0:
-                        br[0] = 0
-                    if br[1] >= target.value.shape[1]:
-                        br[1] = target.value.shape[0] - 1
-                    if er[0] < 0:
-                        er[0] = 0
-                    if er[1] >= target.value.shape[1]:
-                        er[1] = target.value.shape[1] - 1
+                    br = [max(s[0] - delta / 2, 0), min(s[0] + delta / 2, w - 1)]
+                    er = [max(s[1] - delta / 2, 0), min(s[1] + delta / 2, w - 1)]
                     if er[0] < br[1]:
                         # Skip
                         self.logger.warning("[%s] Bad baseline range. R: %s, BR: %s, ER: %s", self.name(), s, br, er)
                         continue
+                    blim.append(br + er)
 
-                    # Baseline start
-                    start = np.mean(target.value[:, br[0]:br[1]], axis=1)
-                    # Baseline stop
-                    stop = np.mean(target.value[:, er[0]:er[1]], axis=1)
-                    # Baseline matrix
-                    x = np.arange(s[0], s[1]) - s[0]
-                    baseline = np.tile((stop - start) / (s[1] - s[0]), (x.shape[0], 1)).T * np.tile(x, (n, 1)) + np.tile(start, (x.shape[0], 1)).T
+                idx.append(i)
+                lim.append(s)
 
-                else:
-                    baseline = 0
+            if len(idx):
+                # Range sums from the cumulative sum cached by the target
+                lim = np.array(lim, dtype=np.intp)
+                width = lim[:, 1] - lim[:, 0]
+                val = target.range_sum(lim[:, 0], lim[:, 1])
 
-                peaks.append(np.sum(target.value[:, s[0]:s[1]] - baseline, dtype=np.float64, axis=1))
+                if self.params['baseline']:
+                    blim = np.array(blim, dtype=np.intp)
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        start = target.range_sum(blim[:, 0], blim[:, 1]) / (blim[:, 1] - blim[:, 0])
+                        stop = target.range_sum(blim[:, 2], blim[:, 3]) / (blim[:, 3] - blim[:, 2])
+                    # Sum of the baseline start + (stop - start) * x / width
+                    # for x = 0 ... width - 1
+                    val -= width * start + (stop - start) * (width - 1) / 2.0
+
+                peaks[idx] = val.T
 
             # Store output
             if type(self.outvars['output']) is not list:
@@ -229,6 +242,14 @@ class DigitizerSplit(BaseAlgorithm):
 
     Split the digitizer traces that comes packed together in a single array.
 
+    Parameters:
+    - channel: the channel to extract.
+    - baseline: optional range of samples used to compute the baseline to
+      be subtracted. The output is then of type float32.
+    - copy: if 1 (the default) the output is a copy of the channel data. If
+      0, when no baseline is requested, the output is a view on the packed
+      array, that must not be modified.
+
     """
 
     def __init__(self, params):
@@ -239,7 +260,7 @@ class DigitizerSplit(BaseAlgorithm):
 
         # Eval channel number
         try:
-            ch = int(eval(self.params['channel'], {"__builtins__": None}, {}))
+            ch = int(evaluate(self.params['channel']))
             if ch < 0 or ch > 7:
                 self.params['channel'] = None
             else:
@@ -251,7 +272,7 @@ class DigitizerSplit(BaseAlgorithm):
         # Eval baseline subtraction
         if "baseline" in self.params:
             try:
-                t = eval(self.params['baseline'], {"__builtins__": None}, {})
+                t = evaluate(self.params['baseline'])
                 if type(t) is not list:
                     raise Exception("baseline evaluated to wrong type")
 
@@ -272,6 +293,13 @@ class DigitizerSplit(BaseAlgorithm):
                     self.logger.error("[%s] Error evaluating baseline parameter (Error: %s)", self.name(), e)
                 del self.params['baseline']
 
+        # Eval copy flag
+        try:
+            self.params['copy'] = 'copy' not in self.params or evaluate(self.params['copy']) == 1
+        except Exception, e:
+            self.logger.error("[%s] Error evaluating copy parameter (Error: %s)", self.name(), e)
+            self.params['copy'] = True
+
     def process(self, target, **kwargs):
         """ Extract selected channel. """
         # Init output
@@ -287,10 +315,16 @@ class DigitizerSplit(BaseAlgorithm):
                     val &= val - 1
                     count += 1
 
-                val = np.copy(target.value[:, (count * dsize):((count + 1) * dsize - 1)])
+                val = target.value[:, (count * dsize):((count + 1) * dsize - 1)]
                 if 'baseline' in self.params:
+                    # Subtract baseline in a single pass into a float32 buffer
                     baseline = np.mean(val[:, self.params['baseline'][0]:self.params['baseline'][1]], axis=1, dtype=np.float32)
-                    val = np.float32(val) - np.tile(baseline, (val.shape[1], 1)).T
+                    buf = np.empty(val.shape, dtype=np.float32)
+                    np.subtract(val, baseline[:, np.newaxis], out=buf)
+                    val = buf
+
+                elif self.params['copy']:
+                    val = np.copy(val)
 
                 out.value = val
                 return {'output': out}
@@ -338,6 +372,18 @@ class DigitizerSplit(BaseAlgorithm):
             }
         }
 
+        # Copy flag
+        delegates['copy'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'bool',
+            'label': 'Copy',
+            'default': 1,
+            'delegate': {
+                'type': 'CheckboxDelegate'
+            }
+        }
+
         return delegates
 
 
@@ -348,11 +394,13 @@ class DigitizerJitter(BaseAlgorithm):
     def __init__(self, params):
         """ Constructor. """
         super(DigitizerJitter, self).__init__(params)
+        self.name("DigitizerJitter")
+        self.version("1.0")
 
         # Check threshold parameter
         if 'fraction' in self.params:
             try:
-                t = eval(self.params['fraction'], {"__builtins__": None}, {})
+                t = evaluate(self.params['fraction'])
 
                 if type(t) not in (float, ):
                     raise Exception("fraction evaluated to wrong type.")
@@ -373,7 +421,7 @@ class DigitizerJitter(BaseAlgorithm):
         # Maximum t0
         if 'maxt0' in self.params:
             try:
-                t = eval(self.params['maxt0'], {"__builtins__": None}, {})
+                t = evaluate(self.params['maxt0'])
 
                 if type(t) not in (int, long):
                     raise Exception("maximum t0 evaluated to wrong type.")
@@ -388,27 +436,52 @@ class DigitizerJitter(BaseAlgorithm):
             self.params['maxt0'] = 0
 
     def process(self, target, reference, **kwargs):
-        """ Extract t0 for the digitizer from target channel. """
+        """ Extract t0 for the digitizer from target channel.
+
+        All the reference traces are smoothed at once with a moving average
+        computed from their cumulative sum. The t0 of each shot is the first
+        sample above the configured fraction of the maximum, and the shifts
+        are applied to all the target traces with a single fancy indexing
+        operation.
+
+        """
         if reference.name() != "Array":
-            self.warning("[%s] Input variable must be of type Array. Found %s.", self.name(), type(target))
+            self.logger.warning("[%s] Input variable must be of type Array. Found %s.", self.name(), type(reference))
             return
 
         if 'fraction' in self.params:
             wl = 7
-            w = np.ones(wl, dtype=np.float64)
-            sp = np.hstack((reference.value[:, wl - 1:0:-1], reference.value, reference.value[:, -1:-wl:-1]))
-
-            for i in np.arange(sp.shape[0]):
-                c = np.convolve(w / w.sum(), sp[i], mode='valid')
-                delta = (c.shape[0] - target.value.shape[0]) / 2
-                c = c[delta:c.shape[0] - delta]
-
-                th = self.params['fraction'] * np.max(c)
-                t0 = np.sum(np.cumsum(c > th) == 0, dtype=np.int32) - 50
-
-                if t0 > 0 and t0 < self.params['maxt0']:
-                    target.value[i, 0:target.value.shape[1] - t0] = target.value[i, t0:]
-                    target.value[target.value.shape[1] - t0:] = 0
+            ref = reference.value
+            (n, l) = ref.shape
+
+            # Extend traces at both ends by reflection
+            sp = np.hstack((ref[:, wl - 1:0:-1], ref, ref[:, -1:-wl:-1]))
+
+            # Moving average centered on each sample of the reference
+            cs = np.zeros((n, sp.shape[1] + 1), dtype=np.float64)
+            np.cumsum(sp, axis=1, dtype=np.float64, out=cs[:, 1:])
+            off = (wl - 1) / 2
+            c = (cs[:, off + wl:off + wl + l] - cs[:, off:off + l]) / wl
+
+            # First sample above threshold
+            mask = c > (self.params['fraction'] * np.max(c, axis=1))[:, np.newaxis]
+            t0 = np.where(np.any(mask, axis=1), np.argmax(mask, axis=1), l) - 50
+
+            # Shift the selected traces
+            sel = np.nonzero(np.logical_and(t0 > 0, t0 < self.params['maxt0']))[0]
+            if len(sel):
+                # Do not write through a view on another dataset
+                if target.value.base is not None:
+                    target.value = np.copy(target.value)
+
+                w = target.value.shape[1]
+                cols = np.arange(w)[np.newaxis, :] + t0[sel][:, np.newaxis]
+                val = target.value[sel[:, np.newaxis], np.minimum(cols, w - 1)]
+                val[cols >= w] = 0
+                target.value[sel] = val
+
+                # Target was modified in place
+                target.invalidate()
 
         return {}
 
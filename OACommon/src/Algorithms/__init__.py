@@ -11,6 +11,7 @@ from Image import ImageFilter
 from Image import ImageBin
 from Image import ImageProfile
 from Image import ImageAnnularFilter
+from Image import ImageRadialProfile
 
 # Spectrum processing
 from Spectrum import IntegratePeaks
@@ -27,7 +27,10 @@ try:
 except RuntimeWarning:
     pass
 
+import numpy as np
+
 from BaseObject import BaseObject
+from Scheduler import Scheduler
 import DataObj
 
 # SQLite benchmarking module
@@ -37,19 +40,45 @@ import DataObj
 class Analyzer(BaseObject):
     """ Class Analyzer
     """
-    def __init__(self, config):
+    def __init__(self, config, lazy=True, threads=1, block=0):
         """ Constructor. A valid configuration object must be passed as
-        input parameter.
+        input parameter. If lazy is True the raw datasets are read from the
+        HDF5 file only when they are accessed for the first time. If threads
+        is greater than one, independent algorithms are run concurrently on
+        a pool of threads. If block is greater than zero, files are processed
+        in blocks of at most that number of shots (see iterate()).
         """
         super(Analyzer, self).__init__()
         self.name("Analyzer")
         self.config = config
+        self.lazy = lazy
+        self.block = block
+
+        # Scalar datasets need at least two shots per block
+        if 0 < self.block < 2:
+            self.logger.warning("[%s] Block size %d is too small. Using blocks of 2 shots.", self.name(), self.block)
+            self.block = 2
+
+        # Parallel scheduler
+        self.scheduler = None
+        if threads > 1:
+            self.scheduler = Scheduler(self.config.algorithms, threads)
 
     #@Benchmarking.sqlite_profile
     def analyze(self, h5_filename):
         """ Run the analysis of an HDF5 file. A valid filename should be
         passed as the only parameter.
+
+        In streaming mode the file is processed block by block, and only the
+        datasets that are not of class 'Raw' are returned, merged along the
+        shot axis. The merged data take as much memory as processing the
+        whole file, so to limit memory usage iterate() should be used
+        instead.
+
         """
+        if self.block > 0:
+            return self._merge(self.iterate(h5_filename))
+
         try:
             # Open HDF5 input file
             try:
@@ -60,41 +89,12 @@ class Analyzer(BaseObject):
                 return {}
 
             # Load data from HDF5
-            # NB: the first size of the ndarrays loaded from the HDF5 files are meant as the number of independent datasets.
-            raw_data = {}
-
-            # Import data objects
             try:
-                for key in self.config.rawdata.keys():
-
-                    try:
-                        # Load all data once to optimize I/O
-                        data = h5in.get(self.config.rawdata[key][1]).value
-                        self.logger.debug("[%s] Loaded dataset '%s' which has type '%s'.", self.name(), key, type(data))
-                    except AttributeError, e:
-                        self.logger.error("[%s] Cannot find dataset '%s' (Error: %s)", self.name(), key, e)
-                        continue
-
-                    # Load HDF5 attributes
-                    attrs = {}
-                    for name in h5in.get(self.config.rawdata[key][1]).attrs.keys():
-                        attrs[name] = h5in.get(self.config.rawdata[key][1]).attrs[name]
-
-                    # Store data into object
-                    try:
-                        raw_data[key] = getattr(DataObj, self.config.rawdata[key][0])()
-                        raw_data[key].load(data, attrs)
-                        raw_data[key].classtype('Raw')
-                    except Exception, e:
-                        self.logger.error("[%s] Error creating object for dataset '%s' (Error: %s)", self.name(), key, e, exc_info=True)
-                        if key in raw_data:
-                            # Remove incomplete dataset
-                            del raw_data[key]
-
-                self.logger.debug("[%s] Loaded %d raw datasets.", self.name(), len(raw_data))
+                raw_data = self._load(h5in, self.lazy)
 
                 # Close input HDF5 file
-                h5in.close()
+                if not self.lazy:
+                    h5in.close()
 
             except Exception, e:
                 self.logger.error("[%s] Error loading datasets (Error: %s)", self.name(), e, exc_info=True)
@@ -102,12 +102,178 @@ class Analyzer(BaseObject):
                 return {}
 
             # Run configured algorithms
-            for algo in self.config.algorithms:
-                algo[2]._process(raw_data)
+            self._run(raw_data)
+
+            # In lazy mode the input file is kept open by the datasets that
+            # have not been read yet, and it's closed as soon as they are
+            # released. If everything has been read we close it now.
+            if self.lazy:
+                unread = [k for k in raw_data if raw_data[k] is not None and raw_data[k].is_lazy()]
+                if len(unread) == 0:
+                    h5in.close()
+                else:
+                    self.logger.debug("[%s] %d datasets were never read (%s).", self.name(), len(unread), ", ".join(unread))
 
             # Return all data
             return raw_data
 
         except Exception as e:
             self.logger.error("[%s] Unhandled exception (Error: %s)", self.name(), e, exc_info=True)
-            return {}
\ No newline at end of file
+            return {}
+
+    def iterate(self, h5_filename):
+        """ Run the analysis of an HDF5 file one block of shots at a time.
+
+        This is a generator that yields, for each block, the dictionary of
+        datasets after running all the configured algorithms. Only the shots
+        of the current block are kept in memory. Metadata datasets are passed
+        unchanged to every block.
+
+        If streaming is disabled the whole file is yielded as a single block.
+
+        """
+        if self.block <= 0:
+            yield self.analyze(h5_filename)
+            return
+
+        # Open HDF5 input file
+        try:
+            self.logger.debug("[%s] Loading file '%s'", self.name(), h5_filename)
+            h5in = h5py.File(h5_filename, 'r')
+        except IOError:
+            self.logger.error("[%s] Cannot find file '%s'", self.name(), h5_filename)
+            return
+
+        try:
+            # Attach datasets
+            try:
+                raw_data = self._load(h5in, True)
+            except Exception, e:
+                self.logger.error("[%s] Error loading datasets (Error: %s)", self.name(), e, exc_info=True)
+                return
+
+            # Number of shots
+            n = 0
+            for k in raw_data:
+                if type(raw_data[k]) is not DataObj.Metadata and len(raw_data[k].shape()) > 0:
+                    n = max(n, raw_data[k].shape()[0])
+
+            # Block boundaries. Scalar datasets need at least two shots, so
+            # a last block with a single shot is merged with the previous one.
+            limits = range(0, n, self.block) + [n]
+            if len(limits) > 2 and limits[-1] - limits[-2] < 2:
+                del limits[-2]
+            self.logger.debug("[%s] Processing %d shots in %d blocks.", self.name(), n, len(limits) - 1)
+
+            for i in range(len(limits) - 1):
+                data = {}
+                for k in raw_data:
+                    if type(raw_data[k]) is DataObj.Metadata:
+                        data[k] = raw_data[k]
+                        continue
+                    try:
+                        data[k] = type(raw_data[k])()
+                        data[k].load(raw_data[k].read(limits[i], limits[i + 1]), raw_data[k].attrs)
+                        data[k].classtype('Raw')
+                    except Exception, e:
+                        self.logger.error("[%s] Error loading block [%d, %d) of dataset '%s' (Error: %s)", self.name(), limits[i], limits[i + 1], k, e)
+                        if k in data:
+                            del data[k]
+
+                # Run configured algorithms
+                self._run(data)
+                yield data
+
+                # Release block
+                del data
+
+        finally:
+            h5in.close()
+
+    def _load(self, h5in, lazy):
+        """ Load the configured raw datasets from an open HDF5 file. """
+        # NB: the first size of the ndarrays loaded from the HDF5 files are meant as the number of independent datasets.
+        raw_data = {}
+
+        # Import data objects
+        for key in self.config.rawdata.keys():
+
+            try:
+                dset = h5in.get(self.config.rawdata[key][1])
+                if lazy:
+                    # Only check that the dataset exists, data will be read when needed
+                    if not isinstance(dset, h5py.Dataset):
+                        raise AttributeError("'%s' is not a dataset" % self.config.rawdata[key][1])
+                    self.logger.debug("[%s] Attached dataset '%s' with shape %s.", self.name(), key, dset.shape)
+                else:
+                    # Load all data once to optimize I/O
+                    data = dset.value
+                    self.logger.debug("[%s] Loaded dataset '%s' which has type '%s'.", self.name(), key, type(data))
+            except AttributeError, e:
+                self.logger.error("[%s] Cannot find dataset '%s' (Error: %s)", self.name(), key, e)
+                continue
+
+            # Load HDF5 attributes
+            attrs = dict(dset.attrs.items())
+
+            # Store data into object
+            try:
+                raw_data[key] = getattr(DataObj, self.config.rawdata[key][0])()
+                if lazy:
+                    raw_data[key].load_lazy(dset, attrs, h5in)
+                else:
+                    raw_data[key].load(data, attrs)
+                raw_data[key].classtype('Raw')
+            except Exception, e:
+                self.logger.error("[%s] Error creating object for dataset '%s' (Error: %s)", self.name(), key, e, exc_info=True)
+                if key in raw_data:
+                    # Remove incomplete dataset
+                    del raw_data[key]
+
+        self.logger.debug("[%s] Loaded %d raw datasets.", self.name(), len(raw_data))
+        return raw_data
+
+    def close(self):
+        """ Release the thread pool of the scheduler and the resources kept
+        by the algorithms.
+        """
+        if self.scheduler is not None:
+            self.scheduler.close()
+        for algo in self.config.algorithms:
+            algo[2].close()
+
+    def _run(self, data):
+        """ Run the configured algorithms. """
+        if self.scheduler is not None:
+            self.scheduler.run(data)
+        else:
+            for algo in self.config.algorithms:
+                algo[2]._process(data)
+
+    def _merge(self, blocks):
+        """ Merge the datasets that are not of class 'Raw' produced by the
+        processing of each block, concatenating them along the shot axis.
+        Metadata are taken from the last block.
+        """
+        try:
+            parts = {}
+            for data in blocks:
+                for k in data:
+                    if data[k] is None or data[k].classtype() == 'Raw':
+                        continue
+                    parts.setdefault(k, []).append(data[k])
+
+            out = {}
+            for k in parts:
+                if type(parts[k][-1]) is DataObj.Metadata or len(parts[k]) == 1:
+                    out[k] = parts[k][-1]
+                else:
+                    out[k] = type(parts[k][0])()
+                    out[k].value = np.concatenate([p.value for p in parts[k]])
+                    out[k].attrs = parts[k][0].attrs
+                    out[k].classtype(parts[k][0].classtype())
+            return out
+
+        except Exception as e:
+            self.logger.error("[%s] Error merging blocks (Error: %s)", self.name(), e, exc_info=True)
+            return {}
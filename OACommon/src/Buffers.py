@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+"""
+Online Analysis - Reusable buffers
+
+Version 1.0
+
+Michele Devetta (c) 2013
+
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import sys
+import threading
+import numpy as np
+
+
+class BufferPool(object):
+
+    """ A pool of preallocated numpy arrays
+
+    Buffers are indexed by shape and dtype. A buffer is handed out again only
+    when nobody else holds a reference to it (or to a view of it), so that a
+    result still in use is never overwritten. At most 'size' buffers are kept
+    for each shape and dtype; when all of them are busy a new array is
+    allocated and not pooled.
+
+    Shapes usually include the number of shots, that changes from file to
+    file. So that memory does not grow without bound, when the pooled
+    buffers exceed 'maxbytes' the least recently used shapes are released.
+    The shape being requested is never released, so a single large buffer
+    is pooled even if it exceeds the limit.
+
+    """
+
+    def __init__(self, size=4, maxbytes=256 * 1024 * 1024):
+        """ Constructor. """
+        self._size = size
+        self._maxbytes = maxbytes
+        self._buffers = {}
+        self._lastuse = {}
+        self._nbytes = 0
+        self._tick = 0
+        self._lock = threading.Lock()
+
+    def nbytes(self):
+        """ Total size of the pooled buffers. """
+        return self._nbytes
+
+    def get(self, shape, dtype):
+        """ Return a free buffer with the given shape and dtype. The content
+        of the buffer is undefined.
+        """
+        key = (tuple(shape), np.dtype(dtype))
+        with self._lock:
+            self._tick += 1
+            self._lastuse[key] = self._tick
+            buffers = self._buffers.setdefault(key, [])
+            for i in range(len(buffers)):
+                # References: the list and the argument of getrefcount
+                if sys.getrefcount(buffers[i]) <= 2:
+                    return buffers[i]
+
+            buf = np.empty(shape, dtype=dtype)
+            if len(buffers) < self._size:
+                buffers.append(buf)
+                self._nbytes += buf.nbytes
+                self._evict(key)
+            return buf
+
+    def _evict(self, current):
+        """ Release the least recently used shapes until the pool is within
+        its size limit.
+        """
+        while self._nbytes > self._maxbytes and len(self._buffers) > 1:
+            key = min([k for k in self._buffers if k != current], key=lambda k: self._lastuse[k])
+            self._nbytes -= sum([b.nbytes for b in self._buffers.pop(key)])
+            del self._lastuse[key]
+
+    def clear(self):
+        """ Release all the buffers. """
+        with self._lock:
+            self._buffers = {}
+            self._lastuse = {}
+            self._nbytes = 0
+
+    def __getstate__(self):
+        """ Buffers are not pickled. """
+        return {'_size': self._size, '_maxbytes': self._maxbytes}
+
+    def __setstate__(self, state):
+        """ Restore an empty pool. """
+        self.__init__(state['_size'], state.get('_maxbytes', 256 * 1024 * 1024))
+
+
+class RingBuffer(object):
+
+    """ A fixed size circular buffer of values
+
+    New values overwrite the oldest ones once the buffer is full, without
+    moving the stored data. The content can be read in chronological order
+    as a list of at most two views with chunks(), or as a single array with
+    linear(), that copies only when the data wraps around the end of the
+    storage. Until the buffer is full the unused positions are zero.
+
+    """
+
+    def __init__(self, size, dtype):
+        """ Constructor. """
+        self._data = np.zeros((size, ), dtype=dtype)
+        self._head = 0
+        self._full = False
+
+    def __len__(self):
+        """ Number of stored values. """
+        return self._data.shape[0] if self._full else self._head
+
+    def size(self):
+        """ Capacity of the buffer. """
+        return self._data.shape[0]
+
+    def dtype(self):
+        """ Type of the stored values. """
+        return self._data.dtype
+
+    def append(self, values):
+        """ Append values to the buffer. """
+        size = self._data.shape[0]
+        n = len(values)
+        if n >= size:
+            # Only the last values fit in the buffer
+            self._data[:] = values[n - size:]
+            self._head = 0
+            self._full = True
+            return
+
+        end = self._head + n
+        if end <= size:
+            self._data[self._head:end] = values
+        else:
+            k = size - self._head
+            self._data[self._head:] = values[:k]
+            self._data[:end - size] = values[k:]
+
+        if end >= size:
+            self._full = True
+        self._head = end % size
+
+    def clear(self):
+        """ Remove all the values. """
+        self._data[:] = 0
+        self._head = 0
+        self._full = False
+
+    def chunks(self):
+        """ Return the content as a list of views, oldest first. """
+        if not self._full or self._head == 0:
+            return [self._data]
+        return [self._data[self._head:], self._data[:self._head]]
+
+    def linear(self, out=None):
+        """ Return the content as a single array, oldest first. If the data
+        wraps around, it is copied into 'out' (if given) or into a new array.
+        """
+        c = self.chunks()
+        if len(c) == 1:
+            return c[0]
+        if out is None:
+            out = np.empty(self._data.shape, dtype=self._data.dtype)
+        k = c[0].shape[0]
+        out[:k] = c[0]
+        out[k:] = c[1]
+        return out
+
+
+class GrowableArray(object):
+
+    """ A 1D array that grows by appending values
+
+    The storage capacity is doubled when needed, so that appending n values
+    costs O(n) on average. Optionally the number of values can be limited to
+    'maxsize' with one of two policies:
+    - 'drop': keep only the last maxsize values.
+    - 'decimate': when maxsize is reached, drop every other value and from
+      then on store only one value every two. The stored values remain
+      evenly spaced over the whole history.
+
+    """
+
+    def __init__(self, dtype, capacity=1024, maxsize=None, policy='drop'):
+        """ Constructor. """
+        if maxsize is not None and maxsize > 0:
+            capacity = min(capacity, 2 * maxsize)
+        else:
+            maxsize = None
+        self._data = np.empty((max(1, capacity), ), dtype=dtype)
+        self._start = 0
+        self._end = 0
+        self._maxsize = maxsize
+        self._policy = policy
+        # Decimation state: stride and number of values received
+        self._stride = 1
+        self._count = 0
+
+    def __len__(self):
+        """ Number of stored values. """
+        return self._end - self._start
+
+    def data(self):
+        """ Return a view of the stored values. """
+        return self._data[self._start:self._end]
+
+    def clear(self):
+        """ Remove all the values. """
+        self._start = 0
+        self._end = 0
+        self._stride = 1
+        self._count = 0
+
+    def discard(self, n):
+        """ Remove the first n values. """
+        self._start = min(self._start + n, self._end)
+
+    def _reserve(self, n):
+        """ Make room for n more values at the end of the storage. """
+        size = self._end - self._start
+        if self._end + n <= self._data.shape[0]:
+            return
+
+        # Allocate more memory if needed, otherwise just compact
+        cap = self._data.shape[0]
+        while cap < size + n:
+            cap *= 2
+        if self._maxsize is not None and self._policy == 'drop':
+            cap = max(min(cap, 2 * self._maxsize), size + n)
+
+        if cap > self._data.shape[0]:
+            data = np.empty((cap, ), dtype=self._data.dtype)
+            data[0:size] = self._data[self._start:self._end]
+            self._data = data
+        else:
+            self._data[0:size] = self._data[self._start:self._end]
+        self._start = 0
+        self._end = size
+
+    def append(self, values):
+        """ Append values to the array. """
+        values = np.asarray(values, dtype=self._data.dtype).ravel()
+
+        if self._maxsize is not None and self._policy == 'decimate':
+            # Keep only the values on the current stride
+            offset = (-self._count) % self._stride
+            self._count += values.shape[0]
+            values = values[offset::self._stride]
+
+        elif self._maxsize is not None and values.shape[0] > self._maxsize:
+            values = values[-self._maxsize:]
+
+        n = values.shape[0]
+        if n == 0:
+            return
+        self._reserve(n)
+        self._data[self._end:self._end + n] = values
+        self._end += n
+
+        if self._maxsize is not None:
+            if self._policy == 'decimate':
+                while self._end - self._start > self._maxsize:
+                    # Halve the stored values and double the stride
+                    d = self._data[self._start:self._end:2].copy()
+                    self._data[0:d.shape[0]] = d
+                    self._start = 0
+                    self._end = d.shape[0]
+                    self._stride *= 2
+            elif self._end - self._start > self._maxsize:
+                self._start = self._end - self._maxsize
+
+
+class BunchList(object):
+
+    """ A growable list of bunch numbers
+
+    Bunch numbers are stored as runs of consecutive values (start and
+    length), so that the bunches of a whole file usually take a single run.
+    The number of bunches can be limited with 'maxsize' and 'policy', with
+    the same meaning as in GrowableArray.
+
+    The version attribute is incremented at each change, so that consumers
+    can skip the export of an unchanged list. The expanded array is built
+    on request and cached until the next change. Consumers that keep their
+    own copy of the runs can fetch only the runs changed since a mark()
+    with changes().
+
+    """
+
+    def __init__(self, dtype, maxsize=None, policy='drop'):
+        """ Constructor. """
+        self._dtype = np.dtype(dtype)
+        self._starts = GrowableArray(dtype, 64)
+        self._lengths = GrowableArray(np.int64, 64)
+        self._len = 0
+        self._maxsize = maxsize if maxsize is not None and maxsize > 0 else None
+        self._policy = policy
+        self._stride = 1
+        self._count = 0
+        self._decoded = None
+        self.version = 0
+        # Incremented when runs are removed from the front or replaced
+        self._front = 0
+
+    def __len__(self):
+        """ Number of bunches. """
+        return self._len
+
+    def __array__(self, dtype=None):
+        """ Return the bunch numbers as a numpy array. """
+        if dtype is None:
+            return self.decode()
+        return self.decode().astype(dtype)
+
+    @staticmethod
+    def _encode(values):
+        """ Split values into runs of consecutive numbers. """
+        brk = np.flatnonzero(np.diff(values) != 1) + 1
+        first = np.concatenate(([0], brk))
+        lengths = np.diff(np.concatenate((first, [values.shape[0]])))
+        return (values[first], lengths)
+
+    @staticmethod
+    def _expand(starts, lengths, dtype):
+        """ Expand runs into the list of values. """
+        offset = np.cumsum(lengths) - lengths
+        return (np.arange(lengths.sum()) + np.repeat(starts.astype(np.int64) - offset, lengths)).astype(dtype)
+
+    def runs(self):
+        """ Return the start and the length of each run. """
+        return (self._starts.data(), self._lengths.data())
+
+    def mark(self):
+        """ Return a mark of the current runs for changes(). """
+        return (self._front, len(self._starts))
+
+    def changes(self, mark=None):
+        """ Return (offset, starts, lengths) with the runs changed since
+        mark. The runs before offset are unchanged, so a copy of the runs
+        taken at mark is updated by replacing its runs from offset onward.
+        Without a mark, or if the oldest runs were dropped since, all the
+        runs are returned with offset 0.
+        """
+        (starts, lengths) = self.runs()
+        offset = 0
+        if mark is not None and mark[0] == self._front:
+            # The last run may have been extended
+            offset = max(0, min(mark[1], starts.shape[0]) - 1)
+        return (offset, starts[offset:], lengths[offset:])
+
+    def decode(self):
+        """ Return the bunch numbers as a numpy array. """
+        if self._decoded is None:
+            (starts, lengths) = self.runs()
+            self._decoded = self._expand(starts, lengths, self._dtype)
+        return self._decoded
+
+    def _replace(self, values):
+        """ Replace the content with the given values. """
+        self._starts.clear()
+        self._lengths.clear()
+        self._len = 0
+        self._add(values)
+
+    def _add(self, values):
+        """ Add values merging the first run with the last one if they are
+        consecutive.
+        """
+        if values.shape[0] == 0:
+            return
+        (starts, lengths) = self._encode(values)
+        if len(self._starts) > 0:
+            s = self._starts.data()
+            l = self._lengths.data()
+            if starts[0] == s[-1] + l[-1]:
+                l[-1] += lengths[0]
+                starts = starts[1:]
+                lengths = lengths[1:]
+        self._starts.append(starts)
+        self._lengths.append(lengths)
+        self._len += values.shape[0]
+
+    def append(self, values):
+        """ Append bunch numbers. """
+        values = np.asarray(values, dtype=self._dtype).ravel()
+
+        if self._maxsize is not None and self._policy == 'decimate':
+            # Keep only the values on the current stride
+            offset = (-self._count) % self._stride
+            self._count += values.shape[0]
+            values = values[offset::self._stride]
+
+        if values.shape[0] == 0:
+            return
+        self._add(values)
+
+        if self._maxsize is not None and self._len > self._maxsize:
+            if self._policy == 'decimate':
+                # Halve the values and double the stride
+                v = self._expand(self._starts.data(), self._lengths.data(), self._dtype)
+                while v.shape[0] > self._maxsize:
+                    v = v[::2]
+                    self._stride *= 2
+                self._replace(v)
+                self._front += 1
+            else:
+                # Drop the oldest runs and shorten the first one left
+                n = self._len - self._maxsize
+                lengths = self._lengths.data()
+                k = np.searchsorted(np.cumsum(lengths), n, side='right')
+                dropped = lengths[0:k].sum()
+                self._starts.discard(k)
+                self._lengths.discard(k)
+                self._starts.data()[0] += n - dropped
+                self._lengths.data()[0] -= n - dropped
+                self._len = self._maxsize
+                self._front += 1
+
+        self._decoded = None
+        self.version += 1
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Online Analysis - Checkpoint of presenter state
+
+Version 1.0
+
+Michele Devetta (c) 2013
+
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+try:
+    import h5py
+except RuntimeWarning:
+    pass
+
+import os
+import copy
+import time
+import threading
+import cPickle
+import numpy as np
+from BaseObject import BaseObject
+
+
+class Checkpoint(BaseObject):
+
+    """ Periodic checkpoint of the presenters state to an HDF5 file
+
+    The state of each presenter (see BasePresentation.get_state()) is
+    pickled and stored as an opaque dataset named after the presenter,
+    together with a fingerprint of its configuration. Only the presenters
+    updated since the previous checkpoint are written again.
+
+    The state is copied by the thread calling save(), between two updates,
+    so that it is consistent. It is serialized and written to the file by a
+    background thread; if the previous write has not finished yet the
+    checkpoint is postponed to the next call. The file is replaced only
+    when it has been written completely. If the write fails the presenters
+    are marked as changed again, so that their state is saved by the next
+    checkpoint. The writer must be joined with wait() before exiting.
+
+    """
+
+    def __init__(self, filename, period=60.0):
+        """ Constructor. Take the checkpoint file name and the minimum time
+        between two checkpoints in seconds.
+        """
+        super(Checkpoint, self).__init__()
+        self.name("Checkpoint")
+        self.version("1.0")
+
+        self._filename = filename
+        self._period = period
+        self._last = time.time()
+        self._writer = None
+
+    def restore(self, presenters):
+        """ Restore the state of the presenters from the checkpoint file.
+        Presenters whose configuration has changed are left untouched.
+        Return the number of restored presenters.
+        """
+        count = 0
+        try:
+            with h5py.File(self._filename, 'r') as f:
+                for (name, pres) in presenters:
+                    if name not in f:
+                        continue
+                    try:
+                        dset = f[name]
+                        if dset.attrs['fingerprint'] != pres.fingerprint():
+                            self.logger.warning("[%s] Configuration of presenter '%s' has changed. Not restoring its state.", self.name(), name)
+                            continue
+                        pres.set_state(cPickle.loads(dset[()].tostring()))
+                        count += 1
+                    except Exception, e:
+                        self.logger.error("[%s] Cannot restore state of presenter '%s' (Error: %s)", self.name(), name, e)
+
+        except IOError, e:
+            self.logger.info("[%s] No checkpoint to restore from '%s' (Error: %s)", self.name(), self._filename, e)
+        except Exception, e:
+            self.logger.error("[%s] Error reading checkpoint file '%s' (Error: %s)", self.name(), self._filename, e, exc_info=True)
+        else:
+            self.logger.info("[%s] Restored state of %d presenters from '%s'.", self.name(), count, self._filename)
+        return count
+
+    def save(self, presenters, force=False):
+        """ Start a checkpoint if the period has elapsed and the previous one
+        has completed. With force, wait for the previous one and start the
+        checkpoint anyway. Return True if a checkpoint has been started.
+        """
+        if not force and time.time() - self._last < self._period:
+            return False
+        if self._writer is not None and self._writer.is_alive():
+            if not force:
+                return False
+            self._writer.join()
+
+        # Snapshot the state of the changed presenters
+        states = []
+        for (name, pres) in presenters:
+            if not pres.changed:
+                continue
+            try:
+                states.append((name, pres, pres.fingerprint(), copy.deepcopy(pres.get_state())))
+                pres.changed = False
+            except Exception, e:
+                self.logger.error("[%s] Cannot copy state of presenter '%s' (Error: %s)", self.name(), name, e)
+
+        self._last = time.time()
+        if len(states) == 0:
+            return False
+
+        self._writer = threading.Thread(target=self._write, args=(states, ))
+        self._writer.start()
+        return True
+
+    def _write(self, states):
+        """ Serialize the states and write them to the checkpoint file. The
+        file is written from scratch under a temporary name, copying the
+        unchanged states from the previous checkpoint, and then renamed, so
+        that an interrupted write never corrupts the previous checkpoint.
+        The presenters whose state has not been saved are marked as changed.
+        """
+        t = time.time()
+        tmpname = self._filename + '.tmp'
+        try:
+            with h5py.File(tmpname, 'w') as f:
+                for (name, pres, fingerprint, state) in states:
+                    try:
+                        blob = cPickle.dumps(state, cPickle.HIGHEST_PROTOCOL)
+                    except Exception, e:
+                        self.logger.error("[%s] Cannot serialize state of presenter '%s' (Error: %s)", self.name(), name, e)
+                        pres.changed = True
+                        continue
+                    dset = f.create_dataset(name, data=np.void(blob))
+                    dset.attrs['fingerprint'] = fingerprint
+
+                # Copy the states that have not changed
+                if os.path.exists(self._filename):
+                    try:
+                        with h5py.File(self._filename, 'r') as old:
+                            for name in old:
+                                if name not in f:
+                                    old.copy(name, f)
+                    except Exception, e:
+                        self.logger.warning("[%s] Cannot read the previous checkpoint (Error: %s)", self.name(), e)
+
+            os.rename(tmpname, self._filename)
+            self.logger.debug("[%s] Saved state of %d presenters in %.1f ms.", self.name(), len(states), (time.time() - t) * 1000.0)
+        except Exception, e:
+            self.logger.error("[%s] Error writing checkpoint file '%s' (Error: %s)", self.name(), self._filename, e, exc_info=True)
+            for (name, pres, fingerprint, state) in states:
+                pres.changed = True
+            try:
+                os.unlink(tmpname)
+            except OSError:
+                pass
+
+    def wait(self):
+        """ Wait for the completion of the running checkpoint. """
+        if self._writer is not None:
+            self._writer.join()
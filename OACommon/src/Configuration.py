@@ -25,6 +25,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import xml.etree.ElementTree as ET
 from BaseObject import BaseObject
+from Filter import FilterCache
 
 
 class Configuration(BaseObject):
@@ -36,8 +37,11 @@ class Configuration(BaseObject):
 
     """
 
-    def __init__(self, xmlfile):
-        """ Constructor. Load and parse the XML file. """
+    def __init__(self, xmlfile, prune=True):
+        """ Constructor. Load and parse the XML file. If prune is True, raw
+        datasets and algorithms whose results are not used by any presenter
+        and are not saved as results are removed from the configuration.
+        """
         super(Configuration, self).__init__()
         self.name("Configuration")
         self.version("1.0")
@@ -47,6 +51,10 @@ class Configuration(BaseObject):
         self.rawdata = {}
         self.algorithms = []
         self.presenters = []
+        self.skipped = {'rawdata': [], 'algorithms': []}
+
+        # Filter results shared by all the presenters
+        self.filter_cache = FilterCache()
 
         # Load XML file with ETree
         try:
@@ -178,7 +186,7 @@ class Configuration(BaseObject):
 
                 # Add presenter
                 try:
-                    obj = getattr(Presenters, ptype)(params, Filter(filters))
+                    obj = getattr(Presenters, ptype)(params, Filter(filters, self.filter_cache))
                     self.presenters.append((pres.attrib['name'], obj))
                 except Exception, e:
                     self.logger.error("[%s] Error creating presenter of type '%s' (Error: %s)", self.name(), ptype, e)
@@ -187,4 +195,54 @@ class Configuration(BaseObject):
         except Exception as e:
             self.logger.error("[%s] Error parsing presenters configuration (Error: %s)", self.name(), e, exc_info=True)
 
-        self.logger.debug("[%s] Configured %d datasets, %d algorithms, %d presenters.", self.name(), len(self.rawdata), len(self.algorithms), len(self.presenters))
\ No newline at end of file
+        # Remove unused datasets and algorithms
+        if prune:
+            try:
+                self._prune()
+            except Exception as e:
+                self.logger.error("[%s] Error pruning configuration (Error: %s)", self.name(), e, exc_info=True)
+
+        self.logger.debug("[%s] Configured %d datasets, %d algorithms, %d presenters.", self.name(), len(self.rawdata), len(self.algorithms), len(self.presenters))
+
+    def _prune(self):
+        """ Remove the raw datasets and the algorithms that do not contribute
+        to any presenter or to any output of type 'Result'.
+
+        The dependency graph is walked backwards starting from the presenter
+        inputs (filters included) and from the results. An algorithm is kept
+        if any of its outputs is needed, and in that case all its inputs
+        become needed as well.
+
+        """
+        # Variables needed by presenters
+        needed = set()
+        for p in self.presenters:
+            needed.update(p[1].input_names())
+
+        # Results are always kept
+        for a in self.algorithms:
+            if a[2].resclass == 'Result':
+                needed.update(a[2].output_names())
+
+        # Walk algorithms in reverse order
+        keep = []
+        for a in reversed(self.algorithms):
+            if needed.intersection(a[2].output_names()):
+                keep.append(a)
+                needed.update(a[2].input_names())
+            else:
+                self.skipped['algorithms'].append(a[1])
+        keep.reverse()
+        self.skipped['algorithms'].reverse()
+        self.algorithms = keep
+
+        # Remove unused raw datasets
+        for k in sorted(self.rawdata.keys()):
+            if k not in needed:
+                self.skipped['rawdata'].append(k)
+                del self.rawdata[k]
+
+        # Log execution plan
+        self.logger.info("[%s] Execution plan: datasets [%s], algorithms [%s].", self.name(), ", ".join(sorted(self.rawdata.keys())), ", ".join([a[1] for a in self.algorithms]))
+        if len(self.skipped['rawdata']) or len(self.skipped['algorithms']):
+            self.logger.info("[%s] Skipping unused datasets [%s], algorithms [%s].", self.name(), ", ".join(self.skipped['rawdata']), ", ".join(self.skipped['algorithms']))
\ No newline at end of file
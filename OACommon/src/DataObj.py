@@ -22,40 +22,156 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """
 
+import threading
 import numpy as np
 from BaseObject import BaseObject
+from Buffers import BufferPool
+from Buffers import RingBuffer
+
+# Serialize the reads of lazy datasets, that may be accessed by concurrent
+# algorithms
+_read_lock = threading.Lock()
 
 
 class BaseDataset(BaseObject):
 
-    """ Base dataset class. """
+    """ Base dataset class.
+
+    The dataset value may be loaded immediately with load() or attached
+    lazily to an HDF5 dataset with load_lazy(). In the latter case the data
+    is read from the file only the first time the value attribute is
+    accessed, while read() can be used to get a range of shots without
+    loading the whole dataset.
+
+    """
 
     def __init__(self):
         """ Constructor. """
         super(BaseDataset, self).__init__()
         self.version("1.0")
         self.classtype("Raw")
-        self.value = None
+        self._value = None
+        self._source = None
+        self._file = None
+        self._block = None
         self.attrs = {}
 
+    def _get_value(self):
+        """ Return the dataset value, reading it from the file if needed. """
+        if self._source is not None:
+            with _read_lock:
+                if self._source is not None:
+                    self._materialize()
+        return self._value
+
+    def _set_value(self, value):
+        """ Set the dataset value, detaching it from the HDF5 file. """
+        self._detach()
+        self._value = value
+        self.invalidate()
+
+    value = property(_get_value, _set_value)
+
     def load(self, data, attrs={}):
         """ Initialize the object loading data from an HDF5 dataset. """
         self._check_data(data)
         if type(data) is np.ndarray:
-            self.value = data
+            self._value = data
         elif type(data) is float:
-            self.value = np.float64(data)
+            self._value = np.float64(data)
         elif type(data) in (int, long):
-            self.value = np.int64(data)
+            self._value = np.int64(data)
         elif type(data) in (str, unicode):
-            self.value = data
+            self._value = data
         elif type(data) in (np.float64, np.float32, np.int64, np.uint64, np.int32, np.uint32, np.int16, np.uint16, np.int8, np.uint8):
-            self.value = data
+            self._value = data
         else:
             self.logger.warning("[%s] Dataset has unexpected type '%s'.", self.name(), type(data))
             self.data = data
 
         self.attrs = attrs
+        self.invalidate()
+
+    def load_lazy(self, dset, attrs={}, h5file=None):
+        """ Initialize the object attaching it to an HDF5 dataset. The data
+        will be read only when first accessed. A reference to the HDF5 file
+        may be passed to keep it open until the data has been read.
+        """
+        self._detach()
+        self._source = dset
+        self._file = h5file
+        self.attrs = attrs
+
+    def is_lazy(self):
+        """ Return True if the data has not been read from the file yet. """
+        return self._source is not None
+
+    def shape(self):
+        """ Return the shape of the dataset without reading it. """
+        if self._source is not None:
+            return self._source.shape
+        return np.shape(self._value)
+
+    def chunk_shots(self):
+        """ Return the number of shots stored in each chunk of the HDF5
+        dataset. Return 1 if the dataset is not chunked or already loaded.
+        """
+        if self._source is not None and self._source.chunks is not None and len(self._source.chunks) > 0:
+            return self._source.chunks[0]
+        return 1
+
+    def read(self, start, stop):
+        """ Return the shots in the range [start, stop).
+
+        If the dataset is still attached to the HDF5 file, only the chunks
+        covering the requested range are read. The last block read is kept
+        so that consecutive slices inside the same chunks do not hit the
+        file again.
+
+        """
+        if self._source is None:
+            return self._value[start:stop]
+
+        # Extend the range to the chunk boundaries
+        n = self._source.shape[0]
+        c = self.chunk_shots()
+        start = max(0, start)
+        stop = min(n, stop)
+        if self._block is None or start < self._block[0] or stop > self._block[1]:
+            bstart = (start // c) * c
+            bstop = min(n, ((stop + c - 1) // c) * c)
+            self.logger.debug("[%s] Reading shots [%d, %d) from file.", self.name(), bstart, bstop)
+            self._block = (bstart, bstop, self._source[bstart:bstop])
+
+        return self._block[2][(start - self._block[0]):(stop - self._block[0])]
+
+    def _materialize(self):
+        """ Read the whole dataset from the HDF5 file. """
+        dset = self._source
+        self.logger.debug("[%s] Reading dataset '%s' from file.", self.name(), dset.name)
+        data = dset[()]
+        self._detach()
+        self.load(data, self.attrs)
+
+    def _detach(self):
+        """ Release the references to the HDF5 file. """
+        self._source = None
+        self._file = None
+        self._block = None
+
+    def invalidate(self):
+        """ Drop any cached data derived from the value. Should be called
+        after modifying the value in place. Does nothing by default.
+        """
+        pass
+
+    def __getstate__(self):
+        """ Read lazy data before pickling, as HDF5 objects cannot be
+        pickled.
+        """
+        if self._source is not None:
+            self._materialize()
+        return self.__dict__.copy()
 
     def _check_data(self, data):
         """ Default data checker. Does nothing. """
@@ -80,12 +196,49 @@ class Scalar(BaseDataset):
 
 class Array(BaseDataset):
 
-    """ Hold an array dataset. """
+    """ Hold an array dataset.
+
+    The cumulative sum of the arrays is computed on first request and cached,
+    so that the sums over any number of sample ranges cost a single
+    subtraction each (see range_sum()).
+
+    """
 
     def __init__(self):
         """ Constructor. """
         super(Array, self).__init__()
         self.name('Array')
+        self._cumsum = None
+
+    def cumsum(self):
+        """ Return the cumulative sum along the sample axis, with a leading
+        column of zeros, so that the sum of the samples [a, b) is given by
+        cs[:, b] - cs[:, a].
+        """
+        if self._cumsum is None:
+            v = self.value
+            cs = np.zeros((v.shape[0], v.shape[1] + 1), dtype=np.float64)
+            np.cumsum(v, axis=1, dtype=np.float64, out=cs[:, 1:])
+            self._cumsum = cs
+        return self._cumsum
+
+    def range_sum(self, start, stop):
+        """ Return the sums of the samples in the ranges [start, stop). Both
+        parameters may be arrays of indexes, in which case the result has
+        one column for each range.
+        """
+        cs = self.cumsum()
+        return cs[:, stop] - cs[:, start]
+
+    def invalidate(self):
+        """ Drop the cached cumulative sum. """
+        self._cumsum = None
+
+    def __getstate__(self):
+        """ Do not pickle the cached cumulative sum. """
+        state = super(Array, self).__getstate__()
+        state['_cumsum'] = None
+        return state
 
     def _check_data(self, data):
         """ Check that the array dataset is a 2D array (one array for each
@@ -97,6 +250,73 @@ class Array(BaseDataset):
             raise Exception("Wrong data size %s" % data.shape)
 
 
+class RingArray(Array):
+
+    """ Hold a 1D array of the last values of a quantity.
+
+    Values are stored in a RingBuffer, so that appending does not move the
+    data already stored. The ordered array is built only when the value is
+    read, reusing the same buffers as long as the previous results are not
+    referenced anymore. chunks() gives the ordered content without copying.
+
+    """
+
+    def __init__(self, size=1, dtype=np.float64):
+        """ Constructor. """
+        super(RingArray, self).__init__()
+        self._ring = RingBuffer(size, dtype)
+        self._pool = BufferPool(2)
+
+    def append(self, values):
+        """ Append values, dropping the oldest ones if needed. """
+        self._ring.append(values)
+        self._value = None
+
+    def chunks(self):
+        """ Return the content as a list of views, oldest first. """
+        if self._ring is None:
+            return [self._value]
+        return self._ring.chunks()
+
+    def _get_value(self):
+        """ Return the content as a single array, oldest first. """
+        if self._value is None and self._ring is not None:
+            self._value = self._ring.linear(self._pool.get((self._ring.size(), ), self._ring.dtype()))
+        return self._value
+
+    def _set_value(self, value):
+        """ Replace the content with the given values. """
+        self._ring = RingBuffer(len(value), value.dtype)
+        self._ring.append(value)
+        self._value = None
+        self.invalidate()
+
+    value = property(_get_value, _set_value)
+
+    def __getstate__(self):
+        """ Pickle only the ordered content, that is enough for the receiver
+        to read the value.
+        """
+        self._get_value()
+        state = super(RingArray, self).__getstate__()
+        state['_value'] = self._value
+        state['_count'] = len(self._ring) if self._ring is not None else None
+        state['_ring'] = None
+        state['_pool'] = None
+        return state
+
+    def __setstate__(self, state):
+        """ Rebuild the ring from the ordered content, so that appending
+        works also on an unpickled object.
+        """
+        count = state.pop('_count', None)
+        self.__dict__.update(state)
+        self._pool = BufferPool(2)
+        if count is not None and self._value is not None:
+            self._ring = RingBuffer(self._value.shape[0], self._value.dtype)
+            self._ring.append(self._value[0:count])
+
+
 class Image(BaseDataset):
 
     """ Hold an image dataset. """
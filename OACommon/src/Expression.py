@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+Online Analysis - Expression parsing and compilation
+
+Version 1.0
+
+Michele Devetta (c) 2013
+
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import ast
+import copy
+import numpy as np
+
+# Cache of compiled expressions
+_cache = {}
+
+# Allowed AST nodes
+_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare,
+    ast.IfExp, ast.Call, ast.keyword, ast.Attribute, ast.Name, ast.Num,
+    ast.Str, ast.List, ast.Tuple, ast.Subscript, ast.Index, ast.Slice,
+    ast.ExtSlice, ast.Ellipsis, ast.expr_context, ast.operator,
+    ast.unaryop, ast.boolop, ast.cmpop,
+)
+
+# Constant names
+_CONSTANTS = {'True': True, 'False': False, 'None': None}
+
+# Functions that work element-wise on arrays, besides NumPy ufuncs
+_ELEMENTWISE = (np.where, np.clip, np.round_, np.around, np.nan_to_num)
+
+
+class _Compiler(ast.NodeTransformer):
+
+    """ Validate, fold and optionally vectorize an expression tree.
+
+    Constant sub-expressions are evaluated and replaced by a reference to a
+    table of constants, that is then used as the global namespace of the
+    compiled code. When vectorization is enabled boolean operators, chained
+    comparisons and conditional expressions are replaced by the equivalent
+    NumPy functions, so that they work element-wise on arrays.
+
+    The compiler also records the arguments used by the expression and
+    whether the expression is element-wise, i.e. evaluating it on arrays
+    gives the same result as evaluating it on each element. Calls other
+    than ufuncs, subscripts and attributes of arguments (e.g. np.mean(x),
+    x[0] or x.sum()) are not element-wise.
+
+    """
+
+    def __init__(self, args, names, vectorize):
+        """ Constructor. """
+        ast.NodeTransformer.__init__(self)
+        self.args = set(args)
+        self.names = names
+        self.vectorize = vectorize
+        self.consts = {}
+        self.used = set()
+        self.elementwise = True
+
+    def const(self, value):
+        """ Return a node referencing a new constant. """
+        name = "__k%d" % len(self.consts)
+        self.consts[name] = value
+        return ast.Name(id=name, ctx=ast.Load())
+
+    def is_const(self, node):
+        """ Check if all the children of a node are constant. As the tree is
+        folded bottom-up, a child expression that is not a literal or a
+        reference to a constant depends on the arguments.
+        """
+        for c in ast.iter_child_nodes(node):
+            if isinstance(c, (ast.Num, ast.Str)):
+                continue
+            elif isinstance(c, ast.Name):
+                if c.id not in self.consts:
+                    return False
+            elif isinstance(c, ast.expr):
+                return False
+            elif not self.is_const(c):
+                return False
+        return True
+
+    def fold(self, node):
+        """ Evaluate a constant node. """
+        env = dict(self.consts)
+        env['__builtins__'] = None
+        code = compile(ast.fix_missing_locations(ast.Expression(body=node)), '<expression>', 'eval')
+        return self.const(eval(code, env))
+
+    def call(self, func, args):
+        """ Build a call to a constant function. """
+        return ast.Call(func=self.const(func), args=args, keywords=[], starargs=None, kwargs=None)
+
+    def visit(self, node):
+        """ Check node type before visiting it. """
+        if not isinstance(node, _NODES):
+            raise ValueError("unsupported syntax '%s'" % type(node).__name__)
+        return ast.NodeTransformer.visit(self, node)
+
+    def visit_Name(self, node):
+        """ Resolve names. """
+        if node.id in self.args:
+            self.used.add(node.id)
+            return node
+        if node.id in _CONSTANTS:
+            return self.const(_CONSTANTS[node.id])
+        if node.id in self.names and not node.id.startswith('_'):
+            return self.const(self.names[node.id])
+        raise NameError("name '%s' is not defined" % node.id)
+
+    def visit_Attribute(self, node):
+        """ Check attributes and fold them if constant. """
+        if node.attr.startswith('_'):
+            raise ValueError("access to private attribute '%s' is not allowed" % node.attr)
+        self.generic_visit(node)
+        # Random functions must not be folded
+        if self.is_const(node) and not (isinstance(node.value, ast.Name) and self.consts[node.value.id] is np and node.attr == 'random'):
+            return self.fold(node)
+        self.elementwise = False
+        return node
+
+    def visit_Call(self, node):
+        """ Check calls and fold them if constant. """
+        if node.starargs is not None or node.kwargs is not None:
+            raise ValueError("variable arguments are not allowed")
+        node = self.visit_expr(node)
+        if isinstance(node, ast.Call):
+            f = node.func
+            if not (isinstance(f, ast.Name) and f.id in self.consts and (isinstance(self.consts[f.id], np.ufunc) or any([self.consts[f.id] is e for e in _ELEMENTWISE]))):
+                self.elementwise = False
+        return node
+
+    def visit_Subscript(self, node):
+        """ Fold constant subscripts. """
+        node = self.visit_expr(node)
+        if isinstance(node, ast.Subscript):
+            self.elementwise = False
+        return node
+
+    def visit_BoolOp(self, node):
+        """ Fold or vectorize boolean operators. """
+        self.generic_visit(node)
+        if self.is_const(node):
+            return self.fold(node)
+        if self.vectorize:
+            f = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            out = node.values[0]
+            for v in node.values[1:]:
+                out = self.call(f, [out, v])
+            return out
+        return node
+
+    def visit_UnaryOp(self, node):
+        """ Fold or vectorize unary operators. """
+        self.generic_visit(node)
+        if self.is_const(node):
+            return self.fold(node)
+        if self.vectorize and isinstance(node.op, ast.Not):
+            return self.call(np.logical_not, [node.operand])
+        return node
+
+    def visit_Compare(self, node):
+        """ Fold or vectorize comparisons. """
+        self.generic_visit(node)
+        if self.is_const(node):
+            return self.fold(node)
+        if self.vectorize and len(node.ops) > 1:
+            # Split chained comparisons
+            left = node.left
+            out = None
+            for (op, right) in zip(node.ops, node.comparators):
+                c = ast.Compare(left=left, ops=[op], comparators=[right])
+                out = c if out is None else self.call(np.logical_and, [out, c])
+                left = right
+            return out
+        return node
+
+    def visit_IfExp(self, node):
+        """ Fold or vectorize conditional expressions. """
+        self.generic_visit(node)
+        if self.is_const(node):
+            return self.fold(node)
+        if self.vectorize:
+            return self.call(np.where, [node.test, node.body, node.orelse])
+        return node
+
+    def visit_expr(self, node):
+        """ Fold a generic expression node if constant. """
+        self.generic_visit(node)
+        if self.is_const(node):
+            return self.fold(node)
+        return node
+
+    visit_BinOp = visit_expr
+    visit_List = visit_expr
+    visit_Tuple = visit_expr
+
+
+class Expression(object):
+
+    """ A compiled expression
+
+    The expression text is parsed, checked against the allowed syntax,
+    constant folded and compiled into a function of the given arguments.
+    Only the names passed as arguments and the names in the namespace (by
+    default only 'np') are available to the expression.
+
+    The attribute 'used' is the set of the arguments referenced by the
+    expression, 'elementwise' is True if the expression can be evaluated on
+    whole arrays with the same result as element by element.
+
+    """
+
+    def __init__(self, text, args=(), names=None, vectorize=True):
+        """ Constructor. Compile the expression. Raise SyntaxError, NameError
+        or ValueError if the expression is not valid.
+        """
+        self.text = text
+        self.args = tuple(args)
+
+        if names is None:
+            names = {'np': np}
+
+        tree = ast.parse(text.strip(), '<expression>', 'eval')
+        comp = _Compiler(self.args, names, vectorize)
+        body = comp.visit(tree.body)
+
+        self.used = frozenset(comp.used)
+        self.elementwise = comp.elementwise
+
+        # Constant expression
+        self.constant = isinstance(body, ast.Name) and body.id in comp.consts
+        self.value = comp.consts[body.id] if self.constant else None
+
+        # Compile function
+        env = dict(comp.consts)
+        env['__builtins__'] = None
+        func = ast.Lambda(args=ast.arguments(args=[ast.Name(id=a, ctx=ast.Param()) for a in self.args], vararg=None, kwarg=None, defaults=[]), body=body)
+        self.function = eval(compile(ast.fix_missing_locations(ast.Expression(body=func)), '<expression>', 'eval'), env)
+
+    def __call__(self, *args):
+        """ Evaluate the expression. """
+        return self.function(*args)
+
+    def __str__(self):
+        """ Return the expression text. """
+        return self.text
+
+
+def compile_expr(text, args=(), vectorize=True):
+    """ Return the compiled expression for the given text and arguments.
+    Compiled expressions are cached by text.
+    """
+    key = (text, tuple(args), vectorize)
+    if key not in _cache:
+        _cache[key] = Expression(text, args, vectorize=vectorize)
+    return _cache[key]
+
+
+def evaluate(text):
+    """ Evaluate a constant expression, as used in configuration parameters.
+    No names are available, so that unknown identifiers raise a NameError.
+    """
+    key = (text, None, False)
+    if key not in _cache:
+        e = Expression(text, names={}, vectorize=False)
+        _cache[key] = e
+    val = _cache[key].value if _cache[key].constant else _cache[key]()
+    # Callers may modify lists in place
+    if isinstance(val, (list, dict)):
+        return copy.deepcopy(val)
+    return val
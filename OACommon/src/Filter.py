@@ -23,9 +23,54 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from BaseObject import BaseObject
+from Expression import evaluate
+from Expression import compile_expr
 import numpy as np
 
 
+class FilterCache(object):
+
+    """ Cache of the filter conditions evaluated on a data set.
+
+    A single cache is shared by the filters of all the presenters, so that
+    identical conditions are evaluated once for each file. The cache is
+    valid only between the calls to begin() and end(), that are done by
+    Presenter.update(); outside of them nothing is cached. Cached arrays are
+    shared by presenters that may run concurrently, so they are stored as
+    read-only views.
+
+    """
+
+    def __init__(self):
+        """ Constructor. """
+        self._data = None
+        self._results = {}
+
+    def begin(self, data):
+        """ Start caching results for the given data. """
+        self._data = data
+        self._results = {}
+
+    def end(self):
+        """ Drop all cached results. """
+        self._data = None
+        self._results = {}
+
+    def get(self, key, data):
+        """ Return the cached result of a condition, or None. """
+        if data is self._data:
+            return self._results.get(key)
+        return None
+
+    def put(self, key, data, value):
+        """ Store the result of a condition. """
+        if data is self._data:
+            if isinstance(value, np.ndarray):
+                value = value.view()
+                value.flags.writeable = False
+            self._results[key] = value
+
+
 class _Filter(object):
 
     """ Private class that implements all the supported operators. """
@@ -36,6 +81,7 @@ class _Filter(object):
         self.eval = lambda x: False
         self.value = None
         self.operator = 'and'
+        self.key = None
 
     def _lt(self, val):
         """ Compare for less than. """
@@ -95,12 +141,16 @@ class Filter(BaseObject):
 
     """ Implement a filter. """
 
-    def __init__(self, filters):
-        """ Constructor. Expect a dict of parameters for the filter. """
+    def __init__(self, filters, cache=None):
+        """ Constructor. Expect a dict of parameters for the filter and an
+        optional FilterCache shared with the other filters.
+        """
         super(Filter, self).__init__()
         self.name("Filter")
         self.version("1.0")
 
+        self._cache = cache
+
         # Parse filters
         self.filters = []
         for f in filters:
@@ -119,10 +169,16 @@ class Filter(BaseObject):
 
                 # Set value
                 if f['type'] == 'expr':
-                    nf.value = eval("lambda x: " + f['value'], {"__builtins__": None, "np": np}, {})
+                    nf.value = compile_expr(f['value'], ['x'])
                     self.logger.debug("[%s] Adding filter by expression: %s", self.name(), f['value'])
                 else:
-                    nf.value = eval(f['value'], {"__builtins__": None}, {})
+                    nf.value = evaluate(f['value'])
+
+                # Conditions with the same key give the same result
+                if f['type'] == 'expr':
+                    nf.key = (nf.target, 'expr', f['value'].strip())
+                else:
+                    nf.key = (nf.target, nf.eval.func_name, repr(nf.value))
 
                 # Set operator
                 try:
@@ -136,8 +192,24 @@ class Filter(BaseObject):
                 self.logger.debug("[%s] Filter: target = %s, function=%s, operator=%s, value=%s.", self.name(), nf.target, nf.eval.func_name, nf.operator.func_name, str(nf.value))
                 self.filters.append(nf)
 
+    def _condition(self, f, data):
+        """ Evaluate a single condition, using the cache if available. """
+        if self._cache is not None:
+            val = self._cache.get(f.key, data)
+            if val is not None:
+                return val
+
+        val = f.eval(data[f.target].value)
+
+        if self._cache is not None:
+            self._cache.put(f.key, data, val)
+        return val
+
     def evaluate(self, data):
-        """ Evaluate filter conditions. """
+        """ Evaluate filter conditions. Conditions that cannot change the
+        result (i.e. an 'and' after a condition that is never met, or an
+        'or' after one that is always met) are not evaluated.
+        """
         retval = None
         for f in self.filters:
             try:
@@ -147,16 +219,24 @@ class Filter(BaseObject):
                     continue
 
                 # If is the first filter, just store result ...
-                if retval == None:
-                    retval = f.eval(data[f.target].value)
+                if retval is None:
+                    retval = self._condition(f, data)
 
                 # ... otherwise apply the configured operator
                 else:
-                    retval = f.operator(retval, f.eval(data[f.target].value))
+                    op = f.operator.func_name
+                    if op in ('_and', '_nand') and not np.any(retval):
+                        # Result is known: all False for and, all True for nand
+                        retval = np.zeros_like(retval, dtype=np.bool) if op == '_and' else np.ones_like(retval, dtype=np.bool)
+                    elif op in ('_or', '_nor') and np.all(retval):
+                        # Result is known: all True for or, all False for nor
+                        retval = np.ones_like(retval, dtype=np.bool) if op == '_or' else np.zeros_like(retval, dtype=np.bool)
+                    else:
+                        retval = f.operator(retval, self._condition(f, data))
 
             except KeyError, k:
                 self.logger.error("[%s] Cannot find data element '%s' (Error: %s)", self.name(), f.target, k, exc_info=True)
             except Exception as e:
                 self.logger.error("[%s] Exception while evaluating filters (Error: %s)", self.name(), e, exc_info=True)
 
-        return retval
\ No newline at end of file
+        return retval
@@ -22,7 +22,10 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """
 
+import time
+from multiprocessing.pool import ThreadPool
 from BaseObject import BaseObject
+from Checkpoint import Checkpoint
 
 # SQLite benchmarking module
 #import Benchmarking
@@ -30,29 +33,75 @@ from BaseObject import BaseObject
 
 class Presenter(BaseObject):
 
-    """ Call all configured presenters. """
+    """ Call all configured presenters.
 
-    def __init__(self, config):
+    Presenters are independent, so with threads > 1 they are updated
+    concurrently on a pool of threads. The input data and the filter masks
+    are shared by all the presenters, that must not modify them. Outputs
+    are merged in the configured order in any case. The time spent by each
+    presenter in the last update is stored in timings.
+
+    If a checkpoint file is given, the state of the presenters is restored
+    from it at startup and saved to it periodically.
+
+    """
+
+    def __init__(self, config, threads=1, checkpoint=None, period=60.0):
         """ Constructor. """
         super(Presenter, self).__init__()
         self.name("Presenter")
         self.version("1.0")
         self._presenters = config.presenters
+        self._cache = config.filter_cache
+        self._threads = threads
+        self._pool = None
+
+        # Update time of each presenter in the last update
+        self.timings = {}
+
+        # Restore the state of the presenters
+        self._checkpoint = None
+        if checkpoint:
+            self._checkpoint = Checkpoint(checkpoint, period)
+            self._checkpoint.restore(self._presenters)
+
+    def _update(self, pres, data):
+        """ Update a single presenter and return its update time. """
+        t = time.time()
+        pres[1]._update(data)
+        return time.time() - t
 
     #@Benchmarking.sqlite_profile
     def update(self, data):
         """ Update presenters. """
         out = {}
         if data:
-            for pres in self._presenters:
+            # Filter results are shared by the presenters during this update
+            self._cache.begin(data)
+            try:
                 # Update presenters
-                pres[1]._update(data)
-
-                # Get presenter output
-                if pres[1].output is not None:
-                    out.update(pres[1].output)
+                if self._threads > 1 and len(self._presenters) > 1:
+                    # The pool is created at the first update, so that it
+                    # belongs to the process that runs the presenters
+                    if self._pool is None:
+                        self._pool = ThreadPool(self._threads)
+                    t = self._pool.map(lambda p: self._update(p, data), self._presenters, 1)
                 else:
-                    self.logger.debug("[%s] Presenter '%s' has empty output.", self.name(), pres[0])
+                    t = [self._update(p, data) for p in self._presenters]
+                self.timings = dict(zip([p[0] for p in self._presenters], t))
+                self.logger.debug("[%s] Presenter timings: %s", self.name(), ", ".join(["%s [%.1f ms]" % (p[0], self.timings[p[0]] * 1000.0) for p in self._presenters]))
+
+                for pres in self._presenters:
+                    # Get presenter output
+                    if pres[1].output is not None:
+                        out.update(pres[1].output)
+                    else:
+                        self.logger.debug("[%s] Presenter '%s' has empty output.", self.name(), pres[0])
+            finally:
+                self._cache.end()
+
+            if self._checkpoint is not None:
+                self._checkpoint.save(self._presenters)
 
         return out
 
@@ -66,4 +115,16 @@ class Presenter(BaseObject):
                     self.logger.debug("[%s] Resetting presenter '%s'.", self.name(), p[0])
                     p[1]._reset(flags)
             except Exception, e:
-                self.logger.error("[%s] Error calling reset method of presenter '%s' (Error: %s)", self.name(), p[0], e)
\ No newline at end of file
+                self.logger.error("[%s] Error calling reset method of presenter '%s' (Error: %s)", self.name(), p[0], e)
+
+    def close(self):
+        """ Save a last checkpoint and terminate the thread pool. Must be
+        called before the presenter is released or the process exits.
+        """
+        if self._checkpoint is not None:
+            self._checkpoint.save(self._presenters, True)
+            self._checkpoint.wait()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
\ No newline at end of file
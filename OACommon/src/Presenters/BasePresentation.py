@@ -4,7 +4,10 @@
 """
 
 from ..BaseObject import BaseObject
+from ..Expression import evaluate
 from ..DataObj import Metadata
+from ..Buffers import GrowableArray
+from ..Buffers import BunchList
 import numpy as np
 
 
@@ -22,19 +25,34 @@ class BasePresentation(BaseObject):
        should set the name and version of the object.
        After this it can do any specific initialization of the presenter.
 
-    2) update(...): the update function takes as parameter...
+    2) update(...): the update function takes as parameter the filter mask
+       _f and the input datasets. Inputs and mask are shared with the other
+       presenters, that may be updated concurrently, so they must not be
+       modified.
 
     3) reset(): this method will be called when a reset of the preseter is
        requested.
 
     """
 
+    # Attributes holding the accumulated state, saved by get_state()
+    _state = ['output', '_bunches']
+
     def __init__(self, params, filters):
         """ Constructor. """
         super(BasePresentation, self).__init__()
         self.name("BasePresentation")
         self.version("1.0")
 
+        # Configuration fingerprint, used to check saved states
+        self._fingerprint = repr(sorted([(p, params[p]['type'], params[p]['value']) for p in params]))
+
+        # Set when the state changes
+        self.changed = False
+
+        # Size in bytes of the blocks of selected shots copied at once
+        self._block_size = 4 * 1024 * 1024
+
         # Store parameters, splitting params from invars and outvars
         self.params = {}
         self.invars = {}
@@ -44,7 +62,7 @@ class BasePresentation(BaseObject):
             if params[p]['type'] == 'var':
                 # Store input variables
                 try:
-                    t = eval(params[p]['value'], {"__builtins__": None}, {})
+                    t = evaluate(params[p]['value'])
                     if type(t) in (str, unicode):
                         # Single string
                         self.invars[p] = t
@@ -73,7 +91,7 @@ class BasePresentation(BaseObject):
             elif params[p]['type'] == 'tango':
                 # Store output variables
                 try:
-                    t = eval(params[p]['value'], {"__builtins__": None}, {})
+                    t = evaluate(params[p]['value'])
                     if type(t) in (str, unicode):
                         # Single string
                         self.outvars[p] = t
@@ -112,6 +130,31 @@ class BasePresentation(BaseObject):
         # Store filters
         self.filters = filters
 
+        # Limit on the number of values kept by presenters that accumulate a
+        # history, and policy used when the limit is reached
+        self._maxsize = None
+        if 'maxsize' in self.params:
+            try:
+                m = evaluate(self.params['maxsize'])
+                assert(type(m) in (int, long))
+                if m > 0:
+                    self._maxsize = m
+            except Exception, e:
+                self.logger.error("[%s] Cannot evaluate 'maxsize' parameter. Ignoring (Error: %s)", self.name(), e)
+
+        self._policy = self.params.get('policy', 'drop')
+        if self._policy not in ('drop', 'decimate'):
+            self.logger.error("[%s] Unknown history policy '%s'. Using 'drop'.", self.name(), self._policy)
+            self._policy = 'drop'
+
+        # Bunch numbers, shared by all the outputs
+        self._bunches = None
+
+        # Precision of the accumulators of summing and averaging presenters
+        self._dtype = np.float32
+        if self.params.get('precision', 'float32') == 'float64':
+            self._dtype = np.float64
+
     def _update(self, data):
         """ Update wrapper. Handle all the common stuff. """
 
@@ -154,16 +197,21 @@ class BasePresentation(BaseObject):
 
             # 4) Call update
             self.logger.debug("[%s] Updating presenter.", self.name())
+            self.changed = True
             self.update(_f=f, **args)
 
             # 5) Append bunch numbers
             if 'bunches' in self.invars:
                 self.logger.debug("[%s] Adding %s bunch numbers to output.", self.name(), data[self.invars['bunches']].value[f])
 
+                # A new list is started when all the outputs have been
+                # created again
+                if self._bunches is None or not any([hasattr(self.output[v], 'bunches') for v in self.output]):
+                    self._bunches = BunchList(data[self.invars['bunches']].value.dtype, self._maxsize, self._policy)
+                self._bunches.append(data[self.invars['bunches']].value[f])
+
                 for v in self.output:
-                    if not hasattr(self.output[v], 'bunches'):
-                        self.output[v].bunches = np.ndarray(shape=(0,), dtype=data[self.invars['bunches']].value.dtype)
-                    self.output[v].bunches = np.append(self.output[v].bunches, data[self.invars['bunches']].value[f])
+                    self.output[v].bunches = self._bunches
 
         except KeyError as k:
             self.logger.error("[%s] Key error in update (Error: %s)", self.name(), k)
@@ -174,6 +222,7 @@ class BasePresentation(BaseObject):
         """ Reset presenter. """
         if all(flags):
             self.output = None
+            self._bunches = None
         elif self.output is not None:
             tags = self.output_tag
             for o in tags:
@@ -182,6 +231,56 @@ class BasePresentation(BaseObject):
 
         # Run custom reset
         self.reset(flags)
+        self.changed = True
+
+    def fingerprint(self):
+        """ Return a string identifying the configuration of the presenter.
+        """
+        return "%s:%s" % (self.name(), self._fingerprint)
+
+    def get_state(self):
+        """ Return a dict with the accumulated state of the presenter. """
+        state = {}
+        for c in type(self).__mro__:
+            for k in c.__dict__.get('_state', []):
+                state[k] = getattr(self, k, None)
+        return state
+
+    def set_state(self, state):
+        """ Restore a state returned by get_state(). """
+        for k in state:
+            setattr(self, k, state[k])
+
+    def _history(self, dtype):
+        """ Return a new growable array for a history of values, limited
+        according to the 'maxsize' and 'policy' parameters.
+        """
+        return GrowableArray(dtype, maxsize=self._maxsize, policy=self._policy)
+
+    def _running_average(self, acc, values, mask, alpha):
+        """ Update in place the exponential running average acc with the
+        shots of values selected by mask, in order. The result is the same
+        as applying acc = alpha * acc + (1 - alpha) * x for each shot, but
+        is computed as a weighted sum with the weights
+        (1 - alpha) * alpha ** (k - 1 - i) of the k selected shots. When the
+        selected shots are not contiguous they are gathered in blocks of
+        bounded size. Return k.
+        """
+        idx = np.flatnonzero(mask)
+        k = idx.shape[0]
+        if k == 0:
+            return 0
+
+        w = ((1 - alpha) * np.power(alpha, np.arange(k - 1, -1, -1, dtype=np.float64))).astype(acc.dtype)
+        acc *= alpha ** k
+        if idx[-1] - idx[0] + 1 == k:
+            # Contiguous shots, reduce the view
+            acc += np.einsum('i,i...->...', w, values[idx[0]:idx[-1] + 1], dtype=acc.dtype, casting='unsafe')
+        else:
+            step = max(1, self._block_size / max(1, values[0].nbytes))
+            for i in range(0, k, step):
+                acc += np.einsum('i,i...->...', w[i:i + step], values[idx[i:i + step]], dtype=acc.dtype, casting='unsafe')
+        return k
 
     def update(self, _f, **kwargs):
         """ Default update function. Do nothing. """
@@ -191,6 +290,20 @@ class BasePresentation(BaseObject):
         """ Default reset function. Do nothing. """
         pass
 
+    def input_names(self):
+        """ Return the list of the names of all the variables needed by the
+        presenter, including the targets of the filters.
+        """
+        names = []
+        for v in self.invars:
+            if type(self.invars[v]) is list:
+                names += self.invars[v]
+            else:
+                names.append(self.invars[v])
+        for f in self.filters.filters:
+            names.append(f.target)
+        return names
+
     def output_tag(self):
         """ Return output flags. """
         out = []
@@ -25,6 +25,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import numpy as np
 
 from BasePresentation import BasePresentation
+from ..Expression import evaluate
 from ..DataObj import Image
 
 
@@ -34,6 +35,9 @@ class ImageSum(BasePresentation):
     running average.
     """
 
+    # Accumulated state
+    _state = ['image', 'counter']
+
     def __init__(self, params, filters):
         """ Constructor. """
         super(ImageSum, self).__init__(params, filters)
@@ -58,9 +62,9 @@ class ImageSum(BasePresentation):
 
             elif self.params['mode'] == 'runavg':
                 # Running average
-                a = int(eval(self.params['avg'], {"__builtins__": None}, {}))
+                a = int(evaluate(self.params['avg']))
                 if a > 0:
-                    self.params['alpha'] = (a - 1) / a
+                    self.params['alpha'] = (a - 1) / float(a)
 
                 else:
                     raise Exception("wrong value for 'avg' parameter (%d)" % (a, ))
@@ -93,20 +97,17 @@ class ImageSum(BasePresentation):
 
         if self.image is None or self.image.shape != target.value.shape[1:]:
             # Empty output or size does not match. Reset image.
-            self.image = np.zeros(target.value.shape[1:], dtype=np.float32)
+            self.image = np.zeros(target.value.shape[1:], dtype=self._dtype)
             self.counter = 0
 
         if self.params['mode'] == 'runavg':
-            # Running average: out = old * alpha + new * (1 - alpha)
-            for i in range(target.value.shape[0]):
-                if _f[i]:
-                    self.image[:] = self.image[:] * self.params['alpha'] + target.value[i] * (1 - self.params['alpha'])
-                    self.counter += 1
+            # Running average: out = old * alpha + new * (1 - alpha) for each shot
+            self.counter += self._running_average(self.image, target.value, _f, self.params['alpha'])
             self.output[oname].value = self.image
 
         else:
             # Normal average. Sum up the images and store in output the image divided by the counter
-            self.image[:] += np.sum(target.value[_f], axis=0, dtype=np.float32)
+            self.image[:] += np.sum(target.value[_f], axis=0, dtype=self._dtype)
             self.counter += np.sum(_f)
 
             if self.params['mode'] == 'avg':
@@ -144,6 +145,20 @@ class ImageSum(BasePresentation):
             'delegate': None
         }
 
+        # Accumulator precision
+        delegates['precision'] = {
+            'mandatory': False,
+            'type': 'list',
+            'dtype': 'str',
+            'default': 'float32',
+            'label': 'Precision',
+            'delegate': {
+                'type': 'ComboboxDelegate',
+                'values': ['float32', 'float64'],
+                'labels': ['Single', 'Double']
+            }
+        }
+
         return delegates
 
 
@@ -151,6 +166,9 @@ class ImageBackground(BasePresentation):
 
     """ ... """
 
+    # Accumulated state
+    _state = ['image', 'background', 'img_counter', 'bkg_counter']
+
     def __init__(self, params, filters):
         """ Constructor. """
         super(ImageBackground, self).__init__(params, filters)
@@ -170,9 +188,9 @@ class ImageBackground(BasePresentation):
 
             elif self.params['mode'] == 'runavg':
                 # Running average
-                a = int(eval(self.params['avg'], {"__builtins__": None}, {}))
+                a = int(evaluate(self.params['avg']))
                 if a > 0:
-                    self.params['alpha'] = (a - 1) / a
+                    self.params['alpha'] = (a - 1) / float(a)
                 else:
                     raise Exception("wrong value for 'avg' parameter (%d)" % (a, ))
 
@@ -211,27 +229,22 @@ class ImageBackground(BasePresentation):
 
         if self.image is None or self.image.shape != target.value.shape[1:]:
             # Empty output or size does not match. Reset image.
-            self.image = np.zeros(target.value.shape[1:], dtype=np.float32)
+            self.image = np.zeros(target.value.shape[1:], dtype=self._dtype)
             self.background = np.copy(self.image)
             self.img_counter = 0
             self.bkg_counter = 0
 
         if self.params['mode'] == 'runavg':
-            # Running average: out = old * alpha + new * (1 - alpha)
-            for i in range(target.value.shape[0]):
-                if _on[i]:
-                    self.image[:] = self.image[:] * self.params['alpha'] + target.value[i] * (1 - self.params['alpha'])
-                    self.img_counter += 1
-                elif _off[i]:
-                    self.background[:] = self.background[:] * self.params['alpha'] + target.value[i] * (1 - self.params['alpha'])
-                    self.bkg_counter += 1
+            # Running average: out = old * alpha + new * (1 - alpha) for each shot
+            self.img_counter += self._running_average(self.image, target.value, _on, self.params['alpha'])
+            self.bkg_counter += self._running_average(self.background, target.value, _off, self.params['alpha'])
             self.output[oname].value = self.image - self.background
 
         else:
             # Normal average. Sum up the images and store in output the image divided by the counter
-            self.image[:] += np.sum(target.value[_on], axis=0, dtype=np.float32)
+            self.image[:] += np.sum(target.value[_on], axis=0, dtype=self._dtype)
             self.img_counter += np.sum(_on)
-            self.background[:] += np.sum(target.value[_off], axis=0, dtype=np.float32)
+            self.background[:] += np.sum(target.value[_off], axis=0, dtype=self._dtype)
             self.bkg_counter += np.sum(_off)
             self.output[oname].value = self.image / self.img_counter - self.background / self.bkg_counter
 
@@ -282,4 +295,18 @@ class ImageBackground(BasePresentation):
             'delegate': None
         }
 
+        # Accumulator precision
+        delegates['precision'] = {
+            'mandatory': False,
+            'type': 'list',
+            'dtype': 'str',
+            'default': 'float32',
+            'label': 'Precision',
+            'delegate': {
+                'type': 'ComboboxDelegate',
+                'values': ['float32', 'float64'],
+                'labels': ['Single', 'Double']
+            }
+        }
+
         return delegates
\ No newline at end of file
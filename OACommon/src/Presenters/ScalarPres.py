@@ -22,17 +22,26 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """
 
-import inspect
+import time
+import collections
 import numpy as np
 
 from BasePresentation import BasePresentation
+from ..Expression import evaluate
 from ..DataObj import Scalar
 from ..DataObj import Array
+from ..DataObj import Image
+from ..DataObj import RingArray
+from ..Statistics import RunningStats
 
 
 class ScalarTrend(BasePresentation):
 
     """ Store and present the trend of a scalar value
+
+    The last 'size' values are kept in a circular buffer. Until the buffer is
+    full the values not yet filled are zero.
+
     """
 
     def __init__(self, parameters, filters):
@@ -41,12 +50,9 @@ class ScalarTrend(BasePresentation):
         self.name("ScalarTrend")
         self.version("1.0")
 
-        # Init variables
-        self.reset([])
-
         # Check parameters
         try:
-            s = int(eval(self.params['size'], {"__builtins__": None}, {}))
+            s = int(evaluate(self.params['size']))
             if s > 0:
                 self.params['size'] = s
             else:
@@ -55,9 +61,10 @@ class ScalarTrend(BasePresentation):
             self.logger.error("[%s] Cannot evaluate the size parameter. Setting size to 500. (Error: %s)", self.name(), e)
             self.params['size'] = 500
 
-    def reset(self, flags):
-        """ Reset presenter. """
-        self.index = 0
+        # Keep only the bunch numbers of the values in the trend
+        if self._maxsize is None:
+            self._maxsize = self.params['size']
+            self._policy = 'drop'
 
     def update(self, _f, target, **kwargs):
         """ Update presenter. """
@@ -70,33 +77,14 @@ class ScalarTrend(BasePresentation):
 
         if self.output is None:
             self.output = {}
-            self.output[oname] = Array()
-            self.output[oname].value = np.zeros((self.params['size'], ), dtype=target.value.dtype)
-            self.index = 0
+            self.output[oname] = RingArray(self.params['size'], target.value.dtype)
 
         # Number of values to insert
         n = np.sum(_f)
         self.logger.debug("[%s] Adding %d values to presenter.", self.name(), n)
 
-        if self.params['size'] - self.index >= n:
-            # Array not filled yet
-            self.output[oname].value[self.index:(self.index + n)] = target.value[_f]
-            self.index += n
-
-        elif self.params['size'] == self.index:
-            # Shift by n
-            self.output[oname].value[0:-n] = self.output[oname].value[n:]
-            # Set the value as the last n elements
-            self.output[oname].value[-n:] = target.value[_f]
-
-        else:
-            # Shift by m = n - (size - index)
-            m = n - (self.params['size'] - self.index)
-            self.output[oname].value[0:-m] = self.output[oname].value[m:]
-            # Set the value as the last n elements
-            self.output[oname].value[-n:] = target.value[_f]
-            # Set index equal to size
-            self.index = self.params['size']
+        # Once the buffer is full, the oldest values are overwritten
+        self.output[oname].append(target.value[_f])
 
     @staticmethod
     def configure():
@@ -116,9 +104,38 @@ class ScalarTrend(BasePresentation):
         return delegates
 
 
+def _bin_index(values, lo, hi, nbins):
+    """ Return the index of the uniform bin between lo and hi of each value,
+    and the mask of the values inside the range. As in np.histogram, the
+    last bin includes its right edge.
+    """
+    idx = np.floor((values - lo) * (nbins / float(hi - lo)))
+    idx[values == hi] = nbins - 1
+    valid = np.logical_and(idx >= 0, idx < nbins)
+    return (np.intp(idx[valid]), valid)
+
+
+def _bin_centers(lo, hi, nbins):
+    """ Return the centers of nbins uniform bins between lo and hi. """
+    return lo + (np.arange(nbins) + 0.5) * ((hi - lo) / float(nbins))
+
+
+def _values(var, _f, n):
+    """ Return the filtered values of a Scalar, or the value of a Metadata
+    repeated for each selected shot.
+    """
+    if var.name() == "Metadata":
+        return np.tile(var.value, n)
+    return var.value[_f]
+
+
 class ScalarHistogram(BasePresentation):
 
     """ Create a histogram of a scalar value
+
+    Bins are uniform, so that the bin of each value is computed directly and
+    the counts are accumulated with np.bincount.
+
     """
 
     def __init__(self, parameters, filters):
@@ -132,9 +149,12 @@ class ScalarHistogram(BasePresentation):
 
         # Check parameters
         try:
-            lim = eval(self.params['range'], {"__builtins__": None}, {})
-            nbins = eval(self.params['bins'], {"__builtins__": None}, {})
-            self.params['bins'] = np.linspace(lim[0], lim[1], nbins + 1)
+            lim = evaluate(self.params['range'])
+            nbins = evaluate(self.params['bins'])
+            assert(lim[0] < lim[1])
+            assert(nbins > 0)
+            self.params['range'] = (lim[0], lim[1])
+            self.params['bins'] = nbins
 
         except Exception, e:
             self.logger.error("[%s] Failed to parse range and bins (Error: %s)", self.name(), e)
@@ -146,14 +166,17 @@ class ScalarHistogram(BasePresentation):
         oname = self.outvars['output']
 
         if self.params['bins'] is not None:
-            h = np.histogram(target.value[_f], self.params['bins'])
+            (lo, hi) = self.params['range']
+            nbins = self.params['bins']
+            (idx, valid) = _bin_index(target.value[_f], lo, hi, nbins)
+            h = np.bincount(idx, minlength=nbins)
             if self.output is None:
                 self.output = {}
                 self.output[oname] = Array()
-                self.output[oname].value = np.int32(h[0])
-                self.output[oname]._x = np.mean(np.vstack((h[1][0:-1], h[1][1:])), axis=0)
+                self.output[oname].value = np.int32(h)
+                self.output[oname]._x = _bin_centers(lo, hi, nbins)
             else:
-                self.output[oname].value += np.int32(h[0])
+                self.output[oname].value += np.int32(h)
 
     @staticmethod
     def configure():
@@ -184,11 +207,249 @@ class ScalarHistogram(BasePresentation):
         return delegates
 
 
+class ScalarHistogramAuto(BasePresentation):
+
+    """ Create a histogram of a scalar value with automatic range
+
+    The initial range is set by the first values received. When a value
+    falls outside the range, the range is doubled towards it and pairs of
+    adjacent bins are merged, so that the number of bins stays constant and
+    the counts are preserved exactly.
+
+    """
+
+    # Accumulated state
+    _state = ['range', 'counts']
+
+    def __init__(self, parameters, filters):
+        """ Constructor. """
+        super(ScalarHistogramAuto, self).__init__(parameters, filters)
+        self.name("ScalarHistogramAuto")
+        self.version("1.0")
+
+        # Init variables
+        self.reset([])
+
+        # Check parameters
+        try:
+            nbins = evaluate(self.params.get('bins', '100'))
+            assert(type(nbins) in (int, long) and nbins > 1)
+            # Merging pairs of bins requires an even number of bins
+            self.params['bins'] = nbins + nbins % 2
+
+        except Exception, e:
+            self.logger.error("[%s] Failed to parse bins. Using 100 bins (Error: %s)", self.name(), e)
+            self.params['bins'] = 100
+
+    def reset(self, flags):
+        """ Reset presenter. """
+        self.range = None
+        self.counts = None
+
+    def _grow(self, vmin, vmax):
+        """ Extend the range until it contains [vmin, vmax]. """
+        nbins = self.params['bins']
+        (lo, hi) = self.range
+        while vmin < lo or vmax >= hi:
+            merged = self.counts.reshape(nbins / 2, 2).sum(axis=1)
+            self.counts[:] = 0
+            if vmin < lo:
+                lo -= (hi - lo)
+                self.counts[nbins / 2:] = merged
+            else:
+                hi += (hi - lo)
+                self.counts[:nbins / 2] = merged
+        self.range = (lo, hi)
+
+    def update(self, _f, target, **kwargs):
+        """ Update presenter. """
+        # Get output name
+        oname = self.outvars['output']
+
+        values = target.value[_f]
+        values = values[np.isfinite(values)]
+        if values.shape[0] == 0:
+            return
+
+        nbins = self.params['bins']
+        vmin = values.min()
+        vmax = values.max()
+
+        if self.output is None or self.counts is None:
+            self.output = {}
+            self.output[oname] = Array()
+            self.counts = np.zeros((nbins, ), dtype=np.int32)
+            if vmax > vmin:
+                self.range = (float(vmin), float(vmax) + (vmax - vmin) / float(nbins - 1))
+            else:
+                self.range = (float(vmin) - 0.5, float(vmin) + 0.5)
+
+        # Extend range if needed
+        if vmin < self.range[0] or vmax >= self.range[1]:
+            self._grow(vmin, vmax)
+            self.output[oname]._x = None
+
+        (lo, hi) = self.range
+        (idx, valid) = _bin_index(values, lo, hi, nbins)
+        self.counts += np.int32(np.bincount(idx, minlength=nbins))
+
+        self.output[oname].value = self.counts
+        if getattr(self.output[oname], '_x', None) is None:
+            self.output[oname]._x = _bin_centers(lo, hi, nbins)
+
+    @staticmethod
+    def configure():
+        """ Custom parameters configuration. """
+        delegates = {}
+
+        # Number of bins
+        delegates['bins'] = {
+            'mandatory': True,
+            'type': 'expr',
+            'dtype': 'int',
+            'default': 100,
+            'label': 'Number of bins',
+            'delegate': None
+        }
+
+        return delegates
+
+
+class ScalarHistogram2D(BasePresentation):
+
+    """ Create a 2D histogram of a scalar value versus another
+
+    The output is an image with the counts of y (rows) versus x (columns).
+    Bins are uniform and counts are accumulated with np.bincount. X and Y
+    may also be Metadata, whose value is used for all the shots.
+
+    """
+
+    def __init__(self, params, filters):
+        """ Constructor. """
+        super(ScalarHistogram2D, self).__init__(params, filters)
+        self.name("ScalarHistogram2D")
+        self.version("1.0")
+
+        # Check parameters
+        self._bins = None
+        try:
+            for ax in ('x', 'y'):
+                lim = evaluate(self.params[ax + 'range'])
+                nbins = evaluate(self.params[ax + 'bins'])
+                assert(lim[0] < lim[1])
+                assert(nbins > 0)
+                self.params[ax + 'range'] = (lim[0], lim[1])
+                self.params[ax + 'bins'] = nbins
+            self._bins = (self.params['ybins'], self.params['xbins'])
+
+        except Exception, e:
+            self.logger.error("[%s] Failed to parse ranges and bins (Error: %s)", self.name(), e)
+
+    def update(self, _f, x, y, **kwargs):
+        """ Update presenter. """
+        # Get output name
+        oname = self.outvars['output']
+
+        if self._bins is None:
+            return
+
+        for v in (x, y):
+            if v.name() not in ("Scalar", "Metadata"):
+                self.logger.error("[%s] X and Y variables should be of type Scalar or Metadata. Found '%s'.", self.name(), v.name())
+                return
+
+        n = np.sum(_f)
+        xv = _values(x, _f, n)
+        yv = _values(y, _f, n)
+
+        # Bin indexes of the points inside both ranges
+        (xlo, xhi) = self.params['xrange']
+        (ylo, yhi) = self.params['yrange']
+        (ix, xvalid) = _bin_index(xv, xlo, xhi, self._bins[1])
+        (iy, yvalid) = _bin_index(yv, ylo, yhi, self._bins[0])
+        valid = np.logical_and(xvalid, yvalid)
+        idx = iy[valid[yvalid]] * self._bins[1] + ix[valid[xvalid]]
+        h = np.bincount(idx, minlength=self._bins[0] * self._bins[1]).reshape(self._bins)
+
+        if self.output is None:
+            self.output = {}
+            self.output[oname] = Image()
+            self.output[oname].value = np.int32(h)
+            self.output[oname]._x = _bin_centers(xlo, xhi, self._bins[1])
+            self.output[oname]._y = _bin_centers(ylo, yhi, self._bins[0])
+        else:
+            self.output[oname].value += np.int32(h)
+
+    @staticmethod
+    def configure():
+        """ Custom parameters configuration. """
+        delegates = {}
+
+        # Remove target
+        delegates['target'] = None
+
+        # X source
+        delegates['x'] = {
+            'mandatory': True,
+            'type': 'var',
+            'dtype': 'str',
+            'label': 'X',
+            'delegate': None
+        }
+
+        # Y source
+        delegates['y'] = {
+            'mandatory': True,
+            'type': 'var',
+            'dtype': 'str',
+            'label': 'Y',
+            'delegate': None
+        }
+
+        # Bins and ranges
+        for ax in ('x', 'y'):
+            delegates[ax + 'bins'] = {
+                'mandatory': True,
+                'type': 'expr',
+                'dtype': 'int',
+                'default': 100,
+                'label': 'Number of %s bins' % ax.upper(),
+                'delegate': None
+            }
+
+            delegates[ax + 'range'] = {
+                'mandatory': True,
+                'type': 'expr',
+                'dtype': 'list>num',
+                'label': '%s range' % ax.upper(),
+                'delegate': {
+                    'type': 'RangeInputDelegate',
+                    'm': 1,
+                }
+            }
+
+        return delegates
+
+
 class ScalarStatistics(BasePresentation):
 
-    """ Keep history of a scalar value and present statistics about it.
+    """ Present running statistics of a scalar value.
+
+    Mean and standard deviation are exact, while median and the optional
+    percentiles are estimated with a quantile sketch (see RunningStats), so
+    that no history of the values is kept.
+
+    By default the statistics cover all the values since the last reset.
+    With the 'window' (number of shots) or 'period' (seconds) parameters
+    only the most recent files are used. The window moves by whole files,
+    so it may contain slightly more shots than requested.
+
     """
 
+    # Accumulated state
+    _state = ['stats', 'parts']
+
     def __init__(self, params, filters):
         """ Constructor. """
         super(ScalarStatistics, self).__init__(params, filters)
@@ -198,8 +459,32 @@ class ScalarStatistics(BasePresentation):
         # Init variables
         self.reset([])
 
+        # Percentiles
+        self._percentiles = []
+        if 'percentiles' in self.params:
+            try:
+                p = evaluate(self.params['percentiles'])
+                assert(type(p) is list)
+                for el in p:
+                    assert(type(el) in (int, long, float) and 0 <= el <= 100)
+                self._percentiles = p
+            except Exception, e:
+                self.logger.error("[%s] Cannot evaluate 'percentiles' parameter. Ignoring (Error: %s)", self.name(), e)
+
+        # Window
+        self._window = 0
+        self._period = 0
+        for (p, default) in (('window', 0), ('period', 0)):
+            if p in self.params:
+                try:
+                    val = evaluate(self.params[p])
+                    assert(type(val) in (int, long, float) and val >= 0)
+                    setattr(self, '_' + p, val)
+                except Exception, e:
+                    self.logger.error("[%s] Cannot evaluate '%s' parameter. Ignoring (Error: %s)", self.name(), p, e)
+
         # Stat functions
-        func = ["mean", "std", "median"]
+        func = ["mean", "std", "median"] + ["p%g" % el for el in self._percentiles]
 
         # Check parameters
         try:
@@ -209,7 +494,7 @@ class ScalarStatistics(BasePresentation):
             if self.params['prefix'] != "":
                 for f in func:
                     self.params['out'].append(self.params['prefix'] + "_" + f)
-                    self.params['func'].append(getattr(np, f))
+                    self.params['func'].append(f)
 
         except Exception, e:
             self.logger.error("[%s] Error initializing presenter (Error: %s)", self.name(), e)
@@ -219,7 +504,19 @@ class ScalarStatistics(BasePresentation):
 
     def reset(self, flags):
         """ Reset presenter. """
-        self.history = None
+        self.stats = None
+        self.parts = collections.deque()
+
+    def _evaluate(self, stats, f):
+        """ Return the value of the statistic f. """
+        if f == 'mean':
+            return stats.mean if stats.count > 0 else np.nan
+        elif f == 'std':
+            return stats.std()
+        elif f == 'median':
+            return stats.median()
+        else:
+            return stats.quantile(float(f[1:]) / 100.0)
 
     def update(self, _f, target, **kwargs):
         """ Update presenter. """
@@ -227,17 +524,41 @@ class ScalarStatistics(BasePresentation):
             self.output = {}
             for i in range(len(self.params['out'])):
                 self.output[self.params['out'][i]] = Scalar()
-            self.history = np.ndarray(shape=(0,), dtype=target.value.dtype)
+            self.reset([])
+
+        if self._window > 0 or self._period > 0:
+            # Keep the statistics of each file in the window
+            part = RunningStats()
+            part.update(target.value[_f])
+            now = time.time()
+            self.parts.append((now, part))
+
+            count = sum([p[1].count for p in self.parts])
+            while len(self.parts) > 1:
+                (t, p) = self.parts[0]
+                if self._window > 0 and count - p.count >= self._window:
+                    count -= p.count
+                    self.parts.popleft()
+                elif self._period > 0 and now - t > self._period:
+                    count -= p.count
+                    self.parts.popleft()
+                else:
+                    break
+
+            stats = RunningStats()
+            for p in self.parts:
+                stats.merge(p[1])
 
-        # Update history
-        self.history = np.append(self.history, target.value[_f])
+        else:
+            # Accumulate all the values
+            if self.stats is None:
+                self.stats = RunningStats()
+            self.stats.update(target.value[_f])
+            stats = self.stats
 
         # Store stats
         for i in range(len(self.params['out'])):
-            if 'dtype' in inspect.getargspec(self.params['func'][i]).args:
-                self.output[self.params['out'][i]].value = self.params['func'][i](self.history, dtype=np.float64)
-            else:
-                self.output[self.params['out'][i]].value = self.params['func'][i](self.history)
+            self.output[self.params['out'][i]].value = np.float64(self._evaluate(stats, self.params['func'][i]))
 
     @staticmethod
     def configure():
@@ -255,12 +576,49 @@ class ScalarStatistics(BasePresentation):
 
         delegates['output'] = None
 
+        # Additional percentiles
+        delegates['percentiles'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'list>num',
+            'label': 'Percentiles',
+            'delegate': None
+        }
+
+        # Window size in shots
+        delegates['window'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'int',
+            'default': 0,
+            'label': 'Window (shots)',
+            'delegate': None
+        }
+
+        # Window size in seconds
+        delegates['period'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'num',
+            'default': 0,
+            'label': 'Window (seconds)',
+            'delegate': None
+        }
+
         return delegates
 
 
 class Scatter(BasePresentation):
 
-    """ Build up data for a scatter plot. """
+    """ Build up data for a scatter plot.
+
+    The number of points may be limited with the 'maxsize' and 'policy'
+    parameters.
+
+    """
+
+    # Accumulated state
+    _state = ['_hx', '_hy']
 
     def __init__(self, params, filters):
         """ Constructor. """
@@ -284,26 +642,29 @@ class Scatter(BasePresentation):
         if self.output is None:
             self.output = {}
             self.output[oname] = Array()
-            self.output[oname]._x = np.zeros(shape=(0,), dtype=x.value.dtype)
-            self.output[oname].value = np.zeros(shape=(0,), dtype=y.value.dtype)
+            self._hx = self._history(x.value.dtype)
+            self._hy = self._history(y.value.dtype)
 
         # Apped data
         if x.name() == "Metadata" and y.name() == "Metadata":
             # Scatter plot of metadata values
-            self.output[oname]._x = np.append(self.output[oname]._x, x.value)
-            self.output[oname].value = np.append(self.output[oname].value, y.value)
+            self._hx.append(x.value)
+            self._hy.append(y.value)
 
         elif x.name() == "Metadata" and y.name() != "Metadata":
-            self.output[oname]._x = np.append(self.output[oname]._x, np.tile(x.value, np.sum(_f)))
-            self.output[oname].value = np.append(self.output[oname].value, y.value[_f])
+            self._hx.append(np.tile(x.value, np.sum(_f)))
+            self._hy.append(y.value[_f])
 
         elif x.name() != "Metadata" and y.name() == "Metadata":
-            self.output[oname]._x = np.append(self.output[oname]._x, x.value[_f])
-            self.output[oname].value = np.append(self.output[oname].value, np.tile(y.value, np.sum(_f)))
+            self._hx.append(x.value[_f])
+            self._hy.append(np.tile(y.value, np.sum(_f)))
 
         else:
-            self.output[oname]._x = np.append(self.output[oname]._x, x.value[_f])
-            self.output[oname].value = np.append(self.output[oname].value, y.value[_f])
+            self._hx.append(x.value[_f])
+            self._hy.append(y.value[_f])
+
+        self.output[oname]._x = self._hx.data()
+        self.output[oname].value = self._hy.data()
 
     @staticmethod
     def configure():
@@ -331,4 +692,28 @@ class Scatter(BasePresentation):
             'delegate': None
         }
 
+        # History size limit
+        delegates['maxsize'] = {
+            'mandatory': False,
+            'type': 'expr',
+            'dtype': 'int',
+            'default': 0,
+            'label': 'Max. history size',
+            'delegate': None
+        }
+
+        # Policy when the size limit is reached
+        delegates['policy'] = {
+            'mandatory': False,
+            'type': 'list',
+            'dtype': 'str',
+            'default': 'drop',
+            'label': 'History policy',
+            'delegate': {
+                'type': 'ComboboxDelegate',
+                'values': ['drop', 'decimate'],
+                'labels': ['Drop oldest', 'Decimate']
+            }
+        }
+
         return delegates
\ No newline at end of file
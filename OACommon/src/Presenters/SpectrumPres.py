@@ -25,6 +25,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import numpy as np
 
 from BasePresentation import BasePresentation
+from ..Expression import evaluate
 from ..DataObj import Array
 
 
@@ -34,6 +35,9 @@ class SpectrumSum(BasePresentation):
 
     """
 
+    # Accumulated state
+    _state = ['spectrum', 'counter']
+
     def __init__(self, parameters, filters):
         """ __init__(): class constructor
         """
@@ -59,9 +63,9 @@ class SpectrumSum(BasePresentation):
 
             elif self.params['mode'] == 'runavg':
                 # Running average
-                a = int(eval(self.params['avg'], {"__builtins__": None}, {}))
+                a = int(evaluate(self.params['avg']))
                 if a > 0:
-                    self.params['alpha'] = (a - 1) / a
+                    self.params['alpha'] = (a - 1) / float(a)
                 else:
                     raise Exception("wrong value for 'avg' parameter (%d)" % (a, ))
 
@@ -76,7 +80,7 @@ class SpectrumSum(BasePresentation):
         # Mass calibration
         if 'calibration' in self.params:
             try:
-                v = eval(self.params['calibration'], {"__builtins__": None}, {})
+                v = evaluate(self.params['calibration'])
                 if type(v) is not list:
                     raise Exception("calibration parameter did not evaluate to a list")
                 if len(v) == 0:
@@ -116,7 +120,7 @@ class SpectrumSum(BasePresentation):
 
         if self.spectrum is None or self.spectrum.shape != target.value.shape[1:]:
             # Empty output or size does not match. Reset image.
-            self.spectrum = np.zeros(target.value.shape[1:], dtype=np.float32)
+            self.spectrum = np.zeros(target.value.shape[1:], dtype=self._dtype)
             self.counter = 0
 
             # Create calibrated mass axis
@@ -127,16 +131,13 @@ class SpectrumSum(BasePresentation):
                 self.output[oname]._x = np.sign(t - t0) * np.power((t - t0) / tk, 2)
 
         if self.params['mode'] == 'runavg':
-            # Running average: out = old * alpha + new * (1 - alpha)
-            for i in range(target.value.shape[0]):
-                if _f[i]:
-                    self.spectrum[:] = self.spectrum[:] * self.params['alpha'] + target.value[i] * (1 - self.params['alpha'])
-                    self.counter += 1
+            # Running average: out = old * alpha + new * (1 - alpha) for each shot
+            self.counter += self._running_average(self.spectrum, target.value, _f, self.params['alpha'])
             self.output[oname].value = self.spectrum
 
         else:
             # Normal average. Sum up the images and store in output the image divided by the counter
-            self.spectrum[:] += np.sum(target.value[_f], axis=0, dtype=np.float32)
+            self.spectrum[:] += np.sum(target.value[_f], axis=0, dtype=self._dtype)
             self.counter += np.sum(_f)
 
             if self.params['mode'] == 'avg':
@@ -185,6 +186,20 @@ class SpectrumSum(BasePresentation):
             'delegate': None
         }
 
+        # Accumulator precision
+        delegates['precision'] = {
+            'mandatory': False,
+            'type': 'list',
+            'dtype': 'str',
+            'default': 'float32',
+            'label': 'Precision',
+            'delegate': {
+                'type': 'ComboboxDelegate',
+                'values': ['float32', 'float64'],
+                'labels': ['Single', 'Double']
+            }
+        }
+
         return delegates
 
 
@@ -192,6 +207,9 @@ class SpectrumBackground(BasePresentation):
 
     """ ... """
 
+    # Accumulated state
+    _state = ['spectrum', 'background', 'spectrum_counter', 'bkg_counter']
+
     def __init__(self, params, filters):
         """ Constructor. """
         super(SpectrumBackground, self).__init__(params, filters)
@@ -211,9 +229,9 @@ class SpectrumBackground(BasePresentation):
 
             elif self.params['mode'] == 'runavg':
                 # Running average
-                a = int(eval(self.params['avg'], {"__builtins__": None}, {}))
+                a = int(evaluate(self.params['avg']))
                 if a > 0:
-                    self.params['alpha'] = (a - 1) / a
+                    self.params['alpha'] = (a - 1) / float(a)
                 else:
                     raise Exception("wrong value for 'avg' parameter (%d)" % (a, ))
 
@@ -252,27 +270,22 @@ class SpectrumBackground(BasePresentation):
 
         if self.spectrum is None or self.spectrum.shape != target.value.shape[1:]:
             # Empty output or size does not match. Reset spectrum.
-            self.spectrum = np.zeros(target.value.shape[1:], dtype=np.float32)
+            self.spectrum = np.zeros(target.value.shape[1:], dtype=self._dtype)
             self.background = np.copy(self.spectrum)
             self.spectrum_counter = 0
             self.bkg_counter = 0
 
         if self.params['mode'] == 'runavg':
-            # Running average: out = old * alpha + new * (1 - alpha)
-            for i in range(target.value.shape[0]):
-                if _on[i]:
-                    self.spectrum[:] = self.spectrum[:] * self.params['alpha'] + target.value[i] * (1 - self.params['alpha'])
-                    self.spectrum_counter += 1
-                elif _off[i]:
-                    self.background[:] = self.background[:] * self.params['alpha'] + target.value[i] * (1 - self.params['alpha'])
-                    self.bkg_counter += 1
+            # Running average: out = old * alpha + new * (1 - alpha) for each shot
+            self.spectrum_counter += self._running_average(self.spectrum, target.value, _on, self.params['alpha'])
+            self.bkg_counter += self._running_average(self.background, target.value, _off, self.params['alpha'])
             self.output[oname].value = self.spectrum - self.background
 
         else:
             # Normal average. Sum up the images and store in output the spectrum divided by the counter
-            self.spectrum[:] += np.sum(target.value[_on], axis=0, dtype=np.float32)
+            self.spectrum[:] += np.sum(target.value[_on], axis=0, dtype=self._dtype)
             self.spectrum_counter += np.sum(_on)
-            self.background[:] += np.sum(target.value[_off], axis=0, dtype=np.float32)
+            self.background[:] += np.sum(target.value[_off], axis=0, dtype=self._dtype)
             self.bkg_counter += np.sum(_off)
             self.output[oname].value = self.spectrum / self.spectrum_counter - self.background / self.bkg_counter
 
@@ -334,4 +347,18 @@ class SpectrumBackground(BasePresentation):
             'delegate': None
         }
 
+        # Accumulator precision
+        delegates['precision'] = {
+            'mandatory': False,
+            'type': 'list',
+            'dtype': 'str',
+            'default': 'float32',
+            'label': 'Precision',
+            'delegate': {
+                'type': 'ComboboxDelegate',
+                'values': ['float32', 'float64'],
+                'labels': ['Single', 'Double']
+            }
+        }
+
         return delegates
\ No newline at end of file
@@ -7,5 +7,7 @@ from SpectrumPres import SpectrumBackground
 # Scalar presentation
 from ScalarPres import ScalarTrend
 from ScalarPres import ScalarHistogram
+from ScalarPres import ScalarHistogramAuto
+from ScalarPres import ScalarHistogram2D
 from ScalarPres import ScalarStatistics
 from ScalarPres import Scatter
\ No newline at end of file
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Online Analysis - Parallel execution of algorithms
+
+Version 1.0
+
+Michele Devetta (c) 2013
+
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import time
+import Queue
+from multiprocessing.pool import ThreadPool
+from BaseObject import BaseObject
+
+
+class Scheduler(BaseObject):
+
+    """ Run the configured algorithms on a pool of threads
+
+    A dependency graph is derived from the input and output variables of the
+    algorithms. An algorithm depends on all the previous algorithms that
+    write one of its inputs or outputs, and on all the previous algorithms
+    that read one of its outputs. In this way the result is the same as
+    running the algorithms sequentially in their configured order.
+
+    After each run the critical path (the chain of dependent algorithms
+    with the longest total run time) is stored in critical_path and logged.
+
+    """
+
+    def __init__(self, algorithms, threads):
+        """ Constructor. Take the list of configured algorithms, as stored
+        in the configuration, and the number of threads to use.
+        """
+        super(Scheduler, self).__init__()
+        self.name("Scheduler")
+        self.version("1.0")
+
+        self._algorithms = algorithms
+        self._threads = threads
+        self._pool = None
+
+        # Build dependency graph
+        self.deps = []
+        writers = {}
+        readers = {}
+        for i in range(len(algorithms)):
+            ins = algorithms[i][2].input_names()
+            outs = algorithms[i][2].output_names()
+            d = set()
+            for v in ins + outs:
+                if v in writers:
+                    d.add(writers[v])
+            for v in outs:
+                d.update(readers.get(v, []))
+            d.discard(i)
+            self.deps.append(sorted(d))
+
+            # Update last writer and readers
+            for v in ins:
+                readers.setdefault(v, []).append(i)
+            for v in outs:
+                writers[v] = i
+                readers[v] = []
+
+        self.logger.debug("[%s] Dependency graph: %s", self.name(), ", ".join(["%s <- [%s]" % (algorithms[i][1], ", ".join([algorithms[j][1] for j in self.deps[i]])) for i in range(len(algorithms))]))
+
+        # Timings of the last run
+        self.timings = []
+        self.critical_path = []
+
+    def run(self, data):
+        """ Run all the algorithms on data. """
+        n = len(self._algorithms)
+        if n == 0:
+            return
+
+        # Count of pending dependencies and list of dependent algorithms
+        pending = [len(d) for d in self.deps]
+        children = [[] for i in range(n)]
+        for i in range(n):
+            for j in self.deps[i]:
+                children[j].append(i)
+
+        # The pool is created at the first run, so that it belongs to the
+        # process that actually runs the analysis
+        if self._pool is None:
+            self._pool = ThreadPool(self._threads)
+
+        done = Queue.Queue()
+        self.timings = [(0.0, 0.0)] * n
+
+        def _task(i):
+            t1 = time.time()
+            try:
+                self._algorithms[i][2]._process(data)
+            finally:
+                done.put((i, t1, time.time()))
+
+        def _submit(i):
+            self._pool.apply_async(_task, (i, ))
+
+        # Start all the algorithms without dependencies
+        for i in range(n):
+            if pending[i] == 0:
+                _submit(i)
+
+        # Wait for completion and start the algorithms that are ready
+        for k in range(n):
+            (i, t1, t2) = done.get()
+            self.timings[i] = (t1, t2)
+            for c in children[i]:
+                pending[c] -= 1
+                if pending[c] == 0:
+                    _submit(c)
+
+        self._critical_path()
+
+    def _critical_path(self):
+        """ Find the longest chain of dependent algorithms in the last run. """
+        n = len(self._algorithms)
+        length = [0.0] * n
+        prev = [None] * n
+        for i in range(n):
+            for j in self.deps[i]:
+                if length[j] > length[i]:
+                    length[i] = length[j]
+                    prev[i] = j
+            length[i] += self.timings[i][1] - self.timings[i][0]
+
+        # Walk back from the end of the longest path
+        i = max(range(n), key=lambda k: length[k])
+        path = []
+        while i is not None:
+            path.append(i)
+            i = prev[i]
+        path.reverse()
+
+        self.critical_path = [(self._algorithms[i][1], self.timings[i][1] - self.timings[i][0]) for i in path]
+        total = max([t[1] for t in self.timings]) - min([t[0] for t in self.timings])
+        self.logger.debug("[%s] Critical path: %s (%.1f ms of %.1f ms)", self.name(), " -> ".join(["%s [%.1f ms]" % (p[0], p[1] * 1000.0) for p in self.critical_path]), length[path[-1]] * 1000.0, total * 1000.0)
+
+    def close(self):
+        """ Terminate the thread pool. """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Online Analysis - Streaming statistics
+
+Version 1.0
+
+Michele Devetta (c) 2013
+
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import numpy as np
+
+
+class RunningStats(object):
+
+    """ Streaming statistics of a sequence of values
+
+    Mean and variance are updated with the parallel form of Welford's
+    algorithm, so that each batch of values is reduced with vectorized
+    operations and then merged into the running totals. Quantiles are
+    estimated with a merging t-digest: values and centroids are sorted and
+    grouped into buckets whose size in the distribution tails is small, so
+    that memory is bounded by the compression factor.
+
+    Two instances can be combined with merge(), which allows to build the
+    statistics of a window from the statistics of its parts.
+
+    """
+
+    def __init__(self, compression=100):
+        """ Constructor. """
+        self.compression = compression
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        # Digest centroids
+        self._means = np.zeros((0, ), dtype=np.float64)
+        self._weights = np.zeros((0, ), dtype=np.float64)
+
+    def _merge_moments(self, n, mean, m2):
+        """ Merge count, mean and sum of squared deviations of another set
+        of values.
+        """
+        tot = self.count + n
+        d = mean - self.mean
+        self._m2 += m2 + d * d * self.count * n / tot
+        self.mean += d * n / tot
+        self.count = tot
+
+    def _compress(self, means, weights):
+        """ Merge the given centroids into buckets of the k1 scale function.
+        """
+        idx = np.argsort(means, kind='mergesort')
+        means = means[idx]
+        weights = weights[idx]
+        tot = weights.sum()
+
+        # Position of each centroid in the distribution and its bucket
+        q = (np.cumsum(weights) - weights / 2.0) / tot
+        k = np.floor(self.compression * (np.arcsin(2 * q - 1) / np.pi + 0.5))
+        k = np.intp(np.clip(k, 0, self.compression - 1))
+
+        w = np.bincount(k, weights=weights, minlength=self.compression)
+        m = np.bincount(k, weights=weights * means, minlength=self.compression)
+        sel = w > 0
+        self._weights = w[sel]
+        self._means = m[sel] / self._weights
+
+    def update(self, values):
+        """ Add a batch of values. """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        n = values.shape[0]
+        if n == 0:
+            return
+
+        mean = values.mean()
+        self._merge_moments(n, mean, np.sum((values - mean) ** 2))
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._compress(np.concatenate((self._means, values)), np.concatenate((self._weights, np.ones((n, )))))
+
+    def merge(self, other):
+        """ Add the values summarized by another instance. """
+        if other.count == 0:
+            return
+        self._merge_moments(other.count, other.mean, other._m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(np.concatenate((self._means, other._means)), np.concatenate((self._weights, other._weights)))
+
+    def var(self):
+        """ Return the variance of the values. """
+        if self.count == 0:
+            return np.nan
+        return self._m2 / self.count
+
+    def std(self):
+        """ Return the standard deviation of the values. """
+        return np.sqrt(self.var())
+
+    def quantile(self, q):
+        """ Return an estimate of the quantile q (between 0 and 1). """
+        if self.count == 0:
+            return np.nan
+        tot = self._weights.sum()
+        pos = np.cumsum(self._weights) - self._weights / 2.0
+        return np.interp(q * tot, np.concatenate(([0.0], pos, [tot])), np.concatenate(([self.min], self._means, [self.max])))
+
+    def median(self):
+        """ Return an estimate of the median. """
+        return self.quantile(0.5)
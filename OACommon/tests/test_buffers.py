@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+""" Tests of the reusable buffers. """
+
+import unittest
+import cPickle
+import numpy as np
+
+from OACommon.Buffers import BufferPool
+from OACommon.Buffers import RingBuffer
+from OACommon.Buffers import GrowableArray
+from OACommon.Buffers import BunchList
+from OACommon.DataObj import RingArray
+
+
+class TestBufferPool(unittest.TestCase):
+
+    def test_reuse(self):
+        p = BufferPool(2)
+        a = p.get((3, 4), np.float64)
+        a_id = id(a)
+        del a
+        self.assertEqual(id(p.get((3, 4), np.float64)), a_id)
+
+    def test_busy(self):
+        p = BufferPool(2)
+        a = p.get((3, 4), np.float64)
+        v = a[0]
+        del a
+        b = p.get((3, 4), np.float64)
+        self.assertIsNot(b, v.base)
+        c = p.get((3, 4), np.float64)
+        self.assertIsNot(c, b)
+        # Pool is full, so the new buffer is not kept
+        self.assertEqual(p.nbytes(), 2 * 12 * 8)
+
+    def test_eviction(self):
+        p = BufferPool(1, maxbytes=10 * 8000)
+        for n in range(1, 40):
+            p.get((n, 1000), np.float64)
+            self.assertLessEqual(p.nbytes(), max(10 * 8000, n * 8000))
+        # The current shape is kept even if larger than the limit
+        p.get((100, 1000), np.float64)
+        self.assertEqual(p.nbytes(), 100 * 8000)
+
+    def test_clear(self):
+        p = BufferPool()
+        p.get((10, ), np.int32)
+        p.clear()
+        self.assertEqual(p.nbytes(), 0)
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def test_fill(self):
+        r = RingBuffer(5, np.int64)
+        r.append([1, 2])
+        self.assertEqual(len(r), 2)
+        np.testing.assert_array_equal(r.linear(), [1, 2, 0, 0, 0])
+
+    def test_wrap(self):
+        r = RingBuffer(5, np.int64)
+        for i in range(0, 12, 3):
+            r.append(np.arange(i, i + 3))
+        self.assertEqual(len(r), 5)
+        self.assertEqual(len(r.chunks()), 2)
+        np.testing.assert_array_equal(np.concatenate(r.chunks()), np.arange(7, 12))
+        np.testing.assert_array_equal(r.linear(), np.arange(7, 12))
+
+    def test_long_append(self):
+        r = RingBuffer(4, np.float64)
+        r.append([1.0])
+        r.append(np.arange(10.0))
+        np.testing.assert_array_equal(r.linear(), [6, 7, 8, 9])
+
+    def test_clear(self):
+        r = RingBuffer(3, np.int32)
+        r.append([1, 2, 3, 4])
+        r.clear()
+        self.assertEqual(len(r), 0)
+        np.testing.assert_array_equal(r.linear(), [0, 0, 0])
+
+
+class TestRingArray(unittest.TestCase):
+
+    def test_pickle(self):
+        for n in (3, 7):
+            a = RingArray(5, np.float64)
+            a.append(np.arange(float(n)))
+            b = cPickle.loads(cPickle.dumps(a, cPickle.HIGHEST_PROTOCOL))
+            np.testing.assert_array_equal(b.value, a.value)
+            # The restored array keeps accepting values in the same order
+            a.append([10.0, 11.0])
+            b.append([10.0, 11.0])
+            np.testing.assert_array_equal(b.value, a.value)
+
+
+class TestGrowableArray(unittest.TestCase):
+
+    def test_grow(self):
+        g = GrowableArray(np.int64, capacity=2)
+        for i in range(0, 100, 7):
+            g.append(np.arange(i, min(i + 7, 100)))
+        np.testing.assert_array_equal(g.data(), np.arange(100))
+
+    def test_drop(self):
+        g = GrowableArray(np.int64, capacity=2, maxsize=10)
+        for i in range(0, 100, 3):
+            g.append(np.arange(i, i + 3))
+            self.assertLessEqual(len(g), 10)
+        np.testing.assert_array_equal(g.data(), np.arange(92, 102))
+
+    def test_drop_long_append(self):
+        g = GrowableArray(np.int64, maxsize=5)
+        g.append(np.arange(20))
+        np.testing.assert_array_equal(g.data(), np.arange(15, 20))
+
+    def test_decimate(self):
+        g = GrowableArray(np.int64, capacity=4, maxsize=8, policy='decimate')
+        for i in range(0, 64, 5):
+            g.append(np.arange(i, min(i + 5, 64)))
+            self.assertLessEqual(len(g), 8)
+        # Values stay evenly spaced over the whole history
+        d = g.data()
+        self.assertEqual(d[0], 0)
+        self.assertEqual(len(set(np.diff(d))), 1)
+        self.assertGreaterEqual(len(g), 4)
+
+    def test_discard_and_clear(self):
+        g = GrowableArray(np.float64)
+        g.append(np.arange(10.0))
+        g.discard(4)
+        np.testing.assert_array_equal(g.data(), np.arange(4.0, 10.0))
+        g.clear()
+        self.assertEqual(len(g), 0)
+
+
+class TestBunchList(unittest.TestCase):
+
+    def test_runs(self):
+        b = BunchList(np.uint64)
+        b.append(np.arange(10, 20))
+        b.append(np.arange(20, 25))
+        b.append([30, 31, 40])
+        (starts, lengths) = b.runs()
+        np.testing.assert_array_equal(starts, [10, 30, 40])
+        np.testing.assert_array_equal(lengths, [15, 2, 1])
+        np.testing.assert_array_equal(np.asarray(b), np.concatenate((np.arange(10, 25), [30, 31, 40])))
+        self.assertEqual(b.decode().dtype, np.uint64)
+        self.assertEqual(len(b), 18)
+
+    def test_version(self):
+        b = BunchList(np.int64)
+        b.append([1, 2])
+        v = b.version
+        d = b.decode()
+        self.assertIs(b.decode(), d)
+        b.append([])
+        self.assertEqual(b.version, v)
+        b.append([3])
+        self.assertGreater(b.version, v)
+        np.testing.assert_array_equal(b.decode(), [1, 2, 3])
+
+    def test_drop(self):
+        b = BunchList(np.int64, maxsize=7)
+        ref = []
+        for i in range(0, 100, 4):
+            v = [i, i + 1, i + 3]
+            b.append(v)
+            ref += v
+            np.testing.assert_array_equal(b.decode(), ref[-7:])
+
+    def _follow(self, b, values):
+        # Rebuild the runs on the client side from the changes
+        (starts, lengths) = ([], [])
+        mark = None
+        for v in values:
+            b.append(v)
+            (offset, s, l) = b.changes(mark)
+            if mark is not None and mark[0] == b.mark()[0]:
+                self.assertGreaterEqual(offset, mark[1] - 1)
+            mark = b.mark()
+            starts = starts[0:offset] + list(s)
+            lengths = lengths[0:offset] + list(l)
+            np.testing.assert_array_equal(BunchList._expand(np.array(starts), np.array(lengths), np.int64), b.decode())
+
+    def test_changes(self):
+        values = [np.arange(i, i + 5) for i in range(0, 200, 5)] + [[300, 302, 303], [304], [310]] * 3
+        self._follow(BunchList(np.int64), values)
+        self._follow(BunchList(np.int64, maxsize=23), values)
+        self._follow(BunchList(np.int64, maxsize=23, policy='decimate'), values)
+
+    def test_changes_offset(self):
+        b = BunchList(np.int64)
+        b.append([1, 2, 5])
+        mark = b.mark()
+        b.append([6, 9])
+        (offset, starts, lengths) = b.changes(mark)
+        self.assertEqual(offset, 1)
+        np.testing.assert_array_equal(starts, [5, 9])
+        np.testing.assert_array_equal(lengths, [2, 1])
+        self.assertEqual(b.changes(b.mark())[1].shape[0], 1)
+
+    def test_decimate(self):
+        b = BunchList(np.int64, maxsize=10, policy='decimate')
+        g = GrowableArray(np.int64, maxsize=10, policy='decimate')
+        for i in range(0, 100, 6):
+            b.append(np.arange(i, i + 6))
+            g.append(np.arange(i, i + 6))
+            self.assertLessEqual(len(b), 10)
+            np.testing.assert_array_equal(b.decode(), g.data())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+""" Tests of the presenters checkpoint. """
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from OACommon.Checkpoint import Checkpoint
+
+
+class _Presenter(object):
+
+    """ Minimal presenter with a state. """
+
+    def __init__(self, fingerprint, value=None):
+        self._fingerprint = fingerprint
+        self.value = value
+        self.changed = value is not None
+
+    def fingerprint(self):
+        return self._fingerprint
+
+    def get_state(self):
+        return {'value': self.value}
+
+    def set_state(self, state):
+        self.value = state['value']
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'checkpoint.h5')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def restore(self, presenters):
+        return Checkpoint(self.filename).restore(presenters)
+
+    def test_roundtrip(self):
+        p = [('a', _Presenter('fa', np.arange(10))), ('b', _Presenter('fb', [1, 2]))]
+        c = Checkpoint(self.filename, period=0)
+        self.assertTrue(c.save(p))
+        c.wait()
+        self.assertFalse(p[0][1].changed)
+        self.assertEqual(os.listdir(self.dir), ['checkpoint.h5'])
+
+        q = [('a', _Presenter('fa')), ('b', _Presenter('fb'))]
+        self.assertEqual(self.restore(q), 2)
+        np.testing.assert_array_equal(q[0][1].value, np.arange(10))
+        self.assertEqual(q[1][1].value, [1, 2])
+
+    def test_incremental(self):
+        p = [('a', _Presenter('fa', 1)), ('b', _Presenter('fb', 2))]
+        c = Checkpoint(self.filename, period=0)
+        c.save(p)
+        c.wait()
+        p[1][1].value = 3
+        p[1][1].changed = True
+        c.save(p)
+        c.wait()
+
+        q = [('a', _Presenter('fa')), ('b', _Presenter('fb'))]
+        self.restore(q)
+        self.assertEqual((q[0][1].value, q[1][1].value), (1, 3))
+
+    def test_snapshot(self):
+        # The state is copied by save(), later changes are not written
+        p = [('a', _Presenter('fa', np.zeros(5)))]
+        c = Checkpoint(self.filename, period=0)
+        c.save(p)
+        p[0][1].value[:] = 1
+        c.wait()
+
+        q = [('a', _Presenter('fa'))]
+        self.restore(q)
+        np.testing.assert_array_equal(q[0][1].value, np.zeros(5))
+
+    def test_fingerprint(self):
+        c = Checkpoint(self.filename, period=0)
+        c.save([('a', _Presenter('fa', 1))])
+        c.wait()
+        q = [('a', _Presenter('other'))]
+        self.assertEqual(self.restore(q), 0)
+        self.assertIsNone(q[0][1].value)
+
+    def test_period(self):
+        c = Checkpoint(self.filename, period=3600)
+        p = [('a', _Presenter('fa', 1))]
+        self.assertFalse(c.save(p))
+        self.assertTrue(c.save(p, force=True))
+        c.wait()
+
+    def test_failure(self):
+        # A failed write leaves the presenters changed, so it is retried
+        os.mkdir(self.filename)
+        p = [('a', _Presenter('fa', 1))]
+        c = Checkpoint(self.filename, period=0)
+        c.save(p)
+        c.wait()
+        self.assertTrue(p[0][1].changed)
+        self.assertEqual(os.listdir(self.dir), ['checkpoint.h5'])
+
+        os.rmdir(self.filename)
+        self.assertTrue(c.save(p))
+        c.wait()
+        self.assertFalse(p[0][1].changed)
+        q = [('a', _Presenter('fa'))]
+        self.assertEqual(self.restore(q), 1)
+        self.assertEqual(q[0][1].value, 1)
+
+    def test_missing_file(self):
+        self.assertEqual(self.restore([('a', _Presenter('fa'))]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+""" Tests of the expression engine. """
+
+import unittest
+import numpy as np
+
+from OACommon.Expression import Expression, compile_expr, evaluate
+
+
+class TestWhitelist(unittest.TestCase):
+
+    def test_unknown_name(self):
+        self.assertRaises(NameError, Expression, "os.system('ls')", ['x'])
+
+    def test_private_attribute(self):
+        self.assertRaises(ValueError, Expression, "x.__class__", ['x'])
+        self.assertRaises(ValueError, Expression, "np._NoValue", ['x'])
+
+    def test_unsupported_syntax(self):
+        self.assertRaises(ValueError, Expression, "lambda: 1")
+        self.assertRaises(ValueError, Expression, "[y for y in x]", ['x'])
+
+    def test_no_builtins(self):
+        self.assertRaises(NameError, Expression, "open('/etc/passwd')")
+
+    def test_evaluate_has_no_names(self):
+        self.assertRaises(NameError, evaluate, "np.pi")
+        self.assertEqual(evaluate("[1, 2.5, 'a']"), [1, 2.5, 'a'])
+
+
+class TestFolding(unittest.TestCase):
+
+    def test_constant(self):
+        e = Expression("np.pi * 2 + 1")
+        self.assertTrue(e.constant)
+        self.assertAlmostEqual(e.value, np.pi * 2 + 1)
+
+    def test_partial(self):
+        e = Expression("x * (np.sqrt(4) + 1)", ['x'])
+        self.assertFalse(e.constant)
+        self.assertEqual(e(2.0), 6.0)
+
+    def test_random_not_folded(self):
+        e = Expression("np.random.rand()")
+        self.assertFalse(e.constant)
+        self.assertNotEqual(e(), e())
+
+    def test_evaluate_returns_copy(self):
+        l = evaluate("[1, 2]")
+        l.append(3)
+        self.assertEqual(evaluate("[1, 2]"), [1, 2])
+
+    def test_cache(self):
+        self.assertIs(compile_expr("x + 1", ['x']), compile_expr("x + 1", ['x']))
+
+
+class TestVectorization(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.array([-2.0, -1.0, 0.0, 1.0, 2.0])
+
+    def test_bool_operators(self):
+        e = Expression("x > -2 and not x > 1", ['x'])
+        np.testing.assert_array_equal(e(self.x), [False, True, True, True, False])
+
+    def test_chained_comparison(self):
+        e = Expression("-1 <= x < 2", ['x'])
+        np.testing.assert_array_equal(e(self.x), [False, True, True, True, False])
+
+    def test_conditional(self):
+        e = Expression("x if x > 0 else 0", ['x'])
+        np.testing.assert_array_equal(e(self.x), [0, 0, 0, 1, 2])
+
+    def test_scalar_semantics(self):
+        e = Expression("x if x > 0 else 0", ['x'], vectorize=False)
+        self.assertEqual(e(-1.0), 0)
+        self.assertEqual(e(3.0), 3.0)
+
+    def test_elementwise(self):
+        self.assertTrue(Expression("np.abs(x) + np.where(y > 0, y, 0)", ['x', 'y']).elementwise)
+        self.assertFalse(Expression("np.mean(x)", ['x']).elementwise)
+        self.assertFalse(Expression("x[0]", ['x']).elementwise)
+        self.assertFalse(Expression("x.sum()", ['x']).elementwise)
+
+    def test_used(self):
+        self.assertEqual(Expression("x * 2", ['x', 'y']).used, frozenset(['x']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+""" Tests of the image algorithms. """
+
+import unittest
+import numpy as np
+
+from OACommon.Algorithms import ImageProfile
+from OACommon.DataObj import Image
+
+
+def _image(v):
+    i = Image()
+    i.value = v
+    return i
+
+
+def _profile(aois):
+    return ImageProfile({
+        'target': {'type': 'var', 'value': 'i'},
+        'aois': {'type': 'expr', 'value': repr(aois)},
+        'out_hor': {'type': 'outvar', 'value': repr(['h%d' % i for i in range(len(aois))])},
+        'out_vert': {'type': 'outvar', 'value': repr(['v%d' % i for i in range(len(aois))])},
+        'out_total': {'type': 'outvar', 'value': repr(['t%d' % i for i in range(len(aois))])},
+    })
+
+
+class TestImageProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.img = np.random.randint(0, 4096, (7, 40, 50)).astype(np.uint16)
+
+    def check(self, aois, img, block_size=None):
+        alg = _profile(aois)
+        if block_size is not None:
+            alg._block_size = block_size
+        out = alg.process(_image(img))
+        acc = np.float64 if img.dtype.kind == 'f' else np.int64
+        for (i, a) in enumerate(aois):
+            view = img[:, a[2]:a[3], a[0]:a[1]].astype(acc)
+            self.assertEqual(out['h%d' % i].value.dtype, acc)
+            self.assertEqual(out['v%d' % i].value.dtype, acc)
+            np.testing.assert_allclose(out['h%d' % i].value, view.sum(1))
+            np.testing.assert_allclose(out['v%d' % i].value, view.sum(2))
+            np.testing.assert_allclose(out['t%d' % i].value, view.sum((1, 2)))
+
+    def test_disjoint(self):
+        self.check([[0, 10, 0, 10], [20, 30, 20, 30]], self.img)
+
+    def test_overlapping(self):
+        self.check([[0, 10, 0, 10], [5, 30, 5, 30], [2, 48, 1, 39]], self.img)
+
+    def test_blocks(self):
+        # Blocks smaller than a row of the region and than a frame
+        for size in (16, 500, 5000):
+            self.check([[0, 10, 0, 10], [5, 30, 5, 30], [2, 48, 1, 39]], self.img, size)
+
+    def test_float(self):
+        self.check([[3, 17, 4, 33], [10, 20, 0, 40]], np.random.rand(5, 40, 50).astype(np.float32), 1000)
+
+    def test_clipped(self):
+        # AOIs are clipped to the image
+        alg = _profile([[40, 60, 30, 45]])
+        out = alg.process(_image(self.img))
+        np.testing.assert_array_equal(out['h0'].value, self.img[:, 30:, 40:].astype(np.int64).sum(1))
+        np.testing.assert_array_equal(out['v0'].value, self.img[:, 30:, 40:].astype(np.int64).sum(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+""" Tests of the presenter services. """
+
+import unittest
+import numpy as np
+
+from OACommon.Presenters.BasePresentation import BasePresentation
+
+
+class TestRunningAverage(unittest.TestCase):
+
+    def setUp(self):
+        self.pres = BasePresentation({}, None)
+        self.values = np.random.randint(0, 4096, (50, 8, 9)).astype(np.uint16)
+        self.alpha = 0.9
+
+    def expected(self, acc, mask):
+        acc = acc.copy()
+        for v in self.values[mask]:
+            acc = self.alpha * acc + (1 - self.alpha) * v
+        return acc
+
+    def check(self, mask):
+        acc = np.random.rand(8, 9)
+        ref = self.expected(acc, mask)
+        k = self.pres._running_average(acc, self.values, mask, self.alpha)
+        self.assertEqual(k, np.count_nonzero(mask))
+        np.testing.assert_allclose(acc, ref)
+
+    def test_all(self):
+        self.check(np.ones(50, dtype=np.bool))
+
+    def test_none(self):
+        self.check(np.zeros(50, dtype=np.bool))
+
+    def test_contiguous(self):
+        mask = np.zeros(50, dtype=np.bool)
+        mask[10:30] = True
+        self.check(mask)
+
+    def test_sparse(self):
+        mask = np.random.rand(50) > 0.5
+        self.check(mask)
+        # Blocks of a few shots
+        self.pres._block_size = 3 * self.values[0].nbytes
+        self.check(mask)
+        self.check(~mask)
+
+    def test_unselected_nan(self):
+        # Shots excluded by the mask do not contribute, even if invalid
+        self.values = self.values.astype(np.float64)
+        mask = np.arange(50) % 2 == 0
+        self.values[~mask] = np.nan
+        self.check(mask)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+""" Tests of the scalar algorithms. """
+
+import unittest
+import numpy as np
+
+from OACommon.Algorithms import ComputeScalarExpr
+from OACommon.DataObj import Scalar, Metadata
+
+
+def _scalar(v):
+    s = Scalar()
+    s.value = np.array(v, dtype=np.float64)
+    return s
+
+
+def _metadata(v):
+    m = Metadata()
+    m.value = v
+    return m
+
+
+def _expr(expression, target):
+    return ComputeScalarExpr({
+        'expression': {'type': 'expr', 'value': expression},
+        'target': {'type': 'var', 'value': repr(target)},
+        'output': {'type': 'outvar', 'value': 'out'},
+    })
+
+
+class TestComputeScalarExpr(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {'a': _scalar([1, 1, 2, 3, 4]), 'b': _scalar([0, 1, 1, 1, 1]), 'm': _metadata(2.0)}
+
+    def process(self, expression, target):
+        alg = _expr(expression, target)
+        return alg.process(dict((k, self.data[k]) for k in target))['output'].value
+
+    def test_elementwise(self):
+        np.testing.assert_array_equal(self.process("a * m + np.sqrt(b)", ['a', 'b', 'm']), [2, 3, 5, 7, 9])
+
+    def test_conditional(self):
+        np.testing.assert_array_equal(self.process("a if b > 0 else -a", ['a', 'b']), [-1, 1, 2, 3, 4])
+
+    def test_reduction_of_list(self):
+        np.testing.assert_array_equal(self.process("np.max([a, b])", ['a', 'b']), [1, 1, 2, 3, 4])
+
+    def test_reduction_of_target(self):
+        np.testing.assert_array_equal(self.process("a - np.mean(a) + b", ['a', 'b']), [0, 1, 1, 1, 1])
+
+    def test_metadata_only(self):
+        np.testing.assert_array_equal(self.process("m * 2", ['a', 'm']), [4, 4, 4, 4, 4])
+
+    def test_metadata_output(self):
+        out = self.process("m + 1", ['m'])
+        self.assertEqual(out, 3.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
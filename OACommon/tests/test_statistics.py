@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+""" Tests of the streaming statistics. """
+
+import unittest
+import numpy as np
+
+from OACommon.Statistics import RunningStats
+
+
+class TestRunningStats(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        self.values = np.concatenate((rs.normal(10.0, 2.0, 20000), rs.exponential(3.0, 5000)))
+        rs.shuffle(self.values)
+
+    def stats(self, values, batch=1000):
+        s = RunningStats()
+        for i in range(0, values.shape[0], batch):
+            s.update(values[i:i + batch])
+        return s
+
+    def test_moments(self):
+        s = self.stats(self.values)
+        self.assertEqual(s.count, self.values.shape[0])
+        self.assertAlmostEqual(s.mean, np.mean(self.values), places=9)
+        self.assertAlmostEqual(s.var(), np.var(self.values), places=7)
+        self.assertAlmostEqual(s.std(), np.std(self.values), places=8)
+        self.assertEqual(s.min, np.min(self.values))
+        self.assertEqual(s.max, np.max(self.values))
+
+    def test_quantiles(self):
+        s = self.stats(self.values)
+        spread = np.percentile(self.values, 99) - np.percentile(self.values, 1)
+        for q in (0.01, 0.1, 0.5, 0.9, 0.99):
+            self.assertLess(abs(s.quantile(q) - np.percentile(self.values, q * 100)), 0.01 * spread)
+        self.assertEqual(s.median(), s.quantile(0.5))
+
+    def test_compression(self):
+        s = self.stats(self.values, batch=100)
+        self.assertLess(s._means.shape[0], 10 * s.compression)
+
+    def test_merge(self):
+        n = self.values.shape[0] / 2
+        a = self.stats(self.values[:n])
+        a.merge(self.stats(self.values[n:]))
+        s = self.stats(self.values)
+        self.assertEqual(a.count, s.count)
+        self.assertAlmostEqual(a.mean, s.mean, places=9)
+        self.assertAlmostEqual(a.var(), s.var(), places=7)
+        self.assertLess(abs(a.median() - np.median(self.values)), 0.1)
+
+    def test_empty(self):
+        s = RunningStats()
+        s.update([])
+        self.assertTrue(np.isnan(s.var()))
+        self.assertTrue(np.isnan(s.quantile(0.5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
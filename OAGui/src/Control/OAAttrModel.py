@@ -95,7 +95,7 @@ class AttributeModel(QtCore.QAbstractTableModel, GuiBase):
                     continue
 
                 # Skip bunches attributes
-                rexp = re.compile('.*__bunches$')
+                rexp = re.compile('.*__bunches(_runs)?$')
                 if rexp.match(a.label):
                     continue
 
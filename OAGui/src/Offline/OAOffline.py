@@ -53,6 +53,9 @@ from OAResultModel import PushButtonDelegate
 # Ui
 from Ui import Ui_OAOffline
 
+# Number of shots processed at once (zero to process whole files)
+BLOCK = int(os.environ.get('OA_BLOCK', 0))
+
 
 class MainWindow(QtGui.QMainWindow, GuiBase, Ui_OAOffline):
 
@@ -160,7 +163,7 @@ class MainWindow(QtGui.QMainWindow, GuiBase, Ui_OAOffline):
             # Create processing worker
             job_queue = multiprocessing.Queue()
             res_queue = multiprocessing.Queue()
-            worker = OfflineWorker(unicode(self.config_file.text()), job_queue, res_queue, self.logger.level(), None)
+            worker = OfflineWorker(unicode(self.config_file.text()), job_queue, res_queue, self.logger.level(), None, BLOCK)
             worker.start()
 
             # Open progress dialog
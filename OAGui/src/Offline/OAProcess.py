@@ -36,7 +36,7 @@ class OfflineWorker(multiprocessing.Process):
 
     """ Offline worker. """
 
-    def __init__(self, configfile, job_queue, result_queue, loglevel=Logger.INFO, loghost="localhost:9999"):
+    def __init__(self, configfile, job_queue, result_queue, loglevel=Logger.INFO, loghost="localhost:9999", block=0):
         """ Constructor. """
         # Parent constructor
         multiprocessing.Process.__init__(self)
@@ -48,7 +48,7 @@ class OfflineWorker(multiprocessing.Process):
             # Init OA
             self.config = Configuration(configfile)
             # Create analyzer
-            self.analyzer = Analyzer(self.config)
+            self.analyzer = Analyzer(self.config, block=block)
             # Create presenter
             self.presenter = Presenter(self.config)
         except Exception, e:
@@ -87,11 +87,9 @@ class OfflineWorker(multiprocessing.Process):
             try:
                 index += 1
 
-                # Processing
-                data = self.analyzer.analyze(filename)
-
-                # Post-processing
-                self.out = self.presenter.update(data)
+                # Processing and post-processing, one block of shots at a time
+                for data in self.analyzer.iterate(filename):
+                    self.out = self.presenter.update(data)
 
                 # Return name of processed file
                 self.res_queue.put((index, filename))
@@ -102,5 +100,7 @@ class OfflineWorker(multiprocessing.Process):
 
         # Exiting worker. Store presenter data into result_queue
         self.res_queue.put((None, self.out))
+        self.analyzer.close()
+        self.presenter.close()
 
         self.logger.info("Terminating worker.")
\ No newline at end of file
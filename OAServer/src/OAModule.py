@@ -35,7 +35,7 @@ class OA(BaseObject):
 
     """
 
-    def __init__(self, configfile):
+    def __init__(self, configfile, threads=1, block=0):
         """ Constructor. """
         BaseObject.__init__(self)
         self.name("OA")
@@ -45,7 +45,7 @@ class OA(BaseObject):
         self.config = Configuration(configfile)
 
         # Create analyzer
-        self.analyzer = Analyzer(self.config)
+        self.analyzer = Analyzer(self.config, threads=threads, block=block)
 
         # Default output function
         self.outfunc = lambda data, params: data
@@ -66,20 +66,37 @@ class OA(BaseObject):
             self.logger.error("[%s] Error loading the output function (Error: %s)", self.name(), e, exc_info=True)
 
     def process(self, filename):
-        """ Take as input an HDF5 file name and return the preprocessed data. """
-        data = self.analyzer.analyze(filename)
-
+        """ Take as input an HDF5 file name and return the preprocessed data.
+        In streaming mode return a generator of the preprocessed data of
+        each block of shots, so that the blocks can be post-processed one at
+        a time.
+        """
+        if self.analyzer.block > 0:
+            return self._process_blocks(filename)
+
+        return self._output(self.analyzer.analyze(filename), {'filename': filename})
+
+    def _process_blocks(self, filename):
+        """ Process a file one block of shots at a time. """
+        i = 0
+        for data in self.analyzer.iterate(filename):
+            yield self._output(data, {'filename': filename, 'block': i})
+            i += 1
+
+    def _output(self, data, params):
+        """ Purge raw data and run the output function. """
         # Purge from data all the raw data
         for k in tuple(data.keys()):
-            if data[k].classtype() == 'Raw':
+            if data[k] is None or data[k].classtype() == 'Raw':
                 del data[k]
 
-        # Output function parameters
-        params = {'filename': filename}
-
         # Run output function
         return self.outfunc(data, params)
 
+    def close(self):
+        """ Release the resources of the analyzer. """
+        self.analyzer.close()
+
 
 class OAPresentation(BaseObject):
 
@@ -87,7 +104,7 @@ class OAPresentation(BaseObject):
 
     """
 
-    def __init__(self, configfile):
+    def __init__(self, configfile, threads=1, checkpoint=None, period=60.0):
         """ Constructor. """
         BaseObject.__init__(self)
         self.name("OAPresentation")
@@ -97,7 +114,7 @@ class OAPresentation(BaseObject):
         self.config = Configuration(configfile)
 
         # Create presenter
-        self.presenter = Presenter(self.config)
+        self.presenter = Presenter(self.config, threads, checkpoint, period)
 
         # Default output function
         self.outfunc = lambda data, params: True
@@ -119,6 +136,10 @@ class OAPresentation(BaseObject):
         except Exception as e:
             self.logger.error("[%s] Error loading the output function (Error: %s)", self.name(), e, exc_info=True)
 
+    def close(self):
+        """ Release the resources of the presenter. """
+        self.presenter.close()
+
     def update(self, data):
         """ Update presenters. """
         # Reset presenters if needed
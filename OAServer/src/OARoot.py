@@ -37,13 +37,28 @@ DEF_CONFIG_FILE = '/scratchldm/new_fermidaq/OA/OAConfig.xml'
 # Get configuration file path from environment if set
 CONFIG_FILE = os.environ.get('OA_CONFIG_FILE', DEF_CONFIG_FILE)
 
+# Number of threads used to run the algorithms
+THREADS = int(os.environ.get('OA_THREADS', 1))
+
+# Number of shots processed at once (zero to process whole files)
+BLOCK = int(os.environ.get('OA_BLOCK', 0))
+
+# Number of threads used to update the presenters
+PRESENTER_THREADS = int(os.environ.get('OA_PRESENTER_THREADS', 1))
+
+# File used to checkpoint the state of the presenters (none to disable)
+CHECKPOINT = os.environ.get('OA_CHECKPOINT', None)
+
+# Minimum time between two checkpoints in seconds
+CHECKPOINT_PERIOD = float(os.environ.get('OA_CHECKPOINT_PERIOD', 60))
+
 
 class OASingle(BaseObject):
     def __init__(self):
         BaseObject.__init__(self)
         self.name("OASingle")
         self.version("1.0")
-        self.oa = OA(CONFIG_FILE)
+        self.oa = OA(CONFIG_FILE, THREADS, BLOCK)
         #global PyTango
         #import PyTango
         #self.dev = PyTango.AttributeProxy("srv-ldm-srf:20000/ldm/postprocessing/file_mover/FileToProcess")
@@ -61,12 +76,16 @@ class OASingle(BaseObject):
             self.logger.error("[%s] Processing failed (Error: %s)", self.name(), e, exc_info=True)
             return []
 
+    def close(self):
+        """ Called by the WorkSpawner when the worker terminates. """
+        self.oa.close()
+
 
 class OAPresent(BaseObject):
     def __init__(self):
         BaseObject.__init__(self)
         self.name("OAPresent")
-        self.oa_presenter = OAPresentation(CONFIG_FILE)
+        self.oa_presenter = OAPresentation(CONFIG_FILE, PRESENTER_THREADS, CHECKPOINT, CHECKPOINT_PERIOD)
 
     def update(self, data):
         self.logger.info("[%s] Starting post-processing.", self.name())
@@ -82,4 +101,8 @@ class OAPresent(BaseObject):
 
         except Exception as e:
             self.logger.error("[%s] Presenting failed (Error: %s)", self.name(), e, exc_info=True)
-            return False
\ No newline at end of file
+            return False
+
+    def close(self):
+        """ Called by the WorkSpawner when the worker terminates. """
+        self.oa_presenter.close()
\ No newline at end of file
@@ -23,17 +23,31 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import math
+import time
 import numpy as np
 from OACommon.BaseObject import BaseObject
 from OACommon.DataObj import Scalar
 from OACommon.DataObj import Array
+from OACommon.DataObj import RingArray
+from OACommon.Buffers import BunchList
 from OACommon.DataObj import Image
 PyTango = None
 
 
 class Export2Tango(BaseObject):
 
-    """ Export presentation data to TANGO. """
+    """ Export presentation data to TANGO.
+
+    Bunch numbers stored in a BunchList are exported incrementally to the
+    '__bunches_runs' attribute, a LONG64 spectrum [offset, start_0,
+    length_0, start_1, length_1, ...] with the runs of consecutive bunch
+    numbers changed since the previous write. A client keeps the first
+    offset runs it already has and replaces the others with the ones
+    received (offset is 0 when all the runs are sent). The expanded
+    '__bunches' attribute is still written for the existing clients, but at
+    most once every 'bunches_period' seconds (10 by default).
+
+    """
 
     def __init__(self, params):
         super(Export2Tango, self).__init__()
@@ -44,6 +58,17 @@ class Export2Tango(BaseObject):
         global PyTango
         import PyTango
 
+        # Bunch list, mark of the runs and time of the last full write of
+        # the bunches of each attribute
+        self._bunches = {}
+
+        # Minimum time between two writes of the expanded bunches
+        try:
+            self._bunches_period = float(params.get('bunches_period', 10.0))
+        except ValueError as e:
+            self.logger.error("[%s] Invalid 'bunches_period' parameter. Using default (Error: %s)", self.name(), e)
+            self._bunches_period = 10.0
+
         try:
             self.dev = PyTango.DeviceProxy(params['device'])
 
@@ -75,16 +100,23 @@ class Export2Tango(BaseObject):
                     self.logger.warning("[%s] Dataset '%s' is empty. Ignoring.", self.name(), key)
                     continue
 
-                if np.any(np.isinf(data[key].value)):
+                # Circular buffers are checked without reordering them
+                if isinstance(data[key], RingArray):
+                    chunks = data[key].chunks()
+                else:
+                    chunks = [data[key].value]
+
+                if any([np.any(np.isinf(c)) for c in chunks]):
                     self.logger.warning("[%s] Dataset '%s' contains Inf values and cannot be stored.", self.name(), key)
                     continue
 
-                if np.any(np.isnan(data[key].value)):
+                if any([np.any(np.isnan(c)) for c in chunks]):
                     self.logger.warning("[%s] Dataset '%s' contains NaN values and cannot be stored.", self.name(), key)
                     continue
 
                 if not self._check_attr(key, data[key]):
                     # Need to recreate the attribute
+                    self._bunches.pop(str(key), None)
                     if not self._create_attr(key, data[key]):
                         self.logger.error("[%s] '%s' attribute creation failed.", self.name(), key)
                         continue
@@ -123,7 +155,10 @@ class Export2Tango(BaseObject):
 
             # Write bunches
             if hasattr(data, 'bunches') and data.bunches is not None and len(data.bunches) > 0:
-                self.dev.write_attribute(key + "__bunches", data.bunches)
+                if isinstance(data.bunches, BunchList):
+                    self._write_bunches(key, data.bunches)
+                else:
+                    self.dev.write_attribute(key + "__bunches", data.bunches)
 
             # Write X axis
             if hasattr(data, '_x') and data._x is not None and len(data._x) > 0:
@@ -133,6 +168,31 @@ class Export2Tango(BaseObject):
             for err in e:
                 self.logger.error("[%s] %s (Origin: %s)", self.name(), err.desc, err.origin)
 
+    def _write_bunches(self, key, bunches):
+        """ Internal. Write the runs of a bunch list changed since the last
+        write and, if enough time has passed, the expanded list.
+        """
+        (last, mark, written) = self._bunches.get(key, (None, None, 0.0))
+        if last is not bunches:
+            (mark, written) = (None, 0.0)
+
+        # Changed runs
+        if mark != bunches.mark():
+            (offset, starts, lengths) = bunches.changes(mark)
+            runs = np.empty(2 * starts.shape[0] + 1, dtype=np.int64)
+            runs[0] = offset
+            runs[1::2] = starts
+            runs[2::2] = lengths
+            self.dev.write_attribute(key + "__bunches_runs", runs)
+            mark = bunches.mark()
+            self._bunches[key] = (bunches, mark, written)
+
+        # Expanded list
+        now = time.time()
+        if written < now - self._bunches_period:
+            self.dev.write_attribute(key + "__bunches", bunches.decode())
+            self._bunches[key] = (bunches, mark, now)
+
     def _check_attr(self, key, data):
         """ Internal. Check existence of an attribute. """
         try:
@@ -185,6 +245,12 @@ class Export2Tango(BaseObject):
                     if conf.max_dim_x < len(data.bunches):
                         return False
 
+                    # Check __bunches_runs
+                    if isinstance(data.bunches, BunchList):
+                        conf = self.dev.get_attribute_config(str(key) + "__bunches_runs")
+                        if conf.max_dim_x < 2 * len(data.bunches.runs()[0]) + 1:
+                            return False
+
             except AttributeError:
                 pass
 
@@ -213,6 +279,7 @@ class Export2Tango(BaseObject):
             self.dev.command_inout('DeleteAttribute', str(key))
             self.dev.command_inout('DeleteAttribute', str(key) + "__x")
             self.dev.command_inout('DeleteAttribute', str(key) + "__bunches")
+            self.dev.command_inout('DeleteAttribute', str(key) + "__bunches_runs")
             self.dev.command_inout('DeleteAttribute', str(key) + "__reset")
         except PyTango.DevFailed, e:
             self.logger.error("[%s] Error deleting attributes (Error: %s)", self.name(), e[0].desc)
@@ -245,7 +312,12 @@ class Export2Tango(BaseObject):
             # Create bunches array (if needed...)
             if hasattr(data, 'bunches') and data.bunches is not None and len(data.bunches) > 0:
                 self.logger.debug("[%s] Dataset '%s' has bunches array of length %d.", self.name(), key, len(data.bunches))
-                self.dev.NewSpectrum([str(key) + "__bunches", "ULONG", str(int(math.ceil(len(data.bunches) / 200.0) * 200))])
+                # Leave room to grow, so that the attributes are not
+                # recreated at each update while accumulating
+                self.dev.NewSpectrum([str(key) + "__bunches", "ULONG", str(int(math.ceil(2 * len(data.bunches) / 200.0) * 200))])
+                if isinstance(data.bunches, BunchList):
+                    n = 2 * (2 * len(data.bunches.runs()[0]) + 1)
+                    self.dev.NewSpectrum([str(key) + "__bunches_runs", "LONG64", str(int(math.ceil(n / 200.0) * 200))])
 
             # Create X array (if needed...)
             if hasattr(data, '_x') and data._x is not None and len(data._x) > 0:
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+import os
+import glob
+import errno
+import mmap
+import tempfile
+import cPickle
+from cStringIO import StringIO
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Directory of the shared memory segments
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# Arrays smaller than this are pickled as usual
+MIN_SIZE = 65536
+
+# Alignment of the arrays inside a segment
+ALIGN = 64
+
+# Prefix of the segment files. It's followed by the PID of the process that
+# owns the segments, so that segments left by a dead process can be removed.
+PREFIX = 'ws-'
+
+
+class SharedResult(object):
+
+    """ A job result with numpy arrays stored in shared memory
+
+    The result is pickled replacing each large array with a reference to a
+    descriptor (dtype, shape, offset) of its copy in the segment file, so
+    that only a small object goes through the queues. The receiver maps the
+    segment and rebuilds the arrays on top of the mapping without copying.
+
+    """
+
+    def __init__(self, payload, segment, layout):
+        """ Constructor. """
+        self.payload = payload
+        self.segment = segment
+        self.layout = layout
+
+    def size(self):
+        """ Size of the arrays in the segment. """
+        if len(self.layout) == 0:
+            return 0
+        (dtype, shape, offset) = self.layout[-1]
+        return offset + dtype.itemsize * int(np.prod(shape))
+
+
+def encode(obj, owner=None, min_size=MIN_SIZE):
+    """ Move the large numpy arrays contained in obj to a shared memory
+    segment owned by the process with PID owner (by default the current
+    process). Return a SharedResult or obj itself if there is nothing to
+    move.
+    """
+    if np is None:
+        return obj
+
+    arrays = []
+    ids = {}
+
+    def persistent_id(o):
+        if type(o) is np.ndarray and not o.dtype.hasobject and o.nbytes >= min_size:
+            # The same array referenced twice is stored only once
+            if id(o) not in ids:
+                ids[id(o)] = len(arrays)
+                arrays.append(o)
+            return ids[id(o)]
+        return None
+
+    buf = StringIO()
+    p = cPickle.Pickler(buf, cPickle.HIGHEST_PROTOCOL)
+    p.persistent_id = persistent_id
+    p.dump(obj)
+    if len(arrays) == 0:
+        return obj
+
+    # Layout of the segment
+    layout = []
+    size = 0
+    for a in arrays:
+        layout.append((a.dtype, a.shape, size))
+        size += (a.nbytes + ALIGN - 1) // ALIGN * ALIGN
+
+    if owner is None:
+        owner = os.getpid()
+    (fd, segment) = tempfile.mkstemp(prefix='%s%d-' % (PREFIX, owner), dir=SHM_DIR)
+    try:
+        os.ftruncate(fd, size)
+        mm = mmap.mmap(fd, size)
+        try:
+            for (a, (dtype, shape, offset)) in zip(arrays, layout):
+                dst = np.frombuffer(mm, dtype, a.size, offset)
+                dst[:] = a.ravel()
+        finally:
+            mm.close()
+    except:
+        os.unlink(segment)
+        raise
+    finally:
+        os.close(fd)
+
+    return SharedResult(buf.getvalue(), segment, layout)
+
+
+def decode(result):
+    """ Rebuild an object encoded by encode(). The arrays are mapped from the
+    segment copy-on-write, so they can be modified without affecting the
+    segment. The mapping is released when the arrays are freed.
+    """
+    if not isinstance(result, SharedResult):
+        return result
+
+    fd = os.open(result.segment, os.O_RDONLY)
+    try:
+        mm = mmap.mmap(fd, result.size(), access=mmap.ACCESS_COPY)
+    finally:
+        os.close(fd)
+
+    arrays = [np.frombuffer(mm, dtype, int(np.prod(shape)), offset).reshape(shape) for (dtype, shape, offset) in result.layout]
+
+    u = cPickle.Unpickler(StringIO(result.payload))
+    u.persistent_load = lambda pid: arrays[pid]
+    return u.load()
+
+
+def release(result):
+    """ Remove the segment of a SharedResult. Processes that have already
+    mapped it keep their arrays.
+    """
+    if isinstance(result, SharedResult):
+        try:
+            os.unlink(result.segment)
+        except OSError:
+            pass
+
+
+def cleanup():
+    """ Remove the segments whose owner process is not running anymore.
+    Return the number of removed segments.
+    """
+    count = 0
+    for segment in glob.glob(os.path.join(SHM_DIR, PREFIX + '*-*')):
+        try:
+            pid = int(os.path.basename(segment)[len(PREFIX):].split('-')[0])
+        except ValueError:
+            continue
+        try:
+            os.kill(pid, 0)
+            continue
+        except OSError as e:
+            # The process exists but belongs to another user
+            if e.errno == errno.EPERM:
+                continue
+        try:
+            os.unlink(segment)
+            count += 1
+        except OSError:
+            pass
+    return count
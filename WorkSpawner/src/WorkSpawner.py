@@ -3,10 +3,13 @@
 
 import sys
 import time
+import types
 import threading
+import os
 import multiprocessing
 import Queue
 import sighandler
+import SharedMemory
 
 
 class LoggerStub(object):
@@ -77,6 +80,10 @@ class Worker(multiprocessing.Process):
         self.job_queue = job_queue
         self.result_queue = result_queue
 
+        # The shared memory segments created by the worker are owned by the
+        # master process, which releases them
+        self.owner = os.getpid()
+
         # Module management
         self.lastmodule = None
         self.lastfunction = None
@@ -131,6 +138,17 @@ class Worker(multiprocessing.Process):
             self.logger.error("Processing function failed (Error: %s)", e, exc_info=True)
             return (None, None, None)
 
+    def close_module(self):
+        """ Call the close() method of the class instance created by
+        load_module(), if any, so that it can release its resources.
+        """
+        if self.coreclass is not None and hasattr(self.coreclass, 'close'):
+            try:
+                self.coreclass.close()
+            except Exception as e:
+                self.logger.error("Error closing processing class (Error: %s)", e, exc_info=True)
+        self.coreclass = None
+
     def run(self):
         """ Worker entry point
         Cycle indefinitely waiting for jobs on the job queue. The worker will
@@ -141,7 +159,9 @@ class Worker(multiprocessing.Process):
             try:
                 # Get a job from the queue
                 # A job is a tuple with the following format:
-                # (0:job ID, 1:filename, 2:module, 3:function, 4:parameters)
+                # (0:job ID, 1:filename, 2:module, 3:function, 4:parameters,
+                #  5:optional flag to pass large arrays of the result
+                #  through shared memory)
                 job = self.job_queue.get(timeout=0.2)
 
                 # When we receive a tuple where the job ID is None we terminate
@@ -157,6 +177,7 @@ class Worker(multiprocessing.Process):
                 break
 
             if job[2] != self.lastmodule or job[3] != self.lastfunction:
+                self.close_module()
                 (self.coremodule, self.corefunction, self.coreclass) = self.load_module(job[2], job[3])
                 if self.corefunction == None:
                     self.logger.error("Cannot find processing function '%s'", job[3])
@@ -169,12 +190,27 @@ class Worker(multiprocessing.Process):
                     self.lastmodule = job[2]
                     self.lastfunction = job[3]
 
+            shared = len(job) > 5 and job[5]
             try:
                 retval = False
+                # Map results of other workers passed through shared memory.
+                # Once mapped the segment is not needed anymore.
+                arg = SharedMemory.decode(job[1])
+                SharedMemory.release(job[1])
                 if job[4] != '':
-                    retval = self.corefunction(job[1], job[4])
+                    retval = self.corefunction(arg, job[4])
                 else:
-                    retval = self.corefunction(job[1])
+                    retval = self.corefunction(arg)
+                del arg
+                if isinstance(retval, types.GeneratorType):
+                    # Each item of a generator is sent as a partial result.
+                    # The end of the job is marked by a final False result.
+                    for part in retval:
+                        if self.result_queue:
+                            self.result_queue.put((job[0], SharedMemory.encode(part, self.owner) if shared else part, True))
+                    retval = False
+                elif shared:
+                    retval = SharedMemory.encode(retval, self.owner)
             except Exception as e:
                 self.logger.error("Processing function failed (Error: %s)", e, exc_info=True)
                 if self.result_queue:
@@ -184,6 +220,7 @@ class Worker(multiprocessing.Process):
                 if self.result_queue:
                     self.result_queue.put((job[0], retval))
 
+        self.close_module()
         self.logger.info("Terminating worker.")
 
 
@@ -208,6 +245,9 @@ class WorkSpawnerServer(threading.Thread):
         self.num_processes = 2  # Parallel
         self.maxjobs = 6
 
+        # Pass results to post-processing through shared memory
+        self.shared_results = True
+
         # Init logging server
         try:
             self.log_server = LoggerServer('WorkSpawner', LOG_LEVEL, LOG_FILE)
@@ -258,6 +298,7 @@ class WorkSpawnerServer(threading.Thread):
 
         # Workers stuff
         job_id = 0
+        post_id = 0
         worker_list = []
         self.job_queue = multiprocessing.Queue()
         self.result_queue = multiprocessing.Queue()
@@ -268,6 +309,16 @@ class WorkSpawnerServer(threading.Thread):
         self.post_jobs = multiprocessing.Queue()
         self.post_results = multiprocessing.Queue()
         self.pending_post = []
+        # Job ID of each post-processing job, as a job may produce several
+        # partial results
+        self.post_jobids = {}
+        # Shared memory segments of the results in post-processing
+        self.pending_segments = {}
+
+        # Remove shared memory segments left by previous runs
+        n = SharedMemory.cleanup()
+        if n > 0:
+            self.logger.warning("[multProcessSrv] Removed %d stale shared memory segments.", n)
 
         # Start worker processes
         try:
@@ -317,7 +368,9 @@ class WorkSpawnerServer(threading.Thread):
 
                 self.logger.debug("[multProcessSrv] Job meta info: %s", jobinfo)
 
-                self.job_queue.put((job_id,) + jobinfo)
+                # Use shared memory only if the result will be post-processed
+                shared = self.shared_results and all(self.defaultpostmetainfo[0:2]) and post_worker is not None
+                self.job_queue.put((job_id,) + jobinfo + (shared, ))
                 self.pending_jobs.append(job_id)
                 job_id += 1
 
@@ -360,6 +413,12 @@ class WorkSpawnerServer(threading.Thread):
                 elif not post_worker.is_alive():
                     try:
                         post_worker.join()
+                        # The jobs still queued are processed by the new
+                        # worker. Forget the segments that the dead worker
+                        # had already released.
+                        for (pid, result) in self.pending_segments.items():
+                            if not os.path.exists(result.segment):
+                                del self.pending_segments[pid]
                         post_worker = self.start_worker(self.post_jobs, self.post_results)
                         self.logger.info("[multProcessSrv] respawned post-processing thread.")
                     except Exception as e:
@@ -374,11 +433,11 @@ class WorkSpawnerServer(threading.Thread):
                 except:
                     pass
                 else:
-                    try:
-                        while True:
-                            self.post_jobs.get()
-                    except Queue.Empty:
-                        pass
+                    # Drop the queued jobs and their shared memory segments
+                    self._drain(self.post_jobs)
+                    for result in self.pending_segments.values():
+                        SharedMemory.release(result)
+                    self.pending_segments = {}
                     self.logger.info("[multProcessSrv] terminated post-processing thread")
                     post_worker = None
 
@@ -386,22 +445,32 @@ class WorkSpawnerServer(threading.Thread):
             while True:
                 try:
                     result = self.result_queue.get(timeout=0.2)
-                    self.logger.info("[multProcessSrv] Job with ID '%d' returned", result[0])
+                    if len(result) > 2 and result[2]:
+                        # Partial result, the job is still running
+                        self.logger.debug("[multProcessSrv] Job with ID '%d' returned a partial result", result[0])
+                    else:
+                        self.logger.info("[multProcessSrv] Job with ID '%d' returned", result[0])
 
-                    matches = [i for i, jid in enumerate(self.pending_jobs) if jid == result[0]]
-                    if len(matches) == 0:
-                        self.logger.error("[multProcessSrv] Got result from unexpected job with ID %d", result[0])
-                    elif len(matches) > 1:
-                        self.logger.error("[multProcessSrv] Got multiple matches (%d) for job with ID %d", len(matches), result[0])
-                    for m in matches:
-                        del self.pending_jobs[m]
+                        matches = [i for i, jid in enumerate(self.pending_jobs) if jid == result[0]]
+                        if len(matches) == 0:
+                            self.logger.error("[multProcessSrv] Got result from unexpected job with ID %d", result[0])
+                        elif len(matches) > 1:
+                            self.logger.error("[multProcessSrv] Got multiple matches (%d) for job with ID %d", len(matches), result[0])
+                        for m in matches:
+                            del self.pending_jobs[m]
 
                     # Pass return value to post-processing
                     if all(self.defaultpostmetainfo[0:2]) and post_worker:
                         # Submit result to post-processing worker
                         if result[1] != False:
-                            self.post_jobs.put((result[0], result[1], self.defaultpostmetainfo[0], self.defaultpostmetainfo[1], self.defaultpostmetainfo[2]))
-                            self.pending_post.append(result[0])
+                            self.post_jobs.put((post_id, result[1], self.defaultpostmetainfo[0], self.defaultpostmetainfo[1], self.defaultpostmetainfo[2]))
+                            self.pending_post.append(post_id)
+                            self.post_jobids[post_id] = result[0]
+                            if isinstance(result[1], SharedMemory.SharedResult):
+                                self.pending_segments[post_id] = result[1]
+                            post_id += 1
+                    else:
+                        SharedMemory.release(result[1])
 
                 except Queue.Empty:
                     break
@@ -412,19 +481,23 @@ class WorkSpawnerServer(threading.Thread):
             while True:
                 try:
                     result = self.post_results.get(timeout=0.1)
+                    jid = self.post_jobids.pop(result[0], result[0])
                     if result[1] == True:
-                        self.logger.info("[multProcessSrv] Post-processing of job with ID '%d' completed successfully", result[0])
+                        self.logger.info("[multProcessSrv] Post-processing of job with ID '%d' completed successfully", jid)
                     else:
-                        self.logger.info("[multProcessSrv] Post-processing of job with ID '%d' completed with errors", result[0])
+                        self.logger.info("[multProcessSrv] Post-processing of job with ID '%d' completed with errors", jid)
 
-                    matches = [i for i, jid in enumerate(self.pending_post) if jid == result[0]]
+                    matches = [i for i, pid in enumerate(self.pending_post) if pid == result[0]]
                     if len(matches) == 0:
-                        self.logger.error("[multProcessSrv] Got post-processing result from unexpected job with ID %d", result[0])
+                        self.logger.error("[multProcessSrv] Got post-processing result from unexpected job with ID %d", jid)
                     elif len(matches) > 1:
-                        self.logger.error("[multProcessSrv] Got multiple matches (%d) for post-processing of job with ID %d", len(matches), result[0])
+                        self.logger.error("[multProcessSrv] Got multiple matches (%d) for post-processing of job with ID %d", len(matches), jid)
                     for m in matches:
                         del self.pending_post[m]
 
+                    # The post-processing worker has already mapped the result
+                    SharedMemory.release(self.pending_segments.pop(result[0], None))
+
                 except Queue.Empty:
                     break
                 except Exception as e:
@@ -441,6 +514,25 @@ class WorkSpawnerServer(threading.Thread):
             self.post_jobs.put((None, ))
             post_worker.join()
 
+        # Remove the shared memory segments of the results not processed
+        self._drain(self.result_queue)
+        self._drain(self.post_jobs)
+        for result in self.pending_segments.values():
+            SharedMemory.release(result)
+        self.pending_segments = {}
+
+    def _drain(self, queue):
+        """ Empty a result or job queue, removing the shared memory segments
+        of the results in it.
+        """
+        while True:
+            try:
+                item = queue.get(timeout=0.1)
+            except Queue.Empty:
+                break
+            if len(item) > 1:
+                SharedMemory.release(item[1])
+
     def run(self):
         """ WorkSpawner server entry point
         """
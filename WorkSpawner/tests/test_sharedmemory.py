@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+""" Tests of the shared memory transfer of results. """
+
+import os
+import sys
+import cPickle
+import unittest
+import multiprocessing
+import numpy as np
+
+# The WorkSpawner modules use implicit relative imports
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import SharedMemory
+
+
+def _child(queue, out):
+    """ Decode a result in another process. """
+    data = SharedMemory.decode(queue.get())
+    out.put((float(data['img'].sum()), data['img'] is data['alias'], data['small'].tolist()))
+
+
+class TestSharedMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {
+            'img': np.arange(100000, dtype=np.float64).reshape(10, 100, 100),
+            'fortran': np.asfortranarray(np.random.rand(200, 100)),
+            'small': np.arange(5),
+            'n': 3,
+        }
+        self.data['alias'] = self.data['img']
+        self.results = []
+
+    def tearDown(self):
+        for r in self.results:
+            SharedMemory.release(r)
+
+    def encode(self, obj):
+        r = SharedMemory.encode(obj)
+        self.results.append(r)
+        return r
+
+    def test_roundtrip(self):
+        r = self.encode(self.data)
+        self.assertIsInstance(r, SharedMemory.SharedResult)
+        # Only the descriptors go through the queues
+        self.assertLess(len(cPickle.dumps(r, cPickle.HIGHEST_PROTOCOL)), 2048)
+        self.assertEqual(len(r.layout), 2)
+
+        d = SharedMemory.decode(r)
+        np.testing.assert_array_equal(d['img'], self.data['img'])
+        np.testing.assert_array_equal(d['fortran'], self.data['fortran'])
+        np.testing.assert_array_equal(d['small'], self.data['small'])
+        self.assertIs(d['img'], d['alias'])
+        self.assertEqual(d['n'], 3)
+
+    def test_copy_on_write(self):
+        r = self.encode(self.data)
+        d = SharedMemory.decode(r)
+        d['img'][0, 0, 0] = -1
+        self.assertEqual(SharedMemory.decode(r)['img'][0, 0, 0], 0)
+
+    def test_small(self):
+        obj = {'a': np.arange(10), 'b': 'text'}
+        self.assertIs(SharedMemory.encode(obj), obj)
+        self.assertIs(SharedMemory.decode(obj), obj)
+
+    def test_release(self):
+        r = self.encode(self.data)
+        d = SharedMemory.decode(r)
+        SharedMemory.release(r)
+        self.assertFalse(os.path.exists(r.segment))
+        # Mapped arrays stay valid
+        np.testing.assert_array_equal(d['img'], self.data['img'])
+        # Releasing twice is harmless
+        SharedMemory.release(r)
+
+    def test_process(self):
+        r = self.encode(self.data)
+        (q, out) = (multiprocessing.Queue(), multiprocessing.Queue())
+        p = multiprocessing.Process(target=_child, args=(q, out))
+        p.start()
+        q.put(r)
+        res = out.get(timeout=10)
+        p.join()
+        self.assertEqual(res, (float(self.data['img'].sum()), True, [0, 1, 2, 3, 4]))
+
+    def test_cleanup(self):
+        # A segment owned by a process that is not running anymore
+        p = multiprocessing.Process(target=int)
+        p.start()
+        p.join()
+        stale = SharedMemory.encode(self.data, p.pid)
+        live = self.encode(self.data)
+        self.results.append(stale)
+        SharedMemory.cleanup()
+        self.assertFalse(os.path.exists(stale.segment))
+        self.assertTrue(os.path.exists(live.segment))
+
+
+if __name__ == '__main__':
+    unittest.main()